@@ -1,5 +1,4 @@
 import numpy as np
-import numbers
 from TimeSeries import TimeSeries
 # from MS1.TimeSeries import TimeSeries
 
@@ -10,10 +9,15 @@ class ArrayTimeSeries(TimeSeries):
     list. There cannot be duplicate times as there should only be one value recorded at each time.
     
     RepInv: Times and values must only include numbers, and must be same length.
+
+    The series is columnar: it only holds one pair of contiguous float64 arrays, sorted by time, and the
+    index from times to positions is only built the first time a value is looked up by time.
     """
+    __slots__ = ()
+
     def __init__(self, times, values):
         """
-        Extends from TimeSeries to represent data internally with a numpy array.
+        Validates like TimeSeries, but represents data internally with numpy arrays only.
         NOTE: The times and values arguments are flipped order from the superclass TimeSeries.
         
         >>> t = [1.5, 2, 2.5, 3, 10.5]
@@ -22,38 +26,26 @@ class ArrayTimeSeries(TimeSeries):
         >>> z[3]
         1.5
         """
-        TimeSeries.__init__(self, values=values, times=times)
-        times, values = (list(x) for x in zip(*sorted(zip(times, values), key=lambda pair: pair[0])))
-        # Represent data now as numpy array
-        self.__timesseq = np.array(times, dtype=float)
-        self.__valuesseq = np.array(values, dtype=float)
-        self.__times_to_index = {t: i for i, t in enumerate(times)}
+        if (len(values) == 0):
+            raise ValueError('Empty values passed in')
 
-    # Override
-    @property
-    def timesseq(self):
-        """
-        Returns numpy array of times
-        """
-        return self.__timesseq
+        self.repOK(times, values)
 
-    # Override
-    @property
-    def valuesseq(self):
-        """
-        Returns numpy array of values
-        """
-        return self.__valuesseq
+        times = np.array(times, dtype=float)
+        values = np.array(values, dtype=float)
+        order = np.argsort(times, kind='mergesort')
+        times = times[order]
+        # Read-only, as results of arithmetic share the times with their operands
+        times.flags.writeable = False
+        self._setSorted(times, values[order])
 
-    # Override
-    @property
-    def times_to_index(self):
+    # Override to key the index with floats rather than numpy scalars
+    def _timesList(self):
         """
-        map time index with integer index of the array
-        Private property - can't be called directly
+        Private helper function that returns the times as a list of floats.
         """
-        return self.__times_to_index
-    
+        return self.timesseq.tolist()
+
     # Override to return items as a numpy array, as times and values are already returned as numpy arrays
     def items(self):
         """
@@ -79,104 +71,23 @@ class ArrayTimeSeries(TimeSeries):
                [  2.5,   0.5],
                [ 10. ,   0. ]])
         """
-        self.repOK(self.timesseq, self.valuesseq)
+        if self.DEBUG:
+            self.repOK(self.timesseq, self.valuesseq)
         return np.asarray(list(zip(self.timesseq, self.valuesseq)))
     
-    # Override to return an ArrayTimeSeries
-    def __add__(self, other):
-        """
-        Adds the values of the two TimeSeries and returns a new ArrayTimeSeries.
-    
-        Parameters
-        ----------
-        other: Another TimeSeries/ArrayTimeSeries object
-
-        Returns
-        -------
-        A new ArrayTimeSeries with the summed values of the two provided TimeSeries.
-
-        Notes
-        -----
-        PRE: 
-            - The times sequence of the other TimeSeries must be identical to the first one, if not ValueError is thrown
-            
-        >>> t = [3., 1., 2.]
-        >>> v = [4., 5., 6.]
-        >>> z = ArrayTimeSeries(t, v)
-        >>> t2 = [3., 2., 1.]
-        >>> v2 = [4., 6., 5.]
-        >>> z2 = ArrayTimeSeries(t2, v2)
-        >>> z2 + z
-        ArrayTimeSeries([(1.0, 10.0), (2.0, 12.0), (3.0, 8.0)])
+    # Override to keep the values as a numpy array
+    def _valuesFromArray(self, values):
         """
-        other_values, self_values, self_times = self._valuesSortedByTime(other)
-        if isinstance(other, numbers.Real):
-            return ArrayTimeSeries(self_times, [self_values[i] + other for i in range(0, len(self_values))])    
-        return ArrayTimeSeries(self_times, [self_values[i] + other_values[i] for i in range(0, len(self_values))])
-    
-    # Override to return an ArrayTimeSeries
-    def __sub__(self, other):
+        Private helper function that returns the numpy array of values as it is.
         """
-        Subtract the values of the other TimeSeries fom self, and returns a new ArrayTimeSeries.
-    
-        Parameters
-        ----------
-        other: Another TimeSeries object
+        return values
 
-        Returns
-        -------
-        A new ArrayTimeSeries with subtracted values of other from self (self - other)
-
-        Notes
-        -----
-        PRE: 
-            - The times sequence of the other TimeSeries must be identical to the first one, if not ValueError is thrown
-            
-        >>> t = [3., 1., 2.]
-        >>> v = [4., 5., 6.]
-        >>> z = ArrayTimeSeries(t, v)
-        >>> t2 = [3., 2., 1.]
-        >>> v2 = [4., 6., 5.]
-        >>> z2 = ArrayTimeSeries(t2, v2)
-        >>> z2 - z
-        ArrayTimeSeries([(1.0, 0.0), (2.0, 0.0), (3.0, 0.0)])
-        """
-        other_values, self_values, self_times = self._valuesSortedByTime(other)
-        if isinstance(other, numbers.Real):
-            return ArrayTimeSeries(self_times, [self_values[i] - other for i in range(0, len(self_values))]) 
-        return ArrayTimeSeries(self_times, [self_values[i] - other_values[i] for i in range(0, len(self_values))])
-    
-    # Override to return an ArrayTimeSeries
-    def __mul__(self, other):
+    # Override as the values already are a float64 array
+    def _valuesArray(self):
         """
-        Multiplies the values of the two TimeSeries and returns a new ArrayTimeSeries.
-    
-        Parameters
-        ----------
-        other: Another TimeSeries object
-
-        Returns
-        -------
-        A new ArrayTimeSeries with the multiplied values from both TimeSeries
-
-        Notes
-        -----
-        PRE: 
-            - The times sequence of the other TimeSeries must be identical to the first one, if not ValueError is thrown
-            
-        >>> t = [3., 1., 2.]
-        >>> v = [4., 5., 6.]
-        >>> z = ArrayTimeSeries(t, v)
-        >>> t2 = [3., 2., 1.]
-        >>> v2 = [4., 6., 5.]
-        >>> z2 = ArrayTimeSeries(t2, v2)
-        >>> z2 * z
-        ArrayTimeSeries([(1.0, 25.0), (2.0, 36.0), (3.0, 16.0)])
+        Private helper function that returns the values as a float64 numpy array, without copying them.
         """
-        other_values, self_values, self_times = self._valuesSortedByTime(other)
-        if isinstance(other, numbers.Real):
-            return ArrayTimeSeries(self_times, [self_values[i] * other for i in range(0, len(self_values))]) 
-        return ArrayTimeSeries(self_times, [self_values[i] * other_values[i] for i in range(0, len(self_values))])
+        return self.valuesseq
 
     # Override to return ArrayTimeSeries
     def interpolate(self, tseq):
@@ -197,8 +108,7 @@ class ArrayTimeSeries(TimeSeries):
         >>> a = TimeSeries([1, 2, 3],[0, 5, 10])
         >>> b = TimeSeries([100, -100],[2.5, 7.5])
         >>> a.interpolate([-100, 100])
-        TimeSeries([(-100, 1), (100, 3)])
+        TimeSeries([(-100, 1.0), (100, 3.0)])
         """
-        valseq = [self._get_interpolated(t, self.timesseq) for t in tseq]
-        return ArrayTimeSeries(times=tseq, values=valseq)
+        return ArrayTimeSeries(times=tseq, values=self._interpolatedValues(tseq))
     
\ No newline at end of file
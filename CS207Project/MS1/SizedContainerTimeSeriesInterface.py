@@ -7,6 +7,8 @@ class SizedContainerTimeSeriesInterface(TimeSeriesInterface):
     This is the interface for container based Time Series. This extends from the more general 
     TimeSeriesInterface. The clients for this interface are the classes TimeSeries and ArrayTimeSeries.
     """
+    __slots__ = ()
+
     @abc.abstractmethod
     def times(self):
         '''
@@ -15,7 +15,14 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 	
 	RepInv: Times and values must only include numbers, and must be same length, if times is included. There 
 	cannot be duplicate times.
+
+	The invariant is checked once in the constructor, and __setitem__ only checks the value it writes, so
+	accessors run in O(1). Set DEBUG to True (on TimeSeries or a subclass) to re-check the whole invariant
+	on every access, which is O(n) per call.
 	"""
+	DEBUG = False
+	__slots__ = ('__isTimeNone', '__timesseq', '__valuesseq', '__times_to_index')
+
 	def __init__(self, values, times=None):
 		"""
 		Initializes a TimeSeries instance with value list and optional times list
@@ -44,17 +51,21 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		
 		# Sort times and values in ascending order of time - It's just neater that way
 		if times is not None:
-			self.__isTimeNone = False
 			times, values = (list(x) for x in zip(*sorted(zip(times, values), key=lambda pair: pair[0])))
-			self.__timesseq = list(times)
-			self.__valuesseq = list(values)
-			self.__times_to_index = {t: i for i, t in enumerate(times)}
+			self._setSorted(times, values)
 		else:
-			self.__isTimeNone = True
-			self.__timesseq = None
-			self.__valuesseq = list(values)
-			self.__times_to_index = None
-		
+			self._setSorted(None, list(values))
+
+	def _setSorted(self, times, values):
+		"""
+		Private helper function that stores already validated times and values, sorted by time.
+		times is None when the times are not provided. The index from times to positions is built lazily.
+		"""
+		self.__isTimeNone = times is None
+		self.__timesseq = times
+		self.__valuesseq = values
+		self.__times_to_index = None
+
 	def repOK(self, times, values):
 		if times is None:
 			assert self._hasOnlyNumbers(values), "Values should only include numbers"
@@ -160,10 +171,18 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 	@property
 	def times_to_index(self):
 		"""
-		map time index with integer index of the array
+		map time index with integer index of the array, built on first use
 		Priviate property - can't be called directly
 		"""
+		if self.__times_to_index is None and not self.__isTimeNone:
+			self.__times_to_index = {t: i for i, t in enumerate(self._timesList())}
 		return self.__times_to_index
+
+	def _timesList(self):
+		"""
+		Private helper function that returns the times as a list, to key the index from times to positions.
+		"""
+		return self.timesseq
 	
 	def times(self):
 		"""
@@ -187,8 +206,15 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> a = TimeSeries(v, t)
 		>>> a.times()
 		[1, 1.5, 2, 2.5, 10]
+		>>> a.times()[0] = 99
+		>>> a[1]
+		0
 		"""
-		return self.timesseq
+		if self.timesseq is None:
+			return None
+		# The times are shared with the results of arithmetic, so a list is copied. The times of an
+		# ArrayTimeSeries are read-only, so a view of them is returned.
+		return self.timesseq[:]
 
 	def values(self):
 		"""
@@ -235,7 +261,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> a.items()
 		[(1, 0), (1.5, 2), (2, -1), (2.5, 0.5), (10, 0)]
 		"""
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		if self.__isTimeNone:
 			return [(i, x) for i, x in enumerate(self.valuesseq)]
 		else:
@@ -259,7 +286,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> len(a)
 		5
 		"""
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		return len(self.valuesseq)
 
 	def __getitem__(self, time):
@@ -286,7 +314,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> a[2.5]
 		0
 		"""
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		
 		if self.__isTimeNone:
 			if time >= len(self):
@@ -342,8 +371,10 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 				raise IndexError('Time does not exist.')
 			else:
 				indexToInsert = self.times_to_index[time]
+		assert self._hasOnlyNumbers([value]), "Values should only include numbers"
 		self.valuesseq[indexToInsert] = value
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		
 	def __iter__(self):
 		"""
@@ -368,7 +399,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		0.5
 		0
 		"""
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		for v in self.valuesseq:
 			yield v
 
@@ -395,7 +427,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		2.5
 		10
 		"""
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		if self.__isTimeNone:
 			yield None
 		else:
@@ -425,7 +458,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		0.5
 		0
 		"""        
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		for v in self.valuesseq:
 			yield v
 
@@ -452,7 +486,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		(2.5, 0.5)
 		(10, 0)
 		"""        
-		self.repOK(self.timesseq, self.valuesseq)
+		if self.DEBUG:
+			self.repOK(self.timesseq, self.valuesseq)
 		dictOfItems = {}
 		if self.__isTimeNone:
 			dictOfItems = [(i, x) for i, x in enumerate(self.valuesseq)]
@@ -583,25 +618,53 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		"""
 		return self
 	
-	def _valuesSortedByTime(self, other):
+	def _withValues(self, values):
+		"""
+		Private fast constructor used by the arithmetic operators. Returns a new time series of the same class
+		with self's times and the given values, which must be in self's (sorted by time) order.
+		Nothing is validated or sorted: the times, and the index from times to positions, are shared with self,
+		which is safe as times never change after construction: times() hands out a copy of a list, and the times
+		of an ArrayTimeSeries are read-only.
+		"""
+		new = self.__class__.__new__(self.__class__)
+		new.__isTimeNone = self.__isTimeNone
+		new.__timesseq = self.__timesseq
+		new.__valuesseq = new._valuesFromArray(values)
+		new.__times_to_index = self.__times_to_index
+		return new
+
+	def _valuesFromArray(self, values):
+		"""
+		Private helper function that turns a numpy array of values into the sequence this class stores.
+		"""
+		return values.tolist()
+
+	def _valuesArray(self):
+		"""
+		Private helper function that returns the values, in time order, as a float64 numpy array.
+		"""
+		return np.asarray(self.valuesseq, dtype=float)
+
+	def _alignedValues(self, other):
 		"""
-		Private helper function that returns the values sequence of the other TimeSeries, followed by self's 
-		values sequence.
+		Private helper function that returns self's values as a float64 array, followed by other's values
+		as a float64 array in the same time order, or other itself when it is a constant.
+		Times are sorted at construction, so checking that two time series line up is a single comparison.
 		
 		Raises a NotImplementedError when the other object is not a TimeSeries.
 		Raises a ValueError when the time sequence of both TimeSeries are not identical.
 		"""
 		if isinstance(other, numbers.Real): # Adding a constant
-			self_times, self_values = (list(x) for x in zip(*sorted(zip(self.itertimes(), self.itervalues()), key=lambda pair: pair[0])))
-			return other, self_values, self_times
+			return self._valuesArray(), other
 		if not isinstance(other, TimeSeries): # Not adding a constant or a TimeSeries, throws error
 			raise NotImplementedError('Unable to compare TimeSeries with a non-TimeSeries class')
-		# Sort both sequences based on time
-		other_times, other_values = (list(x) for x in zip(*sorted(zip(other.itertimes(), other.itervalues()), key=lambda pair: pair[0])))
-		self_times, self_values = (list(x) for x in zip(*sorted(zip(self.itertimes(), self.itervalues()), key=lambda pair: pair[0])))
-		if (other_times != self_times):
+		if self.__isTimeNone != other.__isTimeNone or len(self.valuesseq) != len(other.valuesseq):
 			raise ValueError('Time sequence of both TimeSeries must be identical, i.e. same length and same times')
-		return other_values, self_values, self_times
+		# Results of arithmetic share their times with their operands, so most checks stop at the identity test
+		if not self.__isTimeNone and self.timesseq is not other.timesseq:
+			if not np.array_equal(np.asarray(self.timesseq, dtype=float), np.asarray(other.timesseq, dtype=float)):
+				raise ValueError('Time sequence of both TimeSeries must be identical, i.e. same length and same times')
+		return self._valuesArray(), other._valuesArray()
 	
 	def __eq__(self, other):
 		"""
@@ -637,12 +700,12 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> z2 == z
 		False
 		"""
-		other_values, self_values, _ = self._valuesSortedByTime(other)
-		if isinstance(other, numbers.Real):
+		if not isinstance(other, TimeSeries) or isinstance(other, numbers.Real):
 			raise NotImplementedError('Unable to compare TimeSeries with a non-TimeSeries class')
-		if self.__isTimeNone:
-			return self.values() == other.values()
-		return other_values == self_values
+		if self.__isTimeNone and other.__isTimeNone:
+			return list(self.values()) == list(other.values())
+		self_values, other_values = self._alignedValues(other)
+		return bool(np.array_equal(self_values, other_values))
 	
 	def __add__(self, other):
 		"""
@@ -674,16 +737,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> z2 + z
 		TimeSeries([(0, 103.0), (1, 11.0), (2, 11.0)])
 		"""
-		other_values, self_values, self_times = self._valuesSortedByTime(other)
-		if self.__isTimeNone:
-			if isinstance(other, numbers.Real):
-				return TimeSeries([self.values()[i] + other for i in range(0, len(self.values()))])
-			else:
-				return TimeSeries([self.values()[i] + other.values()[i] for i in range(0, len(self.values()))])
-		if isinstance(other, numbers.Real):
-			return TimeSeries([self_values[i] + other for i in range(0, len(self_values))], self_times)
-		else:
-			return TimeSeries([self_values[i] + other_values[i] for i in range(0, len(self_values))], self_times)
+		self_values, other_values = self._alignedValues(other)
+		return self._withValues(np.add(self_values, other_values))
 	
 	def __sub__(self, other):
 		"""
@@ -715,16 +770,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> z2 - z
 		TimeSeries([(0, 95.0), (1, 1.0), (2, -1.0)])
 		"""
-		other_values, self_values, self_times = self._valuesSortedByTime(other)
-		if self.__isTimeNone:
-			if isinstance(other, numbers.Real):
-				return TimeSeries([self.values()[i] - other for i in range(0, len(self.values()))])
-			else:
-				return TimeSeries([self.values()[i] - other.values()[i] for i in range(0, len(self.values()))])
-		if isinstance(other, numbers.Real):
-			return TimeSeries([self_values[i] - other for i in range(0, len(self_values))], self_times)
-		else:
-			return TimeSeries([self_values[i] - other_values[i] for i in range(0, len(self_values))], self_times)
+		self_values, other_values = self._alignedValues(other)
+		return self._withValues(np.subtract(self_values, other_values))
 	
 	def __mul__(self, other):
 		"""
@@ -756,16 +803,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> z2 * z
 		TimeSeries([(0, 396.0), (1, 30.0), (2, 30.0)])
 		"""
-		other_values, self_values, self_times = self._valuesSortedByTime(other)
-		if self.__isTimeNone:
-			if isinstance(other, numbers.Real):
-				return TimeSeries([self.values()[i] * other for i in range(0, len(self.values()))])
-			else:
-				return TimeSeries([self.values()[i] * other.values()[i] for i in range(0, len(self.values()))])
-		if isinstance(other, numbers.Real):
-			return TimeSeries([self_values[i] * other for i in range(0, len(self_values))], self_times)
-		else:
-			return TimeSeries([self_values[i] * other_values[i] for i in range(0, len(self_values))], self_times)
+		self_values, other_values = self._alignedValues(other)
+		return self._withValues(np.multiply(self_values, other_values))
 	
 	
 	def _get_interpolated(self, tval, timesToUse):
@@ -786,22 +825,8 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		-------
 		float
 		Either the actual or interpolated value associated with the time
-
-	
 		"""
-		for i in range(len(self)-1):
-			# tval less than smallest time
-			if tval <= timesToUse[i]:
-				return self[timesToUse[i]]
-			# tval within range of time series times
-			if (tval > timesToUse[i]) & (tval < timesToUse[i+1]):
-				# calculate interpolated value
-				time_delta = timesToUse[i+1] - timesToUse[i]
-				step = (tval - timesToUse[i]) / time_delta
-				v_delta = self.valuesseq[i+1] - self.valuesseq[i]
-				return v_delta * step + self.valuesseq[i]
-		# tval above range of time series times
-		return self[timesToUse[len(self)-1]]
+		return float(np.interp(tval, np.asarray(timesToUse, dtype=float), self._valuesArray()))
 	
 	
 	def interpolate(self, tseq):
@@ -827,11 +852,29 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		>>> a.interpolate([1])
 		TimeSeries([(1, 1.2)])
 		>>> a.interpolate([-100, 100])
-		TimeSeries([(-100, 1), (100, 3)])
+		TimeSeries([(-100, 1.0), (100, 3.0)])
 		"""
-		timesToUse = range(len(self)) if self.__isTimeNone else self.timesseq
-		valseq = [self._get_interpolated(t, timesToUse) for t in tseq]
-		return TimeSeries(values =valseq , times=tseq)
+		return TimeSeries(values=self._interpolatedValues(tseq).tolist(), times=tseq)
+
+	def _interpolatedValues(self, tseq):
+		"""
+		Private helper function that returns the interpolated values at the times in tseq as a float64 numpy
+		array. Each time is located with a binary search, so resampling n points onto m times is O(m log n).
+		Times beyond the bounds get the value at the boundary.
+
+		>>> TimeSeries([1, 2, 3],[0, 5, 10])._interpolatedValues([-1, 2.5, 7.5, 11])
+		array([1. , 1.5, 2.5, 3. ])
+		"""
+		return np.interp(np.asarray(tseq, dtype=float), self._timesArray(), self._valuesArray())
+
+	def _timesArray(self):
+		"""
+		Private helper function that returns the times as a float64 numpy array. Indexes stand in for
+		the times when they are not provided.
+		"""
+		if self.__isTimeNone:
+			return np.arange(len(self), dtype=float)
+		return np.asarray(self.timesseq, dtype=float)
 	
 	def __contains__(self, value):
 		"""
@@ -872,3 +915,29 @@ class TimeSeries(SizedContainerTimeSeriesInterface):
 		#print(t2)
 		return len(t1) == len(t2)
 	    
+
+def interpolate_many(series, tseq):
+	"""
+	Resamples many time series onto the same times.
+
+	Parameters
+	----------
+	series : sequence of TimeSeries
+	tseq : list of ints or floats
+		Times to interpolate every series at
+
+	Returns
+	-------
+	numpy array of shape (len(series), len(tseq)), whose row i holds the interpolated values of series[i]
+
+	>>> a = TimeSeries([1, 2, 3],[0, 5, 10])
+	>>> b = TimeSeries([100, -100],[2.5, 7.5])
+	>>> interpolate_many([a, b], [0, 5, 10])
+	array([[   1.,    2.,    3.],
+	       [ 100.,    0., -100.]])
+	"""
+	tseq = np.asarray(tseq, dtype=float)
+	resampled = np.empty((len(series), len(tseq)))
+	for row, ts in zip(resampled, series):
+		row[:] = np.interp(tseq, ts._timesArray(), ts._valuesArray())
+	return resampled
@@ -4,6 +4,8 @@ class TimeSeriesInterface(abc.ABC):
     This is the interface for the Time Series. The clients for this interface will be sub-interfaces
     SizedContainerTimeSeriesInterface and StreamTimeSeriesInterface.
     """
+    __slots__ = ()
+
     @abc.abstractmethod
     def __iter__(self):
         """
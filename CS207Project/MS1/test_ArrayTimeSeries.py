@@ -51,6 +51,27 @@ class ArrayTimeSeriesTest(TimeSeriesTest):
 		_s1 = ArrayTimeSeries(values=[1,2,3], times=[0,5,10])
 		self.assertEqual(_s1 * 0, ArrayTimeSeries(values=[0,0,0], times=[0,5,10]))
 
+	def test_arithmetic_keepsArrays(self):
+		_s1 = ArrayTimeSeries(values=[1,2,3], times=[0,5,10])
+		result = _s1 * 2 + _s1
+		self.assertTrue(isinstance(result, ArrayTimeSeries))
+		self.assertTrue(isinstance(result.values(), np.ndarray))
+		self.assertEqual(result[5], 6.0)
+		self.assertEqual((_s1 + TimeSeries(values=[1,2,3], times=[0,5,10])).values().tolist(), [2, 4, 6])
+
+	def test_columnar(self):
+		self.assertFalse(hasattr(self.series, '__dict__'))
+		for arr in (self.series.times(), self.series.values()):
+			self.assertEqual(arr.dtype, np.float64)
+			self.assertTrue(arr.flags['C_CONTIGUOUS'])
+		self.assertEqual(self.series.times().tolist(), [1.5, 2, 2.5, 3, 10.5])
+
+	def test_times_to_index_lazy(self):
+		_series = ArrayTimeSeries(values=[1, 2, 3], times=[10, 0, 5])
+		self.assertEqual(_series[5], 3)
+		self.assertEqual(_series.times_to_index, {0.0: 0, 5.0: 1, 10.0: 2})
+		self.assertTrue(all(type(t) is float for t in _series.times_to_index))
+
 	def test_interpolate_single1(self):
 		a = ArrayTimeSeries(values=[1, 2, 3],times=[0, 5, 10])
 		b = ArrayTimeSeries(values=[100, -100],times=[2.5, 7.5])
@@ -1,6 +1,6 @@
 import unittest
 import numpy as np
-from TimeSeries import TimeSeries
+from TimeSeries import TimeSeries, interpolate_many
 from lazy import *
 
 # from MS1.TimeSeries import TimeSeries
@@ -126,6 +126,26 @@ class TimeSeriesTest(unittest.TestCase):
 		with self.assertRaises(IndexError):
 			_series[-1] = 0
 
+	def test_setitem_nonnumber(self):
+		_series = TimeSeries(values=[1, 3, 0, -1.5, -1], times=[1.5, 2, 2.5, 10.5, 3])
+		with self.assertRaises(AssertionError):
+			_series[3] = "hi"
+		self.assertEqual(_series[3], -1)
+
+	def test_debug_revalidates(self):
+		_series = TimeSeries(values=[1, 3, 0], times=[1, 2, 3])
+		# Break the invariant behind the accessors' back
+		_series.valuesseq.append(4)
+		self.assertEqual(_series[1], 1)
+		TimeSeries.DEBUG = True
+		try:
+			with self.assertRaises(AssertionError):
+				_series[1]
+			with self.assertRaises(AssertionError):
+				len(_series)
+		finally:
+			TimeSeries.DEBUG = False
+
 	'''__iter__, itertimes, itervalues, iteritems tests'''
 
 	def test_iter(self):
@@ -321,6 +341,38 @@ class TimeSeriesTest(unittest.TestCase):
 		_s1 = TimeSeries(values=[1,2,3])
 		self.assertEqual(_s1 * -10, TimeSeries(values=[-10,-20,-30]))
 
+	def test_add_sameLengthDifferentTimes(self):
+		_s1 = TimeSeries(values=[1,2,3], times=[0,5,10])
+		_s2 = TimeSeries(values=[1,2,3], times=[0,5,11])
+		with self.assertRaises(ValueError):
+			_s1 + _s2
+
+	def test_add_timeAndNoTime(self):
+		with self.assertRaises(ValueError):
+			TimeSeries(values=[1,2,3], times=[0,1,2]) + TimeSeries(values=[1,2,3])
+
+	def test_arithmetic_chain(self):
+		_s1 = TimeSeries(values=[3,1,2], times=[10,0,5])
+		result = (_s1 * 2 - _s1) + _s1
+		self.assertEqual(result.values(), [2.0, 4.0, 6.0])
+		self.assertEqual(result[10], 6.0)
+		self.assertTrue(type(result) is TimeSeries)
+		# Results share their (never changing) times with the operands
+		self.assertTrue(result.timesseq is _s1.timesseq)
+
+	def test_arithmetic_times_unchanged(self):
+		# Changing the times handed out by a result leaves the operand, and the result, as they were
+		_s1 = type(self.series)(values=[1,2,3], times=[1,2,3])
+		result = _s1 + _s1
+		try:
+			result.times()[0] = 99
+		except ValueError: # read-only times of an ArrayTimeSeries
+			pass
+		self.assertEqual(list(_s1.times()), [1, 2, 3])
+		self.assertEqual(list(result.times()), [1, 2, 3])
+		self.assertEqual(result[1], 2.0)
+		self.assertEqual(_s1[1], 1)
+
 	# Run the tests that check for bad conditions across different operators
 	
 	def test_nontimeseries(self):
@@ -362,6 +414,24 @@ class TimeSeriesTest(unittest.TestCase):
 		b = TimeSeries([100, -100],[2.5, 7.5])
 		self.assertEqual(a.interpolate([-100, 100]),TimeSeries([1,3],[-100,100]))
 
+	def test_interpolate_exacttimes(self):
+		self.assertEqual(self.series.interpolate([1.5, 3, 10.5]), TimeSeries([1, -1, -1.5], [1.5, 3, 10.5]))
+
+	def test_interpolate_without_time(self):
+		a = TimeSeries([1, 3, 5])
+		self.assertEqual(a.interpolate([0.5, 1.5, 7]), TimeSeries([2, 4, 5], [0.5, 1.5, 7]))
+
+	def test_interpolate_singleton(self):
+		self.assertEqual(self.singleseries.interpolate([-1, 5]), TimeSeries([1, 1], [-1, 5]))
+
+	def test_interpolate_many(self):
+		a = TimeSeries([1, 2, 3],[0, 5, 10])
+		b = TimeSeries([100, -100],[2.5, 7.5])
+		resampled = interpolate_many([a, b, self.series], [0, 2.5, 3])
+		self.assertEqual(resampled.shape, (3, 3))
+		np.testing.assert_allclose(resampled, [[1, 1.5, 1.6], [100, 100, 80], [1, 0, -1]])
+		np.testing.assert_array_equal(resampled[2], self.series.interpolate([0, 2.5, 3]).values())
+
 	def test_contains(self):
 		self.assertTrue(3 in self.series)
 
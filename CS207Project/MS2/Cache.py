@@ -0,0 +1,367 @@
+from collections import OrderedDict
+
+class LRUCache(object):
+	"""
+	Bounded least recently used cache with O(1) get and put.
+	Every entry carries a size, and the least recently used entries are evicted whenever the total size
+	of all entries goes over max_bytes. Hits, misses and evictions are counted so callers can see how
+	well the cache is doing.
+	"""
+
+	def __init__(self, max_bytes):
+		"""
+		Initializes an empty cache with a byte budget.
+
+		Parameters
+		----------
+		max_bytes: Int budget for the summed sizes of all entries. If set to 0, nothing is cached.
+
+		Returns
+		-------
+		None
+
+		>>> cache = LRUCache(max_bytes=100)
+		>>> len(cache)
+		0
+		"""
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._bytes = 0
+		self._entries = OrderedDict() # key to (value, size), ordered from least to most recently used
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __contains__(self, key):
+		"""
+		Returns True if key is cached. Does not count as a hit or a miss, and does not change recency.
+		"""
+		return key in self._entries
+
+	@property
+	def bytes(self):
+		"""
+		Summed size of all entries currently in the cache.
+		"""
+		return self._bytes
+
+	def get(self, key, default=None):
+		"""
+		Returns the value cached at key and marks it as the most recently used entry.
+
+		Parameters
+		----------
+		key: Any hashable key
+		default: Value to return when key is not cached
+
+		Returns
+		-------
+		Cached value, or default if key is not cached
+
+		>>> cache = LRUCache(max_bytes=100)
+		>>> cache.put('a', 1, 10)
+		>>> cache.get('a')
+		1
+		>>> cache.get('b') is None
+		True
+		>>> (cache.hits, cache.misses)
+		(1, 1)
+		"""
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return default
+		self.hits += 1
+		self._entries.move_to_end(key)
+		return entry[0]
+
+	def put(self, key, value, size=1):
+		"""
+		Caches value at key, evicting least recently used entries until the cache fits its budget.
+		Values larger than the whole budget are not cached.
+
+		Parameters
+		----------
+		key: Any hashable key
+		value: Value to cache
+		size: Int size of the entry, counted against max_bytes
+
+		Returns
+		-------
+		None
+
+		>>> cache = LRUCache(max_bytes=20)
+		>>> cache.put('a', 1, 10)
+		>>> cache.put('b', 2, 10)
+		>>> _ = cache.get('a')
+		>>> cache.put('c', 3, 10)
+		>>> sorted(cache._entries)
+		['a', 'c']
+		>>> cache.evictions
+		1
+		"""
+		if size > self.max_bytes:
+			return
+		if key in self._entries:
+			self._bytes -= self._entries.pop(key)[1]
+		self._entries[key] = (value, size)
+		self._bytes += size
+		while self._bytes > self.max_bytes:
+			_, (_, evicted_size) = self._entries.popitem(last=False)
+			self._bytes -= evicted_size
+			self.evictions += 1
+
+	def keys(self):
+		"""
+		Returns the cached keys, from the least to the most recently used.
+		"""
+		return list(self._entries)
+
+	def clear(self):
+		"""
+		Removes all entries. Counters are kept.
+		"""
+		self._entries.clear()
+		self._bytes = 0
+
+	def stats(self):
+		"""
+		Returns a dictionary with the hit, miss and eviction counters, and the current number of entries
+		and bytes in the cache.
+
+		>>> cache = LRUCache(max_bytes=100)
+		>>> cache.put('a', 1, 10)
+		>>> cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 1, 'bytes': 10}
+		True
+		"""
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'entries': len(self._entries),
+			'bytes': self._bytes,
+		}
+
+class _FrequencyBucket(object):
+	"""
+	Keys of an LFUCache that have been used the same number of times, ordered from least to most recently used.
+	Buckets form a circular doubly linked list in increasing order of frequency.
+	"""
+	__slots__ = ('frequency', 'keys', 'prev', 'next')
+
+	def __init__(self, frequency):
+		self.frequency = frequency
+		self.keys = OrderedDict()
+		self.prev = self
+		self.next = self
+
+class LFUCache(object):
+	"""
+	Bounded least frequently used cache with O(1) get and put.
+	Keys are kept in buckets of equal use counts, so the least frequently used entry is always the oldest key
+	of the first bucket, and a use moves a key to the next bucket. Ties are broken by recency.
+	Like LRUCache, entries carry a size that is counted against max_bytes, and counts are only kept for
+	cached keys, so the metadata never outgrows the cache.
+	"""
+
+	def __init__(self, max_bytes):
+		"""
+		Initializes an empty cache with a byte budget.
+
+		Parameters
+		----------
+		max_bytes: Int budget for the summed sizes of all entries. If set to 0, nothing is cached.
+
+		Returns
+		-------
+		None
+
+		>>> cache = LFUCache(max_bytes=100)
+		>>> len(cache)
+		0
+		"""
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._bytes = 0
+		self._entries = {} # key to [value, size, bucket]
+		self._head = _FrequencyBucket(0) # sentinel of the bucket list
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __contains__(self, key):
+		"""
+		Returns True if key is cached. Does not count as a hit or a miss, and does not count as a use.
+		"""
+		return key in self._entries
+
+	@property
+	def bytes(self):
+		"""
+		Summed size of all entries currently in the cache.
+		"""
+		return self._bytes
+
+	def _bucketAfter(self, bucket, frequency):
+		"""
+		Returns the bucket for frequency right after bucket, creating it if needed.
+		"""
+		following = bucket.next
+		if following is not self._head and following.frequency == frequency:
+			return following
+		new_bucket = _FrequencyBucket(frequency)
+		new_bucket.prev = bucket
+		new_bucket.next = following
+		bucket.next = new_bucket
+		following.prev = new_bucket
+		return new_bucket
+
+	def _unlinkKey(self, key, bucket):
+		"""
+		Removes key from bucket, and the bucket from the list once it is empty.
+		"""
+		del bucket.keys[key]
+		if not bucket.keys:
+			bucket.prev.next = bucket.next
+			bucket.next.prev = bucket.prev
+
+	def _use(self, key, entry):
+		"""
+		Moves key to the bucket of its next frequency.
+		"""
+		bucket = entry[2]
+		next_bucket = self._bucketAfter(bucket, bucket.frequency + 1)
+		next_bucket.keys[key] = None
+		entry[2] = next_bucket
+		self._unlinkKey(key, bucket)
+
+	def get(self, key, default=None):
+		"""
+		Returns the value cached at key and counts a use of it.
+
+		Parameters
+		----------
+		key: Any hashable key
+		default: Value to return when key is not cached
+
+		Returns
+		-------
+		Cached value, or default if key is not cached
+
+		>>> cache = LFUCache(max_bytes=100)
+		>>> cache.put('a', 1, 10)
+		>>> cache.get('a')
+		1
+		>>> cache.get('b') is None
+		True
+		>>> (cache.hits, cache.misses)
+		(1, 1)
+		"""
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return default
+		self.hits += 1
+		self._use(key, entry)
+		return entry[0]
+
+	def put(self, key, value, size=1):
+		"""
+		Caches value at key, evicting the least frequently used entries until the cache fits its budget.
+		A new key starts with a count of one, putting an existing key counts as a use of it.
+		Values larger than the whole budget are not cached.
+
+		Parameters
+		----------
+		key: Any hashable key
+		value: Value to cache
+		size: Int size of the entry, counted against max_bytes
+
+		Returns
+		-------
+		None
+
+		>>> cache = LFUCache(max_bytes=20)
+		>>> cache.put('a', 1, 10)
+		>>> cache.put('b', 2, 10)
+		>>> _ = cache.get('a')
+		>>> cache.put('c', 3, 10)
+		>>> sorted(cache.keys())
+		['a', 'c']
+		>>> cache.evictions
+		1
+		"""
+		if size > self.max_bytes:
+			return
+		entry = self._entries.get(key)
+		if entry is None:
+			bucket = self._bucketAfter(self._head, 1)
+			bucket.keys[key] = None
+			self._entries[key] = [value, size, bucket]
+		else:
+			self._bytes -= entry[1]
+			entry[0] = value
+			entry[1] = size
+			self._use(key, entry)
+		self._bytes += size
+		self._evict(key)
+
+	def _evict(self, protected):
+		"""
+		Evicts the least frequently used entries, other than protected, until the cache fits its budget.
+		"""
+		while self._bytes > self.max_bytes:
+			bucket = self._head.next
+			victim = next(iter(bucket.keys))
+			if victim == protected:
+				# The protected key is at most one key away from the front
+				keys = iter(bucket.keys)
+				next(keys)
+				victim = next(keys, None)
+				if victim is None:
+					bucket = bucket.next
+					victim = next(iter(bucket.keys))
+			self._unlinkKey(victim, bucket)
+			self._bytes -= self._entries.pop(victim)[1]
+			self.evictions += 1
+
+	def keys(self):
+		"""
+		Returns the cached keys, from the least to the most frequently used.
+		"""
+		keys = []
+		bucket = self._head.next
+		while bucket is not self._head:
+			keys.extend(bucket.keys)
+			bucket = bucket.next
+		return keys
+
+	def clear(self):
+		"""
+		Removes all entries. Counters are kept.
+		"""
+		self._entries.clear()
+		self._head = _FrequencyBucket(0)
+		self._bytes = 0
+
+	def stats(self):
+		"""
+		Returns a dictionary with the hit, miss and eviction counters, and the current number of entries
+		and bytes in the cache.
+
+		>>> cache = LFUCache(max_bytes=100)
+		>>> cache.put('a', 1, 10)
+		>>> cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 1, 'bytes': 10}
+		True
+		"""
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'entries': len(self._entries),
+			'bytes': self._bytes,
+		}
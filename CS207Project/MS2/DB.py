@@ -1,8 +1,11 @@
 # py.test --doctest-modules  --cov --cov-report term-missing DB.py
 class ValueRef(object):
 	"""
-	A reference to a string value on disk.
+	A reference to a string (or bytes) value on disk.
 	"""
+	# Bytes values are stored behind this marker, which can never start a utf-8 string
+	BYTES_MARKER = b'\xff'
+
 	def __init__(self, referent=None, address=0):
 		"""
 		Initializes a value reference that takes in a referent (BinaryNode) and the address in disk.
@@ -40,10 +43,11 @@ class ValueRef(object):
 	def referent_to_bytes(referent):
 		"""
 		Converts referent data (as a utf-8 string) to bytes.
+		Bytes referents are stored as they are, after BYTES_MARKER.
 
 		Parameters
 		----------
-		referent: Node
+		referent: String or bytes
 
 		Returns
 		-------
@@ -53,29 +57,39 @@ class ValueRef(object):
 		>>> referent = '1'
 		>>> ref.referent_to_bytes(referent)
 		b'1'
+		>>> ref.referent_to_bytes(b'1')
+		b'\\xff1'
 		"""
+		if isinstance(referent, (bytes, bytearray, memoryview)):
+			return ValueRef.BYTES_MARKER + bytes(referent)
 		return referent.encode('utf-8')
 
 	@staticmethod
 	def bytes_to_referent(bytes):
 		"""
-		Converts byte data to utf-8 string.
+		Converts byte data (bytes or a memoryview) to utf-8 string.
+		Values that were stored as bytes come back as a read-only memoryview over the data that was read,
+		so that they can be decoded without being copied.
 
 		Parameters
 		----------
-		referent: Node
+		bytes: Bytes or memoryview
 
 		Returns
 		-------
-		Bytes
+		String, or memoryview for bytes values
 		
 		>>> ref = ValueRef()
 		>>> referent = '1'
 		>>> bytes = ref.referent_to_bytes(referent)
 		>>> ref.bytes_to_referent(bytes)
 		'1'
+		>>> ref.bytes_to_referent(ref.referent_to_bytes(b'1')).tobytes()
+		b'1'
 		"""
-		return bytes.decode('utf-8')
+		if bytes[:1] == ValueRef.BYTES_MARKER:
+			return memoryview(bytes)[1:]
+		return str(bytes, 'utf-8')
 
 	def get(self, storage):
 		"""
@@ -130,7 +144,113 @@ class ValueRef(object):
 			self._address = storage.write(self.referent_to_bytes(self._referent))
 
 
+import itertools
+import numbers
 import pickle
+import struct
+
+# Node encodings, recorded in the superblock of every file.
+# Files written before the struct encoding existed have a zero there, and keep using pickle.
+NODE_FORMAT_PICKLE = 0
+NODE_FORMAT_STRUCT = 1
+
+# Tags for the type of a node's key in the struct encoding
+KEY_STR = 0
+KEY_PICKLE = 1
+KEY_INT64 = 2
+KEY_FLOAT64 = 3
+
+INT64_KEY = struct.Struct("!q")
+FLOAT64_KEY = struct.Struct("!d")
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# Left, value and right addresses, color, key tag and key length, followed by the key itself
+NODE_HEADER = struct.Struct("!QQQBBI")
+
+def normalize_key(key):
+	"""
+	Turns numeric keys (including numpy scalars) into plain Python ints and floats, so that they are
+	encoded as int64 / float64 and compared numerically. NaN cannot be ordered and is rejected.
+
+	>>> import numpy as np
+	>>> normalize_key(np.float64(0.5))
+	0.5
+	>>> type(normalize_key(np.int64(3)))
+	<class 'int'>
+	>>> normalize_key('0.5')
+	'0.5'
+	"""
+	if isinstance(key, bool) or isinstance(key, str):
+		return key
+	if isinstance(key, numbers.Integral):
+		return int(key)
+	if isinstance(key, numbers.Real):
+		key = float(key)
+		if key != key:
+			raise ValueError('NaN cannot be used as a key')
+	return key
+
+def check_key_type(key, tree_key):
+	"""
+	Raises a TypeError saying what to do when one of key and tree_key is a string and the other a number, as
+	they can not be compared. This happens with files written before numeric keys were supported, which
+	stored numbers as string keys; DB.convert_keys rewrites them with numeric keys.
+
+	>>> check_key_type(0.5, 0.25)
+	>>> check_key_type(0.5, '0.25')
+	Traceback (most recent call last):
+	...
+	TypeError: Key 0.5 can not be compared with the str keys of this database, which may have been written before numeric keys were supported: rewrite it with DB.convert_keys
+	"""
+	if key is None or tree_key is None:
+		return
+	if isinstance(key, str) != isinstance(tree_key, str) and isinstance(key, (str, numbers.Real)) \
+		and isinstance(tree_key, (str, numbers.Real)):
+		raise TypeError('Key %r can not be compared with the %s keys of this database, which may have been written '
+			'before numeric keys were supported: rewrite it with DB.convert_keys' % (key, type(tree_key).__name__))
+
+def encode_key(key):
+	"""
+	Encodes a key as a (tag, bytes) pair. Strings are stored as utf-8, ints that fit in 64 bits as int64,
+	floats as float64, and anything else is pickled.
+
+	>>> encode_key('1')
+	(0, b'1')
+	>>> encode_key(1)
+	(2, b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x01')
+	>>> encode_key(0.5)
+	(3, b'?\\xe0\\x00\\x00\\x00\\x00\\x00\\x00')
+	"""
+	if isinstance(key, str):
+		return KEY_STR, key.encode('utf-8')
+	if isinstance(key, int) and not isinstance(key, bool) and INT64_MIN <= key <= INT64_MAX:
+		return KEY_INT64, INT64_KEY.pack(key)
+	if isinstance(key, float):
+		return KEY_FLOAT64, FLOAT64_KEY.pack(key)
+	return KEY_PICKLE, pickle.dumps(key)
+
+def decode_key(tag, data):
+	"""
+	Decodes a key from the (tag, bytes) pair made by encode_key.
+
+	>>> decode_key(*encode_key('1'))
+	'1'
+	>>> decode_key(*encode_key(4))
+	4
+	>>> decode_key(*encode_key(10.0)) > decode_key(*encode_key(2.0))
+	True
+	"""
+	if tag == KEY_STR:
+		return str(data, 'utf-8')
+	if tag == KEY_INT64:
+		return INT64_KEY.unpack_from(data)[0]
+	if tag == KEY_FLOAT64:
+		return FLOAT64_KEY.unpack_from(data)[0]
+	if tag == KEY_PICKLE:
+		return pickle.loads(data)
+	raise ValueError('Unknown key type tag %d' % tag)
+
 class BinaryNodeRef(ValueRef):
 	"""
 	A reference to a btree node on disk. Subclass of ValueRef.
@@ -165,13 +285,16 @@ class BinaryNodeRef(ValueRef):
 			self._referent.store_refs(storage)
 
 	@staticmethod
-	def referent_to_bytes(referent):
+	def referent_to_bytes(referent, node_format=NODE_FORMAT_STRUCT):
 		"""
-		Override superclass referent_to_bytes to convert a BinaryNode referent to bytes using pickle
+		Override superclass referent_to_bytes to convert a BinaryNode referent to bytes.
+		The struct encoding is a fixed-size header with the three addresses, the color, the key's type tag
+		and its length, followed by the encoded key. The pickle encoding is kept for older files.
 
 		Parameters
 		----------
 		referent
+		node_format: NODE_FORMAT_STRUCT or NODE_FORMAT_PICKLE
 
 		Returns
 		-------
@@ -183,25 +306,36 @@ class BinaryNodeRef(ValueRef):
 		>>> referent = BinaryNode(ValueRef(), '1', ValueRef(), ValueRef())
 		>>> type(ref.referent_to_bytes(referent))
 		<class 'bytes'>
+		>>> len(ref.referent_to_bytes(referent))
+		31
 		>>> DB.remove('test.dbdb')
 		"""
-
-		"use pickle to convert node to bytes"
-		return pickle.dumps({
-			'left': referent.left_ref.address,
-			'key': referent.key,
-			'value': referent.value_ref.address,
-			'right': referent.right_ref.address,
-		})
+		if node_format == NODE_FORMAT_PICKLE:
+			# use pickle to convert node to bytes
+			return pickle.dumps({
+				'left': referent.left_ref.address,
+				'key': referent.key,
+				'value': referent.value_ref.address,
+				'right': referent.right_ref.address,
+			})
+		tag, key_bytes = encode_key(referent.key)
+		return NODE_HEADER.pack(
+			referent.left_ref.address,
+			referent.value_ref.address,
+			referent.right_ref.address,
+			referent.color,
+			tag,
+			len(key_bytes)) + key_bytes
 
 	@staticmethod
-	def bytes_to_referent(string):
+	def bytes_to_referent(string, node_format=NODE_FORMAT_STRUCT):
 		"""
-		Override superclass bytes_to_referent to convert bytes to a BinaryNode using pickle
+		Override superclass bytes_to_referent to convert bytes to a BinaryNode
 
 		Parameters
 		----------
 		referent
+		node_format: NODE_FORMAT_STRUCT or NODE_FORMAT_PICKLE
 
 		Returns
 		-------
@@ -219,15 +353,102 @@ class BinaryNodeRef(ValueRef):
 		'1'
 		>>> DB.remove('test.dbdb')
 		"""
-		"unpickle bytes to get a node object"
-		d = pickle.loads(string)
+		return BinaryNodeRef.fields_to_referent(BinaryNodeRef.bytes_to_fields(string, node_format))
+
+	@staticmethod
+	def bytes_to_fields(string, node_format=NODE_FORMAT_STRUCT):
+		"""
+		Decodes bytes into the plain fields of a node: a (left address, key, value address, right address, color)
+		tuple. These are what the node cache keeps, so that a cached entry never holds on to child nodes.
+		The pickle encoding does not store colors, so those nodes come back red.
+
+		Parameters
+		----------
+		string: Bytes
+		node_format: NODE_FORMAT_STRUCT or NODE_FORMAT_PICKLE
+
+		Returns
+		-------
+		Tuple of (left address, key, value address, right address, color)
+
+		>>> referent = BinaryNode(BinaryNodeRef(address=1), '1', ValueRef(address=2), BinaryNodeRef(address=3), color=Color.BLACK)
+		>>> BinaryNodeRef.bytes_to_fields(BinaryNodeRef.referent_to_bytes(referent))
+		(1, '1', 2, 3, 1)
+		>>> BinaryNodeRef.bytes_to_fields(BinaryNodeRef.referent_to_bytes(referent, NODE_FORMAT_PICKLE), NODE_FORMAT_PICKLE)
+		(1, '1', 2, 3, 0)
+		"""
+		if node_format == NODE_FORMAT_PICKLE:
+			# unpickle bytes to get the node's fields
+			d = pickle.loads(string)
+			return (d['left'], d['key'], d['value'], d['right'], Color.RED)
+		left, value, right, color, tag, key_length = NODE_HEADER.unpack_from(string, 0)
+		key = decode_key(tag, string[NODE_HEADER.size:NODE_HEADER.size + key_length])
+		return (left, key, value, right, color)
+
+	@staticmethod
+	def fields_to_referent(fields):
+		"""
+		Builds a new BinaryNode from fields returned by bytes_to_fields.
+		"""
+		left, key, value, right, color = fields
 		return BinaryNode(
-			BinaryNodeRef(address=d['left']),
-			d['key'],
-			ValueRef(address=d['value']),
-			BinaryNodeRef(address=d['right']),
+			BinaryNodeRef(address=left),
+			key,
+			ValueRef(address=value),
+			BinaryNodeRef(address=right),
+			color=color,
 		)
 
+	def get(self, storage):
+		"""
+		Override superclass get to go through the storage's node cache before reading from disk.
+		Addresses never change in the append-only file, so cached entries never go stale.
+
+		Parameters
+		----------
+		storage
+
+		Returns
+		-------
+		BinaryNode
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> storage = dbdb._storage
+		>>> ref = BinaryNodeRef(referent=BinaryNode(BinaryNodeRef(), '1', ValueRef('2'), BinaryNodeRef()))
+		>>> ref.store(storage)
+		>>> BinaryNodeRef(address=ref.address).get(storage).key
+		'1'
+		>>> BinaryNodeRef(address=ref.address).get(storage).key
+		'1'
+		>>> (storage.node_cache.hits, storage.node_cache.misses)
+		(1, 1)
+		>>> DB.remove('test.dbdb')
+		"""
+		if self._referent is None and self._address:
+			fields = storage.node_cache.get(self._address)
+			if fields is None:
+				data = storage.read(self._address)
+				fields = self.bytes_to_fields(data, storage.node_format)
+				storage.node_cache.put(self._address, fields, len(data))
+			self._referent = self.fields_to_referent(fields)
+		return self._referent
+
+	def store(self, storage):
+		"""
+		Override superclass store to encode the node in the storage's node format.
+
+		Parameters
+		----------
+		storage
+
+		Returns
+		-------
+		None
+		"""
+		if self._referent is not None and not self._address:
+			self.prepare_to_store(storage)
+			self._address = storage.write(self.referent_to_bytes(self._referent, storage.node_format))
+
 class Color(object):
 	"""
 	Color class for BinaryNode in Red Black Tree. Color can either be RED or BLACK.
@@ -571,7 +792,7 @@ class BinaryTree(object):
 
 		Parameters
 		----------
-		key: String key
+		key: String or numeric key. Numeric keys (ints and floats) are compared numerically.
 
 		Returns
 		-------
@@ -584,12 +805,21 @@ class BinaryTree(object):
 		>>> btree.get('1')
 		'2'
 		"""
+		return self._follow(self._value_ref(key))
+
+	def _value_ref(self, key):
+		"""
+		Returns the ValueRef stored at key, without reading the value, or raises KeyError.
+		"""
+		key = normalize_key(key)
 		# If tree is not locked by another writer
 		# Refresh the references and get new tree if needed
 		if not self._storage.locked:
 			self._refresh_tree_ref()
 		# Get the top level node
 		node = self._follow(self._tree_ref)
+		if node is not None:
+			check_key_type(key, node.key)
 		# Traverse until you find appropriate node
 		while node is not None:
 			if key < node.key:
@@ -597,7 +827,7 @@ class BinaryTree(object):
 			elif key > node.key:
 				node = self._follow(node.right_ref)
 			else:
-				return self._follow(node.value_ref)
+				return node.value_ref
 		raise KeyError
 
 	def set(self, key, value):
@@ -607,7 +837,7 @@ class BinaryTree(object):
 
 		Parameters
 		----------
-		key: String key
+		key: String or numeric key. Numeric keys (ints and floats) are compared numerically.
 		value: String value
 
 		Returns
@@ -622,12 +852,15 @@ class BinaryTree(object):
 		>>> btree.get('2')
 		'3'
 		"""
+		key = normalize_key(key)
 		# Lock the tree and make sure updates from any other process is not lost
 		if self._storage.lock():
 			self._refresh_tree_ref()
 
 		# Get current top-level node and make a value-ref
 		node = self._follow(self._tree_ref)
+		if node is not None:
+			check_key_type(key, node.key)
 		value_ref = ValueRef(value)
 		self._tree_ref = self._insert(node, key, value_ref)
 
@@ -636,6 +869,62 @@ class BinaryTree(object):
 		balancedTreeNode = treeNode.blacken()
 		self._tree_ref = BinaryNodeRef(referent=balancedTreeNode, address=self._tree_ref.address)
 		
+	def bulk_load(self, pairs):
+		"""
+		Replaces the contents of the tree with the (key, value) pairs, which must be sorted by strictly
+		increasing key, and commits it.
+		Instead of inserting one pair at a time, a perfectly balanced tree is built bottom-up in O(n),
+		and nodes are written out in a single sequential pass, each subtree before its parent.
+		All nodes are black, except for the deepest level when it is not full, which is red.
+
+		Parameters
+		----------
+		pairs: Iterable of (key, value) pairs sorted by key
+
+		Returns
+		-------
+		None
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> btree = BinaryTree(dbdb._storage)
+		>>> btree.bulk_load([(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')])
+		>>> btree.get(4)
+		'd'
+		>>> btree._follow(btree._tree_ref).key
+		3
+		>>> btree.bulk_load([(2, 'b'), (1, 'a')])
+		Traceback (most recent call last):
+		...
+		ValueError: Keys must be sorted in strictly increasing order
+		>>> DB.remove('test.dbdb')
+		"""
+		pairs = [(normalize_key(key), value) for key, value in pairs]
+		for i in range(1, len(pairs)):
+			if not pairs[i - 1][0] < pairs[i][0]:
+				raise ValueError('Keys must be sorted in strictly increasing order')
+
+		# Number of levels in the tree, and whether the deepest one is full
+		height = len(pairs).bit_length()
+		full = (len(pairs) & (len(pairs) + 1)) == 0
+
+		def build(lo, hi, depth):
+			# Writes the subtree of pairs[lo:hi] and returns a reference to its root
+			if lo >= hi:
+				return BinaryNodeRef()
+			mid = (lo + hi) // 2
+			left_ref = build(lo, mid, depth + 1)
+			right_ref = build(mid + 1, hi, depth + 1)
+			key, value = pairs[mid]
+			color = Color.RED if depth == height - 1 and not full else Color.BLACK
+			ref = BinaryNodeRef(referent=BinaryNode(left_ref, key, ValueRef(value), right_ref, color=color))
+			ref.store(self._storage)
+			# Only keep the address, so the whole tree is not held in memory
+			return BinaryNodeRef(address=ref.address)
+
+		self._storage.lock()
+		self._tree_ref = build(0, len(pairs), 0)
+		self._storage.commit_root_address(self._tree_ref.address)
+
 	def _insert(self, node, key, value_ref):
 		"""
 		Recursive helper function that inserts key and value_ref into the tree.
@@ -738,24 +1027,91 @@ class BinaryTree(object):
 				return node
 			node = next_node
 
-	def _inorder(self, root, sortedList):
+	def _iter_subtree(self, node, lo=None, hi=None, reverse=False):
 		"""
-		Helper function that does in order traversal of the tree.
+		Generator that yields the (key, value) pairs of the subtree rooted at node whose keys are between
+		lo and hi (both inclusive, None meaning unbounded), in key order.
+		This walks the tree with an explicit stack instead of recursion, and never descends into a subtree
+		that lies entirely outside of [lo, hi], so nodes that are not needed are never read.
 
 		Parameters
 		----------
-		root: BinaryNode that is the root
-		sortedList: Stores the in order traversed list of nodes
+		node: BinaryNode that is the root of the subtree
+		lo: Smallest key to yield, or None
+		hi: Largest key to yield, or None
+		reverse: If True, yield in decreasing key order
 
 		Returns
 		-------
-		None, but sortedList will be populated
+		Generator of (key, value) tuples
+		"""
+		stack = []
+		while stack or node is not None:
+			if node is not None:
+				# Walk down towards the first key in range, skipping nodes (and their subtrees on the
+				# far side) that come before it
+				if reverse:
+					if hi is not None and node.key > hi:
+						node = self._follow(node.left_ref)
+						continue
+					stack.append(node)
+					node = self._follow(node.right_ref)
+				else:
+					if lo is not None and node.key < lo:
+						node = self._follow(node.right_ref)
+						continue
+					stack.append(node)
+					node = self._follow(node.left_ref)
+			else:
+				node = stack.pop()
+				# Every node left on the stack is further along than this one, so we are done
+				if reverse and lo is not None and node.key < lo:
+					return
+				if not reverse and hi is not None and node.key > hi:
+					return
+				yield node.key, self._follow(node.value_ref)
+				node = self._follow(node.left_ref if reverse else node.right_ref)
+
+	def range(self, lo=None, hi=None, reverse=False, limit=None):
 		"""
-		if root is None:
-			return
-		self._inorder(self._follow(root.left_ref), sortedList)
-		sortedList.append(root.value_ref)
-		self._inorder(self._follow(root.right_ref), sortedList)
+		Lazily iterates over the (key, value) pairs with lo <= key <= hi, in key order.
+		Nodes are only read from storage as the iterator is consumed, so stopping early (or passing a limit)
+		means the rest of the tree is never decoded.
+
+		Parameters
+		----------
+		lo: Smallest key to return, or None for no lower bound
+		hi: Largest key to return, or None for no upper bound
+		reverse: If True, iterate from hi down to lo
+		limit: Maximum number of pairs to return, or None for no limit
+
+		Returns
+		-------
+		Iterator of (key, value) tuples
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> btree = BinaryTree(dbdb._storage)
+		>>> for i in range(10):
+		...     btree.set(i, str(i))
+		>>> list(btree.range(3, 6))
+		[(3, '3'), (4, '4'), (5, '5'), (6, '6')]
+		>>> list(btree.range(hi=6, reverse=True, limit=2))
+		[(6, '6'), (5, '5')]
+		>>> DB.remove('test.dbdb')
+		"""
+		lo = normalize_key(lo) if lo is not None else None
+		hi = normalize_key(hi) if hi is not None else None
+		# Take the root now, so the iterator sees the tree as it is when range is called
+		if not self._storage.locked:
+			self._refresh_tree_ref()
+		root = self._follow(self._tree_ref)
+		if root is not None:
+			check_key_type(lo, root.key)
+			check_key_type(hi, root.key)
+		pairs = self._iter_subtree(root, lo, hi, reverse)
+		if limit is not None:
+			pairs = itertools.islice(pairs, max(limit, 0))
+		return pairs
 
 	def traverse_in_order(self, node):
 		"""
@@ -769,58 +1125,25 @@ class BinaryTree(object):
 		-----------
 		out_global : list of nodes in subtree
 		"""
-		out_global = []
-		def traverse_enclosed(node):
-			if node is None:
-				return
-			traverse_enclosed(self._follow(node.left_ref))
-			out_global.append((node.key, node.value_ref.get(self._storage)))
-			traverse_enclosed(self._follow(node.right_ref))
-		traverse_enclosed(node)
-		return out_global
+		return list(self._iter_subtree(node))
 
 	def chop(self, chop_key):
 		"""
 		Get all keys less than the chop_key.
 		e.g. chopping on 4 returns all nodes with key <=4.
+		With numeric keys this is a numeric comparison, so chopping on 2.0 never returns 10.0.
 
 		Returns
 		-----------
-		out : list of nodes with key less than chop_key
+		out : list of nodes with key less than chop_key, in key order
 		"""
 		# returns a list of key-vals with key's less than or equal to chop_key
-		nodes_to_expand = []
-		if not self._storage.locked:
-			self._refresh_tree_ref()
-		node = self._follow(self._tree_ref)
-		#traverse until you find appropriate node
-		while node is not None:
-			parent_node = node
-			if chop_key < node.key:
-				node = self._follow(node.left_ref)
-			elif chop_key > node.key:
-				# take note any time we turn right. we will need to backtrack to these nodes
-				if self._follow(node.right_ref) is not None:
-					nodes_to_expand.append(node)
-				node = self._follow(node.right_ref)
-			else:
-				node = None
-		# at this point parent_node stores our best approx position of chop_key in tree
-		nodes_to_expand.append(parent_node)
-		out = []
-		# at parent node collect left subtree
-		# then backtrack to all instances where we turned right
-		for node in nodes_to_expand:
-			if node.key<=chop_key:
-				out.append((node.key, node.value_ref.get(self._storage)))
-			out = out + self.traverse_in_order(self._follow(node.left_ref))
-		return out
-
+		return list(self.range(hi=chop_key))
 
 	def find_min_k(self, node, k):
 		"""
 		Find the k min values in the red black subtree rooted at input node.
-		It does an in order traversal first to find the sorted order, then takes the last k elements.
+		The in order traversal stops as soon as it has found k elements.
 
 		Parameters
 		----------
@@ -843,21 +1166,611 @@ class BinaryTree(object):
 		>>> btree.find_min_k(root, 2)
 		['1', '2']
 		"""
-		sortedTidRefs = []
-		self._inorder(node, sortedTidRefs)
-		# Get the last k refs
-		lastKRefs = sortedTidRefs[:k]
-		# Get the actual values
-		tidsToReturn = []
-		for ref in lastKRefs:
-			tidsToReturn.append(ref.get(self._storage))
-		return tidsToReturn
+		return [value for _, value in itertools.islice(self._iter_subtree(node), k)]
+
+import bisect
+
+# Leaf flag, then the number of keys. A leaf is followed by one value address per key, an internal node
+# by one child address more than it has keys. Each key is then stored as its tag, length and bytes.
+BPLUS_HEADER = struct.Struct("!BI")
+BPLUS_ADDRESS = struct.Struct("!Q")
+BPLUS_KEY_HEADER = struct.Struct("!BI")
+
+class BPlusNode(object):
+	"""
+	Node of a B+tree. Leaves hold sorted keys and a ValueRef for each of them. Internal nodes hold sorted
+	separator keys and one BPlusNodeRef more than they have keys, where child i holds the keys k with
+	keys[i - 1] <= k < keys[i].
+	"""
+
+	def __init__(self, keys, refs, is_leaf):
+		"""
+		Initializes a node
+
+		Parameters
+		----------
+		keys: List of sorted keys
+		refs: List of ValueRefs (leaves) or BPlusNodeRefs (internal nodes)
+		is_leaf: True for leaves
+
+		Returns
+		-------
+		None
+
+		>>> node = BPlusNode([1, 2], [ValueRef('a'), ValueRef('b')], True)
+		>>> node.keys
+		[1, 2]
+		"""
+		self.keys = keys
+		self.refs = refs
+		self.is_leaf = is_leaf
+
+	def store_refs(self, storage):
+		"""
+		Stores the values (leaves) or children (internal nodes) of the node
+
+		Parameters
+		----------
+		storage
+
+		Returns
+		-------
+		None
+		"""
+		for ref in self.refs:
+			ref.store(storage)
+
+class BPlusNodeRef(ValueRef):
+	"""
+	A reference to a B+tree node on disk. Subclass of ValueRef.
+	"""
+
+	def prepare_to_store(self, storage):
+		"""
+		Have a node store its refs, similar functionality as ValueRef's store
+		"""
+		if self._referent:
+			self._referent.store_refs(storage)
+
+	@staticmethod
+	def referent_to_bytes(referent):
+		"""
+		Override superclass referent_to_bytes to convert a BPlusNode referent to bytes.
+
+		Parameters
+		----------
+		referent: BPlusNode
+
+		Returns
+		-------
+		Bytes
+
+		>>> node = BPlusNode([1, 2], [ValueRef(address=10), ValueRef(address=20)], True)
+		>>> len(BPlusNodeRef.referent_to_bytes(node))
+		47
+		"""
+		parts = [BPLUS_HEADER.pack(referent.is_leaf, len(referent.keys))]
+		parts.extend(BPLUS_ADDRESS.pack(ref.address) for ref in referent.refs)
+		for key in referent.keys:
+			tag, key_bytes = encode_key(key)
+			parts.append(BPLUS_KEY_HEADER.pack(tag, len(key_bytes)))
+			parts.append(key_bytes)
+		return b''.join(parts)
+
+	@staticmethod
+	def bytes_to_fields(string):
+		"""
+		Decodes bytes into the plain fields of a node: an (is_leaf, keys, addresses) tuple.
+		These are what the node cache keeps, so that a cached entry never holds on to child nodes.
+
+		Parameters
+		----------
+		string: Bytes
+
+		Returns
+		-------
+		Tuple of (is_leaf, tuple of keys, tuple of addresses)
+
+		>>> node = BPlusNode(['a'], [BPlusNodeRef(address=10), BPlusNodeRef(address=20)], False)
+		>>> BPlusNodeRef.bytes_to_fields(BPlusNodeRef.referent_to_bytes(node))
+		(False, ('a',), (10, 20))
+		"""
+		is_leaf, count = BPLUS_HEADER.unpack_from(string, 0)
+		offset = BPLUS_HEADER.size
+		n_addresses = count if is_leaf else count + 1
+		addresses = struct.unpack_from("!%dQ" % n_addresses, string, offset)
+		offset += n_addresses * BPLUS_ADDRESS.size
+		keys = []
+		for _ in range(count):
+			tag, key_length = BPLUS_KEY_HEADER.unpack_from(string, offset)
+			offset += BPLUS_KEY_HEADER.size
+			keys.append(decode_key(tag, string[offset:offset + key_length]))
+			offset += key_length
+		return (bool(is_leaf), tuple(keys), addresses)
+
+	@staticmethod
+	def fields_to_referent(fields):
+		"""
+		Builds a new BPlusNode from fields returned by bytes_to_fields.
+		"""
+		is_leaf, keys, addresses = fields
+		ref_class = ValueRef if is_leaf else BPlusNodeRef
+		return BPlusNode(list(keys), [ref_class(address=address) for address in addresses], is_leaf)
+
+	@staticmethod
+	def bytes_to_referent(string):
+		"""
+		Override superclass bytes_to_referent to convert bytes to a BPlusNode
+		"""
+		return BPlusNodeRef.fields_to_referent(BPlusNodeRef.bytes_to_fields(string))
+
+	def get(self, storage):
+		"""
+		Override superclass get to go through the storage's node cache before reading from disk.
+
+		Parameters
+		----------
+		storage
+
+		Returns
+		-------
+		BPlusNode
+		"""
+		if self._referent is None and self._address:
+			fields = storage.node_cache.get(self._address)
+			if fields is None:
+				data = storage.read(self._address)
+				fields = self.bytes_to_fields(data)
+				storage.node_cache.put(self._address, fields, len(data))
+			self._referent = self.fields_to_referent(fields)
+		return self._referent
+
+class BPlusTree(object):
+	"""
+	Immutable B+tree class, where a new tree is constructed on changes.
+	Only the nodes on the path from the root to the changed leaf are copied, and, like BinaryTree, the new
+	root is written to the superblock on commit. With up to MAX_KEYS keys per node, a node of numeric
+	keys fits in a 4096 byte page, so the tree is only a few levels deep and a lookup reads a few pages.
+	"""
+	MAX_KEYS = 128
+
+	def __init__(self, storage):
+		"""
+		Initializes a B+tree from a provided storage.
+
+		Parameters
+		----------
+		storage
+
+		Returns
+		-------
+		None
+
+		>>> dbdb = DB.connect('test.dbdb', engine='bplus')
+		>>> type(dbdb._tree)
+		<class 'DB.BPlusTree'>
+		>>> DB.remove('test.dbdb')
+		"""
+		self._storage = storage
+		self._refresh_tree_ref()
+
+	def commit(self):
+		"""
+		Changes are persisted after commit is called. This stores the root into disk.
+		"""
+		self._tree_ref.store(self._storage)
+		self._storage.commit_root_address(self._tree_ref.address)
 
+	def _refresh_tree_ref(self):
+		"""
+		Get reference to new tree if it has changed.
+		"""
+		self._tree_ref = BPlusNodeRef(
+			address=self._storage.get_root_address())
+
+	def _follow(self, ref):
+		"""
+		Private helper function that gets a node, or a value, from its reference.
+		"""
+		return ref.get(self._storage)
+
+	def get(self, key):
+		"""
+		Returns the value stored at key
+
+		Parameters
+		----------
+		key: String or numeric key. Numeric keys (ints and floats) are compared numerically.
+
+		Returns
+		-------
+		String value
+
+		>>> dbdb = DB.connect('test.dbdb', engine='bplus')
+		>>> btree = dbdb._tree
+		>>> btree.set('1', '2')
+		>>> btree.get('1')
+		'2'
+		>>> DB.remove('test.dbdb')
+		"""
+		return self._follow(self._value_ref(key))
+
+	def _value_ref(self, key):
+		"""
+		Returns the ValueRef stored at key, without reading the value, or raises KeyError.
+		"""
+		key = normalize_key(key)
+		if not self._storage.locked:
+			self._refresh_tree_ref()
+		node = self._follow(self._tree_ref)
+		if node is None:
+			raise KeyError
+		check_key_type(key, node.keys[0] if node.keys else None)
+		while not node.is_leaf:
+			node = self._follow(node.refs[bisect.bisect_right(node.keys, key)])
+		i = bisect.bisect_left(node.keys, key)
+		if i < len(node.keys) and node.keys[i] == key:
+			return node.refs[i]
+		raise KeyError
+
+	def set(self, key, value):
+		"""
+		Sets a new value in the tree with associated key.
+		Nodes that go over MAX_KEYS are split in two, and a root that splits gets a new root above it.
+
+		Parameters
+		----------
+		key: String or numeric key. Numeric keys (ints and floats) are compared numerically.
+		value: String value
+
+		Returns
+		-------
+		None
+
+		>>> dbdb = DB.connect('test.dbdb', engine='bplus')
+		>>> btree = dbdb._tree
+		>>> btree.set('1', '2')
+		>>> btree.set('1', '3')
+		>>> btree.get('1')
+		'3'
+		>>> DB.remove('test.dbdb')
+		"""
+		key = normalize_key(key)
+		if self._storage.lock():
+			self._refresh_tree_ref()
+		node = self._follow(self._tree_ref)
+		value_ref = ValueRef(value)
+		if node is None:
+			self._tree_ref = BPlusNodeRef(referent=BPlusNode([key], [value_ref], True))
+			return
+		check_key_type(key, node.keys[0] if node.keys else None)
+		refs = self._insert(node, key, value_ref)
+		if len(refs) == 1:
+			self._tree_ref = refs[0]
+		else:
+			left_ref, separator, right_ref = refs
+			self._tree_ref = BPlusNodeRef(referent=BPlusNode([separator], [left_ref, right_ref], False))
+
+	def _insert(self, node, key, value_ref):
+		"""
+		Recursive helper function that inserts key and value_ref below node, copying the nodes on the way.
+		Used by set.
+
+		Parameters
+		----------
+		node: current BPlusNode
+		key: Key
+		value_ref: ValueRef encapsulating value
+
+		Returns
+		-------
+		Either a one element tuple with a BPlusNodeRef to the new node, or a (left ref, separator key,
+		right ref) tuple when the node had to be split
+		"""
+		keys = list(node.keys)
+		refs = list(node.refs)
+		if node.is_leaf:
+			i = bisect.bisect_left(keys, key)
+			if i < len(keys) and keys[i] == key:
+				refs[i] = value_ref
+			else:
+				keys.insert(i, key)
+				refs.insert(i, value_ref)
+		else:
+			i = bisect.bisect_right(keys, key)
+			child_refs = self._insert(self._follow(refs[i]), key, value_ref)
+			refs[i] = child_refs[0]
+			if len(child_refs) == 3:
+				keys.insert(i, child_refs[1])
+				refs.insert(i + 1, child_refs[2])
+		if len(keys) <= self.MAX_KEYS:
+			return (BPlusNodeRef(referent=BPlusNode(keys, refs, node.is_leaf)),)
+		mid = len(keys) // 2
+		if node.is_leaf:
+			# Leaves keep every key, the first key of the right half is copied up as the separator
+			left = BPlusNode(keys[:mid], refs[:mid], True)
+			right = BPlusNode(keys[mid:], refs[mid:], True)
+		else:
+			# Internal nodes move the middle key up
+			left = BPlusNode(keys[:mid], refs[:mid + 1], False)
+			right = BPlusNode(keys[mid + 1:], refs[mid + 1:], False)
+		return (BPlusNodeRef(referent=left), keys[mid], BPlusNodeRef(referent=right))
+
+	def bulk_load(self, pairs):
+		"""
+		Replaces the contents of the tree with the (key, value) pairs, which must be sorted by strictly
+		increasing key, and commits it.
+		Leaves are filled to MAX_KEYS and written out in order, each after its values, and then every level
+		of internal nodes is built on top of the one below it.
+
+		Parameters
+		----------
+		pairs: Iterable of (key, value) pairs sorted by key
+
+		Returns
+		-------
+		None
+
+		>>> dbdb = DB.connect('test.dbdb', engine='bplus')
+		>>> dbdb.bulk_load([(i, str(i)) for i in range(1000)])
+		>>> dbdb.get(999)
+		'999'
+		>>> dbdb.bulk_load([(2, 'b'), (1, 'a')])
+		Traceback (most recent call last):
+		...
+		ValueError: Keys must be sorted in strictly increasing order
+		>>> DB.remove('test.dbdb')
+		"""
+		pairs = [(normalize_key(key), value) for key, value in pairs]
+		for i in range(1, len(pairs)):
+			if not pairs[i - 1][0] < pairs[i][0]:
+				raise ValueError('Keys must be sorted in strictly increasing order')
+
+		def write(node):
+			# Writes a node after its refs, and only keeps its address
+			ref = BPlusNodeRef(referent=node)
+			ref.store(self._storage)
+			return BPlusNodeRef(address=ref.address)
+
+		# (smallest key, reference) for every node of the current level
+		level = []
+		for start in range(0, len(pairs), self.MAX_KEYS):
+			chunk = pairs[start:start + self.MAX_KEYS]
+			leaf = BPlusNode([key for key, _ in chunk], [ValueRef(value) for _, value in chunk], True)
+			level.append((chunk[0][0], write(leaf)))
+		while len(level) > 1:
+			parents = []
+			for start in range(0, len(level), self.MAX_KEYS + 1):
+				children = level[start:start + self.MAX_KEYS + 1]
+				node = BPlusNode([key for key, _ in children[1:]], [ref for _, ref in children], False)
+				parents.append((children[0][0], write(node)))
+			level = parents
+
+		self._storage.lock()
+		self._tree_ref = level[0][1] if level else BPlusNodeRef()
+		self._storage.commit_root_address(self._tree_ref.address)
+
+	def _iter_leaves(self, lo=None, hi=None, reverse=False):
+		"""
+		Generator that yields the (key, value) pairs with lo <= key <= hi (None meaning unbounded), in key order.
+		The tree is descended once to the first leaf in range, and a stack of (internal node, child index)
+		cursors is then used to step from leaf to leaf, so each node in range is read exactly once.
+
+		Parameters
+		----------
+		lo: Smallest key to yield, or None
+		hi: Largest key to yield, or None
+		reverse: If True, yield in decreasing key order
+
+		Returns
+		-------
+		Generator of (key, value) tuples
+		"""
+		node = self._follow(self._tree_ref)
+		if node is None:
+			return
+		stack = []
+		bound = hi if reverse else lo
+		while True:
+			# Walk down to the leftmost (or rightmost) leaf that can hold keys in range
+			while not node.is_leaf:
+				if bound is None:
+					i = len(node.refs) - 1 if reverse else 0
+				else:
+					i = bisect.bisect_right(node.keys, bound)
+				stack.append((node, i))
+				node = self._follow(node.refs[i])
+			if reverse:
+				end = len(node.keys) if hi is None else bisect.bisect_right(node.keys, hi)
+				for i in range(end - 1, -1, -1):
+					if lo is not None and node.keys[i] < lo:
+						return
+					yield node.keys[i], self._follow(node.refs[i])
+			else:
+				start = 0 if lo is None else bisect.bisect_left(node.keys, lo)
+				for i in range(start, len(node.keys)):
+					if hi is not None and node.keys[i] > hi:
+						return
+					yield node.keys[i], self._follow(node.refs[i])
+			# Move on to the next subtree of the closest ancestor that still has one; every key in it
+			# is in range on the bound side, so the walk down takes the outermost children from there
+			bound = None
+			while stack:
+				parent, i = stack.pop()
+				i = i - 1 if reverse else i + 1
+				if 0 <= i < len(parent.refs):
+					stack.append((parent, i))
+					node = self._follow(parent.refs[i])
+					break
+			else:
+				return
+
+	def range(self, lo=None, hi=None, reverse=False, limit=None):
+		"""
+		Lazily iterates over the (key, value) pairs with lo <= key <= hi, in key order.
+		Nodes are only read from storage as the iterator is consumed.
+
+		Parameters
+		----------
+		lo: Smallest key to return, or None for no lower bound
+		hi: Largest key to return, or None for no upper bound
+		reverse: If True, iterate from hi down to lo
+		limit: Maximum number of pairs to return, or None for no limit
+
+		Returns
+		-------
+		Iterator of (key, value) tuples
+
+		>>> dbdb = DB.connect('test.dbdb', engine='bplus')
+		>>> for i in range(10):
+		...     dbdb.set(i, str(i))
+		>>> list(dbdb.range(3, 6))
+		[(3, '3'), (4, '4'), (5, '5'), (6, '6')]
+		>>> list(dbdb.range(hi=6, reverse=True, limit=2))
+		[(6, '6'), (5, '5')]
+		>>> DB.remove('test.dbdb')
+		"""
+		lo = normalize_key(lo) if lo is not None else None
+		hi = normalize_key(hi) if hi is not None else None
+		if not self._storage.locked:
+			self._refresh_tree_ref()
+		root = self._follow(self._tree_ref)
+		if root is not None and root.keys:
+			check_key_type(lo, root.keys[0])
+			check_key_type(hi, root.keys[0])
+		pairs = self._iter_leaves(lo, hi, reverse)
+		if limit is not None:
+			pairs = itertools.islice(pairs, max(limit, 0))
+		return pairs
+
+	def chop(self, chop_key):
+		"""
+		Get all key-value pairs with key <= chop_key, in key order.
+		"""
+		return list(self.range(hi=chop_key))
+
+import mmap
 import os
 import struct
 
 import portalocker
 
+from Cache import LRUCache
+
+# Tree engines, recorded in the superblock of every file. Files from before the B+tree have a zero there.
+ENGINE_BINARY = 'binary'
+ENGINE_BPLUS = 'bplus'
+ENGINES = {ENGINE_BINARY: 0, ENGINE_BPLUS: 1}
+ENGINE_NAMES = {number: name for name, number in ENGINES.items()}
+
+class MmapReader(object):
+	"""
+	Read-only memory map over a storage file. Records are decoded straight out of the map and returned
+	as memoryview slices, so reads cost neither a syscall nor a copy.
+	The map is rebuilt whenever a read goes past its end, which happens once the file has grown.
+	"""
+	INTEGER_FORMAT = "!Q"
+	INTEGER_LENGTH = 8
+
+	def __init__(self, f):
+		"""
+		Initializes a reader that maps the whole of an (already non-empty) file.
+
+		Parameters
+		----------
+		f: File opened for reading
+
+		Returns
+		-------
+		None
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> reader = MmapReader(dbdb._storage._f)
+		>>> reader.mapped_length
+		4096
+		>>> reader.close()
+		>>> DB.remove('test.dbdb')
+		"""
+		self._f = f
+		self._map = None
+		self._view = None
+		self._remap()
+
+	@property
+	def mapped_length(self):
+		"""
+		Number of bytes of the file that are currently mapped.
+		"""
+		return len(self._map)
+
+	def _remap(self):
+		"""
+		Flushes pending writes and maps the file again at its current length.
+		The old map is not closed explicitly, as memoryviews handed out earlier may still point into it.
+		It is unmapped once the last of them is gone.
+		"""
+		self._f.flush()
+		self._map = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+		self._view = memoryview(self._map)
+
+	def read_integer(self, address):
+		"""
+		Decode the integer stored at address.
+
+		Parameters
+		----------
+		address
+
+		Returns
+		-------
+		Integer
+		"""
+		if address + self.INTEGER_LENGTH > len(self._map):
+			self._remap()
+		return struct.unpack_from(self.INTEGER_FORMAT, self._map, address)[0]
+
+	def read(self, address):
+		"""
+		Read the length-prefixed record at address.
+
+		Parameters
+		----------
+		address
+
+		Returns
+		-------
+		memoryview of the record's data
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> reader = MmapReader(dbdb._storage._f)
+		>>> address = dbdb._storage.write(b'12345678')
+		>>> bytes(reader.read(address))
+		b'12345678'
+		>>> reader.mapped_length
+		4112
+		>>> reader.close()
+		>>> DB.remove('test.dbdb')
+		"""
+		length = self.read_integer(address)
+		start = address + self.INTEGER_LENGTH
+		end = start + length
+		if end > len(self._map):
+			self._remap()
+		return self._view[start:end]
+
+	def close(self):
+		"""
+		Unmap the file, unless memoryviews returned by read are still alive, in which case the map is
+		left to be unmapped when they go away.
+		"""
+		try:
+			self._view.release()
+			self._map.close()
+		except BufferError:
+			pass
+		self._view = None
+		self._map = None
+
 class Storage(object):
 	"""
 	Storage class that handles locking and storing of times and values on disk.
@@ -865,14 +1778,23 @@ class Storage(object):
 	SUPERBLOCK_SIZE = 4096
 	INTEGER_FORMAT = "!Q"
 	INTEGER_LENGTH = 8
+	# The node format byte sits right after the root address in the superblock, followed by the engine byte
+	NODE_FORMAT_ADDRESS = 8
+	ENGINE_ADDRESS = 9
+	# Default byte budget of the decoded node cache
+	NODE_CACHE_BYTES = 4 * 1024 * 1024
 
-	def __init__(self, f):
+	def __init__(self, f, cache_bytes=NODE_CACHE_BYTES, use_mmap=False, engine=None):
 		"""
 		Initializes storage from a file
 
 		Parameters
 		----------
 		f: File
+		cache_bytes: Byte budget of the node cache, measured in encoded node bytes. If set to 0, nodes are not cached.
+		use_mmap: If True, reads go through a MmapReader and return memoryviews instead of bytes.
+		engine: Tree engine recorded in the superblock of a new file, 'binary' (the default) or 'bplus'.
+			Existing files keep the engine they were created with.
 
 		Returns
 		-------
@@ -890,16 +1812,21 @@ class Storage(object):
 		"""
 		self._f = f
 		self.locked = False
+		# Decoded nodes keyed by address, shared by every tree read through this storage
+		self.node_cache = LRUCache(max_bytes=cache_bytes)
 		# We ensure that we start in a sector boundary
-		self._ensure_superblock()
+		self._ensure_superblock(engine)
+		# The file can only be mapped once the superblock makes it non-empty
+		self._reader = MmapReader(f) if use_mmap else None
 
-	def _ensure_superblock(self):
+	def _ensure_superblock(self, engine=None):
 		"""
-		Guarantees that the next write will start on a sector boundary
+		Guarantees that the next write will start on a sector boundary, and reads the node format and engine
+		of the file, which are set to NODE_FORMAT_STRUCT and engine for new files.
 
 		Parameters
 		----------
-		None
+		engine: Engine name for a new file, or None for 'binary'
 
 		Returns
 		-------
@@ -910,6 +1837,13 @@ class Storage(object):
 		end_address = self._f.tell()
 		if end_address < self.SUPERBLOCK_SIZE:
 			self._f.write(b'\x00' * (self.SUPERBLOCK_SIZE - end_address))
+			if end_address == 0:
+				# Only brand new files get the struct format, existing ones stay in whatever they were written in
+				self._f.seek(self.NODE_FORMAT_ADDRESS)
+				self._f.write(bytes([NODE_FORMAT_STRUCT, ENGINES[engine or ENGINE_BINARY]]))
+		self._f.seek(self.NODE_FORMAT_ADDRESS)
+		self.node_format, engine_id = self._f.read(2)
+		self.engine = ENGINE_NAMES[engine_id]
 		self.unlock()
 
 	def lock(self):
@@ -1095,6 +2029,8 @@ class Storage(object):
 		>>> storage.read(address)
 		b'12345678'
 		"""
+		if self._reader is not None:
+			return self._reader.read(address)
 		self._f.seek(address)
 		length = self._read_integer()
 		data = self._f.read(length)
@@ -1116,6 +2052,8 @@ class Storage(object):
 		"""
 		Get root address, which is the first integer in the file
 		"""
+		if self._reader is not None:
+			return self._reader.read_integer(0)
 		self._seek_superblock()
 		root_address = self._read_integer()
 		return root_address
@@ -1125,6 +2063,8 @@ class Storage(object):
 		Close the storage by unlocking it and closing the disk (file)
 		"""
 		self.unlock()
+		if self._reader is not None:
+			self._reader.close()
 		self._f.close()
 
 	@property
@@ -1160,13 +2100,18 @@ class DBDB(object):
 	Functions are just wrappers around both tree and storage.
 	"""
 
-	def __init__(self, f):
+	def __init__(self, f, cache_bytes=Storage.NODE_CACHE_BYTES, use_mmap=False, engine=None):
 		"""
-		Initializes DBDB with a file, then creates the tree and its associated storage
+		Initializes DBDB with a file, then creates the tree and its associated storage.
+		The tree is a BinaryTree or a BPlusTree, depending on the engine recorded in the file.
 
 		Parameters
 		----------
 		f: File
+		cache_bytes: Byte budget of the storage's node cache
+		use_mmap: If True, the storage reads through a memory map of the file
+		engine: 'binary' or 'bplus' for the tree engine of a new file. For an existing file, this must match
+			its engine, or be None to use whichever engine it has.
 
 		Returns
 		-------
@@ -1181,8 +2126,17 @@ class DBDB(object):
 		>>> type(dbdb)
 		<class 'DB.DBDB'>
 		"""
-		self._storage = Storage(f)
-		self._tree = BinaryTree(self._storage)
+		if engine is not None and engine not in ENGINES:
+			f.close()
+			raise ValueError('Unknown engine %r' % (engine,))
+		self._storage = Storage(f, cache_bytes=cache_bytes, use_mmap=use_mmap, engine=engine)
+		if engine is not None and engine != self._storage.engine:
+			self._storage.close()
+			raise ValueError('Database was created with the %r engine, not %r' % (self._storage.engine, engine))
+		if self._storage.engine == ENGINE_BPLUS:
+			self._tree = BPlusTree(self._storage)
+		else:
+			self._tree = BinaryTree(self._storage)
 
 	def _assert_not_closed(self):
 		"""
@@ -1221,23 +2175,116 @@ class DBDB(object):
 			return
 		return self._tree.set(key, value)
 
+	def get_many(self, keys):
+		"""
+		Get the values of several keys at once, as a dictionary from key to value. Missing keys are left out.
+		The keys are looked up in key order, so the index pages they share are read once, and then the values
+		are read in the order they sit in the file.
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> dbdb.set('1', 'a')
+		>>> dbdb.set('2', 'b')
+		>>> dbdb.get_many(['2', '3', '1']) == {'1': 'a', '2': 'b'}
+		True
+		>>> DB.remove('test.dbdb')
+		"""
+		self._assert_not_closed()
+		value_refs = []
+		for key in sorted(set(keys), key=normalize_key):
+			try:
+				value_refs.append((key, self._tree._value_ref(key)))
+			except KeyError:
+				pass
+		value_refs.sort(key=lambda pair: pair[1].address)
+		return {key: value_ref.get(self._storage) for key, value_ref in value_refs}
+
+	def bulk_load(self, pairs):
+		"""
+		Replace the tree with a balanced tree built from (key, value) pairs sorted by key, and commit it
+		"""
+		self._assert_not_closed()
+		return self._tree.bulk_load(pairs)
+
+	def range(self, lo=None, hi=None, reverse=False, limit=None):
+		"""
+		Lazily iterate over the (key, value) pairs with lo <= key <= hi in the tree
+		"""
+		self._assert_not_closed()
+		return self._tree.range(lo, hi, reverse=reverse, limit=limit)
+
+	def cache_stats(self):
+		"""
+		Returns the hit, miss and eviction counters of the node cache, along with its current size.
+
+		>>> dbdb = DB.connect('test.dbdb')
+		>>> dbdb.set('1', '2')
+		>>> dbdb.commit()
+		>>> dbdb.get('1')
+		'2'
+		>>> dbdb.cache_stats()['misses']
+		1
+		>>> DB.remove('test.dbdb')
+		"""
+		return self._storage.node_cache.stats()
+
 import os
 class DB(object):
 	"""
 	Class that connects to the db (filename) and returns a DBDB object that has both the tree and its 
 	associated storage.
 	"""
-	def connect(dbname):
-		# BASE_PATH = ""
-		BASE_PATH = "/home/www/DB/"
+	# BASE_PATH = ""
+	BASE_PATH = "/home/www/DB/"
+
+	def connect(dbname, cache_bytes=Storage.NODE_CACHE_BYTES, use_mmap=False, engine=None):
 		try:
-			f = open(BASE_PATH + dbname, 'r+b')
+			f = open(DB.path(dbname), 'r+b')
 		except IOError:
-			fd = os.open(BASE_PATH + dbname, os.O_RDWR | os.O_CREAT)
+			fd = os.open(DB.path(dbname), os.O_RDWR | os.O_CREAT)
 			f = os.fdopen(fd, 'r+b')
-		return DBDB(f)
+		return DBDB(f, cache_bytes=cache_bytes, use_mmap=use_mmap, engine=engine)
 
 	def remove(dbname):
-		# BASE_PATH = ""
-		BASE_PATH = "/home/www/DB/"
-		os.remove(BASE_PATH + dbname)
+		os.remove(DB.path(dbname))
+
+	def rename(dbname, newname):
+		"""
+		Renames the file of a database in one atomic step, replacing the file of newname if there is one.
+		Handles that are open on the replaced file keep reading it as it was.
+		"""
+		os.replace(DB.path(dbname), DB.path(newname))
+
+	def convert_keys(dbname, convert=float):
+		"""
+		Rewrites a database with convert applied to all its keys, for files written before numeric keys were
+		supported, whose numbers are string keys. The new file is written aside and renamed over the old one.
+		Returns the number of keys.
+		"""
+		oldDB = DB.connect(dbname)
+		try:
+			engine = oldDB._storage.engine
+			pairs = sorted((normalize_key(convert(key)), value) for key, value in oldDB.range())
+		finally:
+			oldDB.close()
+		newname = dbname + '.converted'
+		if DB.exists(newname):
+			DB.remove(newname)
+		newDB = DB.connect(newname, engine=engine)
+		try:
+			newDB.bulk_load(pairs)
+		finally:
+			newDB.close()
+		DB.rename(newname, dbname)
+		return len(pairs)
+
+	def path(dbname):
+		"""
+		Returns the path of the file of a database, which lives in BASE_PATH.
+		"""
+		return DB.BASE_PATH + dbname
+
+	def exists(dbname):
+		"""
+		Returns True if the file of a database exists. Unlike connect, this does not create it.
+		"""
+		return os.path.exists(DB.path(dbname))
@@ -7,17 +7,25 @@ from WrappedDB import *
 class FileStorageManager(StorageManagerInterface):
 	"""
 	File Storage Manager class. This class stores 2-d numpy arrays as 64 bit floats for the times and the values of the TimeSeries onto the disk.
-	Essentially we wrote our own encode function in WrappedDB that encodes TimeSeries objects in their String representations before storing them.
+	Essentially we wrote our own encode function in WrappedDB that encodes TimeSeries objects as binary float64 arrays before storing them.
 	"""
 
-	def __init__(self):
+	def __init__(self, backend='files', shards=1, cache_size=10, cache_policy='lfu', cache_bytes=None, features=None):
 		"""
 		Initializes a FileStorageManager instance with a filename to store entries to disk.
 		Cache size can be changed in initializing WrappedDB.
 
 		Parameters
 		----------
-		None
+		backend: 'files' to store every time series in its own file (WrappedDB), or 'single' to store them
+			all in a few shard files (SingleFileDB). Call close when done with a 'single' store.
+		shards: Number of shard files of the 'single' backend
+		cache_size: Number of time series to cache
+		cache_policy: 'lfu' or 'lru'
+		cache_bytes: If set, bounds the cache by bytes of time series data instead of by cache_size
+		features: Function from a time series to a dictionary of numpy arrays derived from it, such as its
+			spectrum. If set, the features are computed once when a time series is stored and kept next to it,
+			so that they can be read back with get_features instead of being computed again.
 
 		Returns
 		-------
@@ -28,7 +36,14 @@ class FileStorageManager(StorageManagerInterface):
 		<class 'FileStorageManager.FileStorageManager'>
 		"""
 		# This cache size can be changed. 10 is the default.
-		self.db = WrappedDB(cacheSize=10)
+		if backend == 'files':
+			self.db = WrappedDB(cacheSize=cache_size, cachePolicy=cache_policy, cacheBytes=cache_bytes,
+				featureFunc=features)
+		elif backend == 'single':
+			self.db = SingleFileDB(cacheSize=cache_size, shards=shards, cachePolicy=cache_policy, cacheBytes=cache_bytes,
+				featureFunc=features)
+		else:
+			raise ValueError('Unknown backend ' + str(backend))
 
 	def store(self, timeSeries, key=None):
 		"""
@@ -111,3 +126,129 @@ class FileStorageManager(StorageManagerInterface):
 		>>> DB.remove("ts_" + str(key) + ".dbdb")
 		"""
 		return self.db.getTimeSeries(key=key)
+
+	def store_many(self, series_by_key):
+		"""
+		Stores several instances of SizedContainerTimeSeriesInterface at once. With the 'single' backend,
+		each shard is written and committed once for the whole batch.
+		
+		Parameters
+		----------
+		series_by_key: Dictionary from string or int key to time series, or a list of time series to store
+			under generated keys
+		
+		Returns
+		-------
+		List of the keys of the time series, in order
+
+		>>> fsm = FileStorageManager()
+		>>> fsm.store_many({"1": TimeSeries(values=[1, 2]), 2: TimeSeries(values=[3])})
+		['1', '2']
+		>>> DB.remove("ts_1.dbdb"); DB.remove("ts_2.dbdb")
+		"""
+		return self.db.storeManyTimeSeries(series_by_key)
+
+	def get_many(self, keys, as_matrix=False):
+		"""
+		Returns the time series of several keys at once. Instead of one lookup per key, the keys that are not
+		cached are read in one batch, sorted by shard and by offset in the file with the 'single' backend.
+		
+		Parameters
+		----------
+		keys: List of string or int keys
+		as_matrix: If True, return the times and values as two stacked matrices instead of time series.
+			The time series must all exist and have the same length. This skips building TimeSeries
+			and their lists, which copy every element, and is the fast way to read many time series.
+		
+		Returns
+		-------
+		List of time series in the order of keys, with None for keys that do not exist, or a tuple of (times, values)
+		float64 numpy arrays of shape (len(keys), length) if as_matrix is True
+
+		>>> fsm = FileStorageManager()
+		>>> keys = fsm.store_many([TimeSeries(values=[1, 2]), TimeSeries(values=[3, 4])])
+		>>> times, values = fsm.get_many(keys, as_matrix=True)
+		>>> values.shape
+		(2, 2)
+		>>> for key in keys: DB.remove("ts_" + key + ".dbdb")
+		"""
+		if as_matrix:
+			return self.db.getManyTimeSeriesArrays(keys)
+		return self.db.getManyTimeSeries(keys)
+
+	def get_features(self, key):
+		"""
+		Returns the features of the time series at key, computed by the features function when it was stored.
+		
+		Parameters
+		----------
+		key: String or int key
+		
+		Returns
+		-------
+		Dictionary from feature name to numpy array, or None if there is no time series at key
+
+		>>> fsm = FileStorageManager(features=lambda ts: {'mean': np.mean(ts.values())})
+		>>> key = fsm.store(timeSeries=TimeSeries(values=[1, 2, 3]), key="1")
+		>>> float(fsm.get_features(key)['mean'])
+		2.0
+		>>> DB.remove("ts_1.dbdb")
+		"""
+		return self.db.getFeatures(key)
+
+	def get_many_features(self, keys, as_matrix=False):
+		"""
+		Returns the features of several time series at once. Features are read lazily, only when asked for,
+		and in one batch.
+		
+		Parameters
+		----------
+		keys: List of string or int keys
+		as_matrix: If True, stack every feature of all keys into one array, with one row per key.
+			The time series must all exist.
+		
+		Returns
+		-------
+		List of feature dictionaries in the order of keys, with None for keys that do not exist, or a dictionary
+		from feature name to the stacked array if as_matrix is True
+
+		>>> fsm = FileStorageManager(features=lambda ts: {'values': np.asarray(ts.values())})
+		>>> keys = fsm.store_many({"1": TimeSeries(values=[1, 2]), "2": TimeSeries(values=[3, 4])})
+		>>> fsm.get_many_features(["2", "1"], as_matrix=True)['values']
+		array([[3, 4],
+		       [1, 2]])
+		>>> DB.remove("ts_1.dbdb"); DB.remove("ts_2.dbdb")
+		"""
+		featuresList = self.db.getManyFeatures(keys)
+		if not as_matrix:
+			return featuresList
+		for key, features in zip(keys, featuresList):
+			if features is None:
+				raise KeyError(key)
+		if not featuresList:
+			return {}
+		return {name: np.stack([features[name] for features in featuresList]) for name in featuresList[0]}
+
+	def close(self):
+		"""
+		Closes the files kept open by the store.
+
+		>>> fsm = FileStorageManager(backend='single')
+		>>> key = fsm.store(timeSeries=TimeSeries(values=[1, 2], times=[0, 1]), key="1")
+		>>> fsm.close()
+		>>> DB.remove("tsstore_0.dbdb")
+		"""
+		self.db.close()
+
+	def cache_stats(self):
+		"""
+		Returns the hit, miss and eviction counters of the time series cache, along with its current
+		number of entries and size.
+
+		>>> fsm = FileStorageManager()
+		>>> fsm.get("2") is None
+		True
+		>>> fsm.cache_stats() == {'hits': 0, 'misses': 1, 'evictions': 0, 'entries': 0, 'bytes': 0}
+		True
+		"""
+		return self.db.cacheStats()
@@ -1,9 +1,15 @@
 from DB import DB
+from Cache import LFUCache, LRUCache
 import time
 import random
 import os
 import sys
 import operator
+import struct
+import zlib
+import io
+
+import numpy as np
 
 sys.path.append('../MS1/'); 
 from SizedContainerTimeSeriesInterface import SizedContainerTimeSeriesInterface
@@ -24,13 +30,18 @@ class WrappedDB:
 	Wraps the DB.py file which contains lab 10 code.
 	"""
 
-	def __init__(self, cacheSize=10):
+	def __init__(self, cacheSize=10, cachePolicy='lfu', cacheBytes=None, featureFunc=None):
 		"""
 		Initializes a WrappedDB instance with a filename and cache size to store entries to disk.
 
 		Parameters
 		----------
 		cacheSize: The number of time series to cache. If set to 0, no caching will be implemented.
+		cachePolicy: 'lfu' to evict the least frequently used time series first, or 'lru' for the least recently used
+		cacheBytes: If set, the cache is bounded by the bytes of time series data it holds (16 bytes per point)
+			instead of by cacheSize.
+		featureFunc: Function from a time series to a dictionary of numpy arrays derived from it. If set, the
+			features of every time series are computed when it is stored, and kept next to it (see getFeatures).
 
 		Returns
 		-------
@@ -42,8 +53,17 @@ class WrappedDB:
 		"""
 		# These variables are used for caching
 		self.cacheSize = cacheSize
-		self.cache = {} # key to TimeSeries dictionary cache
-		self.keyToCount = {} # key to number of times TimeSeries has been retrieved
+		self.cacheBytes = cacheBytes
+		budget = cacheSize if cacheBytes is None else cacheBytes
+		if cachePolicy == 'lfu':
+			self.cache = LFUCache(max_bytes=budget) # key to TimeSeries cache
+			self.featureCache = LFUCache(max_bytes=budget) # key to features cache
+		elif cachePolicy == 'lru':
+			self.cache = LRUCache(max_bytes=budget)
+			self.featureCache = LRUCache(max_bytes=budget)
+		else:
+			raise ValueError('Unknown cache policy ' + str(cachePolicy))
+		self.featureFunc = featureFunc
 
 	def _fileNameForKey(self, key):
 		"""
@@ -83,13 +103,13 @@ class WrappedDB:
 			raise ValueError('Input class is not time series')
 		if (key is None):
 			# Generate our own key which is current time stamp and a random number from 0 to 999
-			key = "{0}-{1}".format(str(time.time())[:10], random.randint(0,9999))
+			key = self._generateKey()
 			# Check if the autogenerated key was already in the database:
 			if (self.getTimeSeriesSize(key) != -1):
 				# Generate random keys until we find a key that is not in the database:
 				while (True):
-					key = "{0}-{1}".format(str(time.time())[:10], random.randint(0,9999))
-					if (self.getTimeSeriesSize(key == -1)):
+					key = self._generateKey()
+					if (self.getTimeSeriesSize(key) == -1):
 						# Unique key found:
 							break
 
@@ -99,12 +119,7 @@ class WrappedDB:
 		else:
 			key = str(key)
 			
-		# Create a new file from the key
-		filename = self._fileNameForKey(key)
-		newDB = DB.connect(filename)
-		newDB.set("timeseries", self._encode(timeSeries))
-		newDB.set("size", str(len(timeSeries)))
-		newDB.commit()
+		self._storeEncoded(key, self._encode(timeSeries), len(timeSeries), self._computeFeatures(timeSeries))
 		return key
 
 	# Get the size of the time series' from its key
@@ -131,78 +146,177 @@ class WrappedDB:
 		-1
 		"""
 
-		# Read the file from this key
-		filename = self._fileNameForKey(key)
-		existingDB = DB.connect(filename)
-		try:
-			size = existingDB.get("size")
-		except KeyError:
-			# Timeseries does not exist, delete the filename
-			DB.remove(filename)
+		size = self._loadSize(str(key))
+		if size is None:
 			return - 1
-		return int(existingDB.get("size"))
+		return int(size)
 
 	"""
 	Logic for our cache:
-	- We cache our top k time series that are accessed (get) the most.
-	- We store keyToCounts and cache dicts in memory.
-	- Whenever a user calls getTimeSeries, we increment the keyToCounts for that key, 
-	and update the cache if this time series being called has now been called more 
-	than the least called time series in the cache.
+	- Time series returned by getTimeSeries are kept in an LFUCache (or LRUCache), keyed by their key.
+	- Both caches do gets and puts in O(1), and only keep counts for the keys they hold.
+	- Entries have a size of 1 against a budget of cacheSize, or their size in bytes against cacheBytes.
 	"""
 
-	def _keyIsInTopCached(self, key):
+	def _cacheEntrySize(self, timeSeries):
 		"""
-		Helper function that returns true if key is in top k cached counts
+		Helper function that returns the size a time series counts for against the cache budget.
+		"""
+		if self.cacheBytes is None:
+			return 1
+		return 16 * len(timeSeries)
+
+	def _featuresEntrySize(self, features):
+		"""
+		Helper function that returns the size the features of a time series count for against the cache budget.
+		"""
+		if self.cacheBytes is None:
+			return 1
+		return sum(array.nbytes for array in features.values())
+
+	def cacheStats(self):
+		"""
+		Returns the hit, miss and eviction counters of the time series cache, along with its current size.
+
+		>>> wdb = WrappedDB()
+		>>> wdb.getTimeSeries("2") is None
+		True
+		>>> wdb.cacheStats()['misses']
+		1
+		"""
+		return self.cache.stats()
+
+	def _generateKey(self):
+		"""
+		Private helper function that returns a random key: the current time stamp and a random number from 0 to 9999.
+		"""
+		return "{0}-{1}".format(str(time.time())[:10], random.randint(0,9999))
+
+	def storeManyTimeSeries(self, timeSeriesByKey):
+		"""
+		Stores several instances of SizedContainerTimeSeriesInterface at once.
+		Nothing is stored if any of them is not a time series or any key is already in the database.
 		
 		Parameters
 		----------
-		key: String or int of the key index of the SizedContainerTimeSeriesInterface
+		timeSeriesByKey: Dictionary from string or int key to time series, or a list of time series to store
+			under randomly generated keys
 		
 		Returns
 		-------
-		True if key is in top k cached counts, False otherwise
+		List of the string keys, in the order of timeSeriesByKey
+
+		>>> wdb = WrappedDB()
+		>>> keys = wdb.storeManyTimeSeries({"1": TimeSeries(values=[1, 2]), "2": TimeSeries(values=[3])})
+		>>> keys
+		['1', '2']
+		>>> wdb.getTimeSeriesSize("2")
+		1
+		>>> DB.remove('ts_1.dbdb'); DB.remove('ts_2.dbdb')
 		"""
-		topk_keys = sorted(self.keyToCount, key=self.keyToCount.get, reverse=True)[:self.cacheSize]
-		# Also make sure that the key is ACTUALLY in the cache
-		return (key in topk_keys) and (key in self.cache)
+		if isinstance(timeSeriesByKey, dict):
+			keys = [str(key) for key in timeSeriesByKey]
+			timeSeriesList = list(timeSeriesByKey.values())
+			if len(set(keys)) != len(keys):
+				raise ValueError("Keys are duplicated")
+			if self._existingKeys(keys):
+				raise ValueError("Key is already in Database")
+		else:
+			timeSeriesList = list(timeSeriesByKey)
+			keys = []
+			# Keep generating keys for what is left, dropping the ones already taken by the database or this batch
+			while len(keys) < len(timeSeriesList):
+				candidates = set(self._generateKey() for _ in range(len(timeSeriesList) - len(keys)))
+				candidates.difference_update(keys)
+				candidates.difference_update(self._existingKeys(list(candidates)))
+				keys.extend(candidates)
+		for timeSeries in timeSeriesList:
+			if not isinstance(timeSeries, SizedContainerTimeSeriesInterface):
+				raise ValueError('Input class is not time series')
+		self._storeEncodedMany([(key, self._encode(timeSeries), len(timeSeries), self._computeFeatures(timeSeries))
+			for key, timeSeries in zip(keys, timeSeriesList)])
+		return keys
 
-	def _refreshCache(self, key, timeSeries):
+	def getManyTimeSeries(self, keys):
 		"""
-		Adds time series to the cache, and replace timeseries in the cache if necessary according 
-		to logic stated above.
+		Returns the time series of several keys at once. Cached time series are taken from the cache, and the
+		others are read from disk in one batch, which the storage can order to read them sequentially.
 		
 		Parameters
 		----------
-		key: String or int of the key index of the SizedContainerTimeSeriesInterface
-		timeSeries: Concrete class of SizedContainerTimeSeriesInterface
+		keys: List of string or int keys
 		
 		Returns
 		-------
-		None
+		List of TimeSeries in the order of keys, with None for keys that do not exist
+
+		>>> wdb = WrappedDB()
+		>>> keys = wdb.storeManyTimeSeries({"1": TimeSeries(values=[1, 2]), "2": TimeSeries(values=[3])})
+		>>> [ts.values() if ts else None for ts in wdb.getManyTimeSeries(["2", "3", "1"])]
+		[[3.0], None, [1.0, 2.0]]
+		>>> DB.remove('ts_1.dbdb'); DB.remove('ts_2.dbdb')
 		"""
-		topk_keys = sorted(self.keyToCount, key=self.keyToCount.get, reverse=True)[:self.cacheSize]
-		currentKeyCount = self.keyToCount[key] + 1 if key in self.keyToCount else 1
-		self.keyToCount[key] = currentKeyCount
+		keys = [str(key) for key in keys]
+		found = {}
+		missing = []
+		for key in keys:
+			timeSeries = self.cache.get(key)
+			if timeSeries is None:
+				missing.append(key)
+			else:
+				found[key] = timeSeries
+		for key, encodedTimeSeries in self._loadEncodedMany(missing).items():
+			timeSeries = self._decode(encodedTimeSeries)
+			self.cache.put(key, timeSeries, self._cacheEntrySize(timeSeries))
+			found[key] = timeSeries
+		return [found.get(key) for key in keys]
 
-		if len(topk_keys) < self.cacheSize:
-			# There are less keys in cache than cache size, just store
-			self.cache[key] = timeSeries
-			return
+	def getManyTimeSeriesArrays(self, keys):
+		"""
+		Returns the times and the values of several time series of the same length as two stacked matrices,
+		one row per key. Time series read from disk are copied once, from read-only views over their
+		bytes straight into the matrices, without building TimeSeries objects or lists of floats.
+		Raises KeyError if a key does not exist, and ValueError if the lengths are not all the same.
 		
-		# Find all the counts in cache, and get the min one
-		minKey = ''
-		minCount = sys.maxsize
-		for k in self.cache:
-			if self.keyToCount[k] < minCount:
-				minCount = self.keyToCount[k]
-				minKey = k
-
-		# Check if the min key's count is less than currentKeyCount
-		if currentKeyCount > minCount and not key in self.cache: 
-			# Replace the minkey
-			del self.cache[minKey]
-			self.cache[key] = timeSeries
+		Parameters
+		----------
+		keys: List of string or int keys
+		
+		Returns
+		-------
+		Tuple of (times, values) float64 numpy arrays of shape (len(keys), length)
+
+		>>> wdb = WrappedDB()
+		>>> keys = wdb.storeManyTimeSeries({"1": TimeSeries(values=[1, 2]), "2": TimeSeries(values=[3, 4])})
+		>>> times, values = wdb.getManyTimeSeriesArrays(["2", "1"])
+		>>> values
+		array([[3., 4.],
+		       [1., 2.]])
+		>>> DB.remove('ts_1.dbdb'); DB.remove('ts_2.dbdb')
+		"""
+		keys = [str(key) for key in keys]
+		arrays = {}
+		missing = []
+		for key in keys:
+			timeSeries = self.cache.get(key)
+			if timeSeries is None:
+				missing.append(key)
+			else:
+				arrays[key] = (timeSeries.times(), timeSeries.values())
+		for key, encodedTimeSeries in self._loadEncodedMany(missing).items():
+			if isinstance(encodedTimeSeries, str):
+				timeSeries = self._decodeString(encodedTimeSeries)
+				arrays[key] = (timeSeries.times(), timeSeries.values())
+			else:
+				arrays[key] = self._decodeArrays(encodedTimeSeries)
+		for key in keys:
+			if key not in arrays:
+				raise KeyError(key)
+		if len(set(len(arrays[key][1]) for key in keys)) > 1:
+			raise ValueError('Time series have different lengths')
+		times = np.array([arrays[key][0] for key in keys], dtype=self.SERIES_DTYPE)
+		values = np.array([arrays[key][1] for key in keys], dtype=self.SERIES_DTYPE)
+		return times, values
 
 	# Gets a time series object by key from the DB
 	# Returns None when time series key does not exist
@@ -235,30 +349,230 @@ class WrappedDB:
 		"""
 		key = str(key)
 
-		timeSeries = None
 		# First check if time series at this key is cached
-		if self._keyIsInTopCached(key):
-			# Get from cache
-			timeSeries = self.cache[key]
-			self._refreshCache(key, timeSeries)
+		timeSeries = self.cache.get(key)
+		if timeSeries is not None:
 			return timeSeries
 
-		# Grab the file as it is not in cache
-		filename = self._fileNameForKey(key)
-		try:
-			existingDB = DB.connect(filename)
-			timeSeriesString = existingDB.get("timeseries")
-		except KeyError:
-			DB.remove(filename)
+		# Grab the time series from disk as it is not in cache
+		timeSeriesString = self._loadEncoded(key)
+		if timeSeriesString is None:
 			return None
 
 		timeSeries = self._decode(timeSeriesString)
-		self._refreshCache(key, timeSeries)
+		self.cache.put(key, timeSeries, self._cacheEntrySize(timeSeries))
 		return timeSeries
 
+	def getFeatures(self, key):
+		"""
+		Returns the features of the time series at key, as computed by featureFunc when it was stored.
+
+		Parameters
+		----------
+		key: String or int key
+
+		Returns
+		-------
+		Dictionary from feature name to numpy array, or None if there is no time series at key
+
+		>>> wdb = WrappedDB(featureFunc=lambda ts: {'total': np.sum(ts.values())})
+		>>> key = wdb.storeKeyAndTimeSeries(key="1", timeSeries=TimeSeries(values=[1, 2, 3]))
+		>>> wdb.getFeatures("1")['total']
+		array(6)
+		>>> DB.remove('ts_1.dbdb')
+		"""
+		return self.getManyFeatures([key])[0]
+
+	def getManyFeatures(self, keys):
+		"""
+		Returns the features of several time series at once. Features are only read from disk when asked
+		for, in one batch, and are cached apart from the time series.
+		Time series stored without features (before featureFunc was set) get them computed from the time
+		series and stored, when featureFunc is set.
+
+		Parameters
+		----------
+		keys: List of string or int keys
+
+		Returns
+		-------
+		List of feature dictionaries in the order of keys, with None for keys that have none
+		"""
+		keys = [str(key) for key in keys]
+		found = {}
+		missing = []
+		for key in keys:
+			features = self.featureCache.get(key)
+			if features is None:
+				missing.append(key)
+			else:
+				found[key] = features
+		encodedFeatures = self._loadFeaturesMany(missing)
+
+		# Fill in the features of time series stored without them
+		if self.featureFunc is not None:
+			withoutFeatures = [key for key in set(missing) if key not in encodedFeatures]
+			filledIn = []
+			for key, timeSeries in zip(withoutFeatures, self.getManyTimeSeries(withoutFeatures)):
+				if timeSeries is not None:
+					filledIn.append((key, self._computeFeatures(timeSeries)))
+			self._storeFeaturesMany(filledIn)
+			encodedFeatures.update(filledIn)
+
+		for key, encoded in encodedFeatures.items():
+			features = self._decodeFeatures(encoded)
+			self.featureCache.put(key, features, self._featuresEntrySize(features))
+			found[key] = features
+		return [found.get(key) for key in keys]
+
+	def _computeFeatures(self, timeSeries):
+		"""
+		Private helper function that returns the encoded features of a time series, or None without featureFunc.
+		"""
+		if self.featureFunc is None:
+			return None
+		return self._encodeFeatures(self.featureFunc(timeSeries))
+
+	def _encodeFeatures(self, features):
+		"""
+		Takes in a dictionary from name to numpy array and transforms it into bytes (the numpy .npz format).
+
+		>>> wdb = WrappedDB()
+		>>> wdb._decodeFeatures(wdb._encodeFeatures({'a': np.arange(3)}))['a']
+		array([0, 1, 2])
+		"""
+		buffer = io.BytesIO()
+		np.savez(buffer, **features)
+		return buffer.getvalue()
+
+	def _decodeFeatures(self, encodedFeatures):
+		"""
+		Takes in features encoded by _encodeFeatures and returns the dictionary from name to numpy array.
+		"""
+		with np.load(io.BytesIO(encodedFeatures)) as arrays:
+			return {name: arrays[name] for name in arrays.files}
+
+	"""
+	Storage hooks. Every read and write of the disk goes through these, so that SingleFileDB
+	only has to override them to change where time series are kept.
+	Here every time series gets its own file, which is opened and closed on every call.
+	"""
+
+	def _storeEncoded(self, key, encodedTimeSeries, size, encodedFeatures=None):
+		"""
+		Writes an encoded time series, its size and its encoded features, if any, under key.
+		"""
+		newDB = DB.connect(self._fileNameForKey(key))
+		try:
+			newDB.set("timeseries", encodedTimeSeries)
+			newDB.set("size", str(size))
+			if encodedFeatures is not None:
+				newDB.set("features", encodedFeatures)
+			newDB.commit()
+		finally:
+			newDB.close()
+
+	def _loadField(self, key, field):
+		"""
+		Reads a field of the file for key, or returns None (and deletes the file that connecting
+		just created) if there is no time series at key.
+		"""
+		filename = self._fileNameForKey(key)
+		existingDB = DB.connect(filename)
+		try:
+			return existingDB.get(field)
+		except KeyError:
+			pass
+		finally:
+			existingDB.close()
+		DB.remove(filename)
+		return None
+
+	def _loadSize(self, key):
+		"""
+		Returns the size string stored under key, or None if there is no time series at key.
+		"""
+		return self._loadField(key, "size")
+
+	def _loadEncoded(self, key):
+		"""
+		Returns the encoded time series stored under key, or None if there is no time series at key.
+		"""
+		return self._loadField(key, "timeseries")
+
+	def _existingKeys(self, keys):
+		"""
+		Returns the keys, out of keys, that have a time series.
+		"""
+		return [key for key in keys if self._loadSize(key) is not None]
+
+	def _storeEncodedMany(self, encodedTimeSeries):
+		"""
+		Writes a list of (key, encoded time series, size, encoded features or None) tuples.
+		"""
+		for key, encoded, size, features in encodedTimeSeries:
+			self._storeEncoded(key, encoded, size, features)
+
+	def _storeFeaturesMany(self, encodedFeatures):
+		"""
+		Adds a list of (key, encoded features) pairs to time series that are already stored.
+		"""
+		for key, features in encodedFeatures:
+			existingDB = DB.connect(self._fileNameForKey(key))
+			try:
+				existingDB.set("features", features)
+				existingDB.commit()
+			finally:
+				existingDB.close()
+
+	def _loadFeaturesMany(self, keys):
+		"""
+		Returns a dictionary from key to encoded features for the keys, out of keys, that have them.
+		Missing files are not created, and a file without features is left as it is.
+		"""
+		encodedFeatures = {}
+		for key in sorted(set(keys), key=self._fileNameForKey):
+			filename = self._fileNameForKey(key)
+			if not DB.exists(filename):
+				continue
+			existingDB = DB.connect(filename)
+			try:
+				encodedFeatures[key] = existingDB.get("features")
+			except KeyError:
+				pass
+			finally:
+				existingDB.close()
+		return encodedFeatures
+
+	def _loadEncodedMany(self, keys):
+		"""
+		Returns a dictionary from key to encoded time series for the keys, out of keys, that have one.
+		Files are read in name order.
+		"""
+		encodedTimeSeries = {}
+		for key in sorted(set(keys), key=self._fileNameForKey):
+			encoded = self._loadEncoded(key)
+			if encoded is not None:
+				encodedTimeSeries[key] = encoded
+		return encodedTimeSeries
+
+	def close(self):
+		"""
+		Closes any file kept open by the store. Files are not kept open here, so this does nothing.
+		"""
+		pass
+
+	# Header of binary encoded time series: magic, numpy dtype string of the arrays and number of points.
+	# It is followed by the times array and then the values array.
+	SERIES_MAGIC = b'TSv1'
+	SERIES_DTYPE = np.dtype('<f8')
+	SERIES_HEADER = struct.Struct("<4s3sxQ")
+
 	def _encode(self, timeSeries):
 		"""
-		Takes in time series object and transforms it into a string.
+		Takes in time series object and transforms it into bytes: a SERIES_HEADER, then the times
+		and the values as contiguous little-endian float64 arrays.
+		Time series without times are stored with their indexes as times.
 		
 		Parameters
 		----------
@@ -266,30 +580,70 @@ class WrappedDB:
 		
 		Returns
 		-------
-		String representation of time series object, where each time and value is encoded in 
-		"(t,v)" and separated with ";"
+		Bytes of length 16 + 16 * len(timeSeries)
 
 		>>> wdb = WrappedDB()
 		>>> ts = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
-		>>> wdb._encode(ts)
-		'(1,0);(1.5,2);(2,-1);(2.5,0.5);(10,0)'
+		>>> encoded = wdb._encode(ts)
+		>>> encoded[:8], len(encoded)
+		(b'TSv1<f8\\x00', 96)
 		"""
-		items = timeSeries.items()
-		encodedTimeSeries = []
-		for (time, value) in items:
-			encodedTimeSeries.append("(" + str(time) + "," + str(value) + ")")
-		return ';'.join(encodedTimeSeries)
+		values = np.asarray(timeSeries.values(), dtype=self.SERIES_DTYPE)
+		times = timeSeries.times()
+		if times is None:
+			times = np.arange(len(values), dtype=self.SERIES_DTYPE)
+		else:
+			times = np.asarray(times, dtype=self.SERIES_DTYPE)
+		header = self.SERIES_HEADER.pack(self.SERIES_MAGIC, self.SERIES_DTYPE.str.encode('ascii'), len(values))
+		return header + times.tobytes() + values.tobytes()
+
+	def _decodeArrays(self, encodedTimeSeries):
+		"""
+		Takes in a binary encoded time series and returns its (times, values) arrays.
+		The arrays are read-only views over encodedTimeSeries, nothing is copied.
+		Raises ValueError when the input is malformed.
+
+		Parameters
+		----------
+		encodedTimeSeries: Bytes or memoryview made by _encode
+
+		Returns
+		-------
+		Tuple of float64 numpy arrays (times, values)
+
+		>>> wdb = WrappedDB()
+		>>> times, values = wdb._decodeArrays(wdb._encode(TimeSeries(values=[3, 4], times=[1, 2])))
+		>>> values
+		array([3., 4.])
+		"""
+		if len(encodedTimeSeries) < self.SERIES_HEADER.size:
+			raise ValueError('Time series bytes are malformed')
+		magic, dtype, length = self.SERIES_HEADER.unpack_from(encodedTimeSeries, 0)
+		if magic != self.SERIES_MAGIC:
+			raise ValueError('Time series bytes are malformed')
+		dtype = np.dtype(dtype.decode('ascii'))
+		if len(encodedTimeSeries) != self.SERIES_HEADER.size + 2 * length * dtype.itemsize:
+			raise ValueError('Time series bytes are malformed')
+		times = np.frombuffer(encodedTimeSeries, dtype=dtype, count=length, offset=self.SERIES_HEADER.size)
+		values = np.frombuffer(encodedTimeSeries, dtype=dtype, count=length,
+			offset=self.SERIES_HEADER.size + length * dtype.itemsize)
+		return times, values
 
 	# Takes in encoded time series and transforms it into a TimeSeries object
 	# Raise ValueError whenever improper
 	def _decode(self, encodedTimeSeries):
 		"""
-		Takes in time series string and transforms it into a time series object.
-		Raises ValueError when the input string is malformed.
+		Takes in an encoded time series and transforms it into a time series object.
+		Both the binary encoding made by _encode and the "(t,v);" strings of older files are read.
+		Raises ValueError when the input is malformed.
+		This is not zero-copy: a TimeSeries holds its times and values as lists, so every element is
+		copied into a Python float. Only _decodeArrays is zero-copy, and getManyTimeSeriesArrays
+		(get_many(as_matrix=True) of FileStorageManager) copies each series once, straight from those
+		views into the stacked matrices.
 		
 		Parameters
 		----------
-		String representation of time series object, where each time and value is encoded in 
+		Bytes or memoryview made by _encode, or a string where each time and value is encoded in
 		"(t,v)" and separated with ";"
 		
 		Returns
@@ -298,10 +652,32 @@ class WrappedDB:
 
 		>>> wdb = WrappedDB()
 		>>> ts = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
-		>>> encodedString = wdb._encode(ts)
-		>>> wdb._decode(encodedString)
+		>>> wdb._decode(wdb._encode(ts))
+		TimeSeries([(1.0, 0.0), (1.5, 2.0), (2.0, -1.0), (2.5, 0.5), (10.0, 0.0)])
+		>>> wdb._decode('(1,0);(1.5,2);(2,-1);(2.5,0.5);(10,0)')
 		TimeSeries([(1.0, 0.0), (1.5, 2.0), (2.0, -1.0), (2.5, 0.5), (10.0, 0.0)])
 		"""
+		if isinstance(encodedTimeSeries, str):
+			return self._decodeString(encodedTimeSeries)
+		times, values = self._decodeArrays(encodedTimeSeries)
+		# Copies the views into lists, as TimeSeries returns its times and values as lists
+		return TimeSeries(values=values.tolist(), times=times.tolist())
+
+	def _decodeString(self, encodedTimeSeries):
+		"""
+		Takes in a time series string, as written by older versions of _encode, and transforms it into
+		a time series object.
+		Raises ValueError when the input string is malformed.
+		
+		Parameters
+		----------
+		String representation of time series object, where each time and value is encoded in 
+		"(t,v)" and separated with ";"
+		
+		Returns
+		-------
+		timeSeries: TimeSeries class
+		"""
 		itemStrings = encodedTimeSeries.split(';')
 		t = []
 		v = []
@@ -325,3 +701,174 @@ class WrappedDB:
 
 		z = TimeSeries(values=v, times=t)
 		return z
+
+class SingleFileDB(WrappedDB):
+	"""
+	WrappedDB that keeps all time series in a few shard files instead of one file per time series.
+	Each shard is a B+tree DBDB from key to encoded time series, so a lookup reads a few (usually cached)
+	index pages and then the time series at its offset. Keys are spread over the shards by a hash of the key.
+	A shard is opened the first time it is used and stays open until close is called, so opening the
+	store costs nothing however many time series it holds, and only one file descriptor is used per shard.
+	"""
+
+	def __init__(self, cacheSize=10, shards=1, prefix="tsstore", cachePolicy='lfu', cacheBytes=None, featureFunc=None):
+		"""
+		Initializes a SingleFileDB instance.
+
+		Parameters
+		----------
+		cacheSize: The number of time series to cache. If set to 0, no caching will be implemented.
+		cachePolicy, cacheBytes, featureFunc: See WrappedDB
+		shards: Number of data files to spread the time series over
+		prefix: Prefix of the data file names, which are <prefix>_<shard>.dbdb
+
+		Returns
+		-------
+		None
+
+		>>> sdb = SingleFileDB(shards=2)
+		>>> sdb.fileNames()
+		['tsstore_0.dbdb', 'tsstore_1.dbdb']
+		"""
+		super().__init__(cacheSize=cacheSize, cachePolicy=cachePolicy, cacheBytes=cacheBytes, featureFunc=featureFunc)
+		if shards < 1:
+			raise ValueError('There must be at least one shard')
+		self.shards = shards
+		self.prefix = prefix
+		self._shardDBs = {} # shard number to its open DBDB
+
+	def fileNames(self):
+		"""
+		Returns the names of the data files of the store.
+		"""
+		return ["{0}_{1}.dbdb".format(self.prefix, shard) for shard in range(self.shards)]
+
+	def _shardNumber(self, key):
+		"""
+		Private helper function that returns the number of the shard that holds key.
+		crc32 is used rather than hash, which is randomized between runs for strings.
+		"""
+		return zlib.crc32(key.encode('utf-8')) % self.shards
+
+	def _shardDB(self, shard):
+		"""
+		Private helper function that returns the open DBDB of a shard, opening it if needed.
+		"""
+		if shard not in self._shardDBs:
+			self._shardDBs[shard] = DB.connect(self.fileNames()[shard], engine='bplus')
+		return self._shardDBs[shard]
+
+	def _shardForKey(self, key):
+		"""
+		Private helper function that returns the open DBDB of the shard that holds key.
+		"""
+		return self._shardDB(self._shardNumber(key))
+
+	def _keysByShard(self, keys):
+		"""
+		Private helper function that groups keys by shard, as a list of (shard DBDB, keys) pairs in shard order.
+		"""
+		groups = {}
+		for key in keys:
+			groups.setdefault(self._shardNumber(key), []).append(key)
+		return [(self._shardDB(shard), groups[shard]) for shard in sorted(groups)]
+
+	def _storeEncoded(self, key, encodedTimeSeries, size, encodedFeatures=None):
+		"""
+		Writes an encoded time series, its size and its encoded features, if any, into the shard of key,
+		and commits the shard.
+		"""
+		self._storeEncodedMany([(key, encodedTimeSeries, size, encodedFeatures)])
+
+	def _storeEncodedMany(self, encodedTimeSeries):
+		"""
+		Writes a list of (key, encoded time series, size, encoded features or None) tuples, with a single
+		commit per shard.
+		"""
+		byKey = {key: (encoded, size, features) for key, encoded, size, features in encodedTimeSeries}
+		for shardDB, keys in self._keysByShard(byKey):
+			for key in keys:
+				encoded, size, features = byKey[key]
+				shardDB.set("timeseries:" + key, encoded)
+				shardDB.set("size:" + key, str(size))
+				if features is not None:
+					shardDB.set("features:" + key, features)
+			shardDB.commit()
+
+	def _storeFeaturesMany(self, encodedFeatures):
+		"""
+		Adds a list of (key, encoded features) pairs to time series that are already stored, with a single
+		commit per shard.
+		"""
+		byKey = dict(encodedFeatures)
+		for shardDB, keys in self._keysByShard(byKey):
+			for key in keys:
+				shardDB.set("features:" + key, byKey[key])
+			shardDB.commit()
+
+	def _loadFeaturesMany(self, keys):
+		"""
+		Returns a dictionary from key to encoded features for the keys, out of keys, that have them,
+		reading each shard with one batch.
+		"""
+		encodedFeatures = {}
+		for shardDB, shardKeys in self._keysByShard(set(keys)):
+			for treeKey, features in shardDB.get_many(["features:" + key for key in shardKeys]).items():
+				encodedFeatures[treeKey[len("features:"):]] = features
+		return encodedFeatures
+
+	def _loadSize(self, key):
+		"""
+		Returns the size string stored under key, or None if there is no time series at key.
+		"""
+		try:
+			return self._shardForKey(key).get("size:" + key)
+		except KeyError:
+			return None
+
+	def _loadEncoded(self, key):
+		"""
+		Returns the encoded time series stored under key, or None if there is no time series at key.
+		"""
+		try:
+			return self._shardForKey(key).get("timeseries:" + key)
+		except KeyError:
+			return None
+
+	def _existingKeys(self, keys):
+		"""
+		Returns the keys, out of keys, that have a time series, looking them up with one batch per shard.
+		"""
+		existing = []
+		for shardDB, shardKeys in self._keysByShard(keys):
+			sizes = shardDB.get_many(["size:" + key for key in shardKeys])
+			existing.extend(key for key in shardKeys if "size:" + key in sizes)
+		return existing
+
+	def _loadEncodedMany(self, keys):
+		"""
+		Returns a dictionary from key to encoded time series for the keys, out of keys, that have one.
+		Each shard is read with one batch, which reads the time series in the order they sit in the file.
+		"""
+		encodedTimeSeries = {}
+		for shardDB, shardKeys in self._keysByShard(set(keys)):
+			for treeKey, encoded in shardDB.get_many(["timeseries:" + key for key in shardKeys]).items():
+				encodedTimeSeries[treeKey[len("timeseries:"):]] = encoded
+		return encodedTimeSeries
+
+	def close(self):
+		"""
+		Closes the open shard files. The store can still be used afterwards, shards are opened again as needed.
+
+		>>> sdb = SingleFileDB()
+		>>> ts = TimeSeries(values=[0, 2, -1], times=[1, 1.5, 2])
+		>>> key = sdb.storeKeyAndTimeSeries(ts, key="1")
+		>>> sdb.close()
+		>>> sdb.getTimeSeries("1").values()
+		[0.0, 2.0, -1.0]
+		>>> sdb.close()
+		>>> DB.remove('tsstore_0.dbdb')
+		"""
+		for shardDB in self._shardDBs.values():
+			shardDB.close()
+		self._shardDBs = {}
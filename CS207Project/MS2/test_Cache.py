@@ -0,0 +1,133 @@
+import unittest
+from Cache import LRUCache, LFUCache
+
+# py.test --doctest-modules  --cov --cov-report term-missing Cache.py test_Cache.py
+
+# Test cases for the Cache classes
+class LRUCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = LRUCache(max_bytes=30)
+		self.cache.put('a', 1, 10)
+		self.cache.put('b', 2, 10)
+		self.cache.put('c', 3, 10)
+
+	def tearDown(self):
+		del self.cache
+
+	def test_get(self):
+		self.assertEqual(self.cache.get('b'), 2)
+		self.assertEqual(self.cache.hits, 1)
+
+	def test_getMissing(self):
+		self.assertEqual(self.cache.get('d', 'default'), 'default')
+		self.assertEqual(self.cache.misses, 1)
+
+	def test_evictsLeastRecentlyUsed(self):
+		self.cache.get('a')
+		self.cache.put('d', 4, 10)
+		self.assertFalse('b' in self.cache)
+		self.assertTrue('a' in self.cache)
+		self.assertEqual(self.cache.evictions, 1)
+
+	def test_evictsUntilWithinBudget(self):
+		self.cache.put('d', 4, 25)
+		self.assertEqual(len(self.cache), 1)
+		self.assertEqual(self.cache.bytes, 25)
+
+	def test_putReplacesSize(self):
+		self.cache.put('a', 5, 5)
+		self.assertEqual(self.cache.get('a'), 5)
+		self.assertEqual(self.cache.bytes, 25)
+
+	def test_entryLargerThanBudget(self):
+		self.cache.put('d', 4, 31)
+		self.assertFalse('d' in self.cache)
+		self.assertEqual(len(self.cache), 3)
+
+	def test_zeroBudget(self):
+		cache = LRUCache(max_bytes=0)
+		cache.put('a', 1, 1)
+		self.assertEqual(len(cache), 0)
+
+	def test_clear(self):
+		self.cache.clear()
+		self.assertEqual(len(self.cache), 0)
+		self.assertEqual(self.cache.bytes, 0)
+
+class LFUCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = LFUCache(max_bytes=30)
+		self.cache.put('a', 1, 10)
+		self.cache.put('b', 2, 10)
+		self.cache.put('c', 3, 10)
+
+	def tearDown(self):
+		del self.cache
+
+	def test_get(self):
+		self.assertEqual(self.cache.get('b'), 2)
+		self.assertEqual(self.cache.get('d', 'default'), 'default')
+		self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+	def test_evictsLeastFrequentlyUsed(self):
+		self.cache.get('a')
+		self.cache.get('a')
+		self.cache.get('b')
+		self.cache.get('c')
+		self.cache.get('c')
+		self.cache.put('d', 4, 10)
+		self.assertFalse('b' in self.cache)
+		self.assertEqual(self.cache.keys(), ['d', 'a', 'c'])
+		self.assertEqual(self.cache.evictions, 1)
+
+	def test_tiesEvictLeastRecentlyUsed(self):
+		self.cache.get('a')
+		self.cache.get('b')
+		self.cache.put('d', 4, 10)
+		self.assertFalse('c' in self.cache)
+		self.cache.put('e', 5, 10)
+		# d is the only other key used once
+		self.assertEqual(sorted(self.cache.keys()), ['a', 'b', 'e'])
+
+	def test_newKeyIsNotEvicted(self):
+		self.cache.put('d', 4, 25)
+		self.assertEqual(self.cache.keys(), ['d'])
+		self.assertEqual(self.cache.bytes, 25)
+
+	def test_putCountsAsUse(self):
+		self.cache.put('a', 5, 5)
+		self.cache.put('d', 4, 15)
+		self.assertEqual(self.cache.get('a'), 5)
+		self.assertEqual(sorted(self.cache.keys()), ['a', 'c', 'd'])
+		self.assertEqual(self.cache.bytes, 30)
+
+	def test_entryLargerThanBudget(self):
+		self.cache.put('d', 4, 31)
+		self.assertFalse('d' in self.cache)
+		self.assertEqual(len(self.cache), 3)
+
+	def test_zeroBudget(self):
+		cache = LFUCache(max_bytes=0)
+		cache.put('a', 1, 1)
+		self.assertEqual(len(cache), 0)
+
+	def test_clear(self):
+		self.cache.get('a')
+		self.cache.clear()
+		self.assertEqual(len(self.cache), 0)
+		self.cache.put('a', 1, 10)
+		self.assertEqual(self.cache.keys(), ['a'])
+
+	def test_bucketsStayBounded(self):
+		for i in range(1000):
+			self.cache.put(i, i, 10)
+			self.cache.get(i)
+		self.assertEqual(len(self.cache), 3)
+		buckets = 0
+		bucket = self.cache._head.next
+		while bucket is not self.cache._head:
+			buckets += 1
+			bucket = bucket.next
+		self.assertTrue(buckets <= 3)
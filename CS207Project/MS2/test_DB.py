@@ -3,6 +3,7 @@ import os
 from DB import *
 import sys
 import pickle
+import random
 import base64
 sys.path.append('../MS1/')
 from TimeSeries import TimeSeries
@@ -126,6 +127,45 @@ class DBTest(unittest.TestCase):
 		self.assertTrue(commitRes == None)
 		DB.remove('dd.dbdb')
 
+	def test_rename(self):
+		old = DB.connect('dd.dbdb')
+		old.set(5, 'old')
+		old.commit()
+		new = DB.connect('dd.dbdb.new')
+		new.set(5, 'new')
+		new.commit()
+		new.close()
+		DB.rename('dd.dbdb.new', 'dd.dbdb')
+		self.assertFalse(DB.exists('dd.dbdb.new'))
+		# The open handle still reads the replaced file, a new one reads the new file
+		self.assertEqual(old.get(5), 'old')
+		old.close()
+		renamed = DB.connect('dd.dbdb')
+		self.assertEqual(renamed.get(5), 'new')
+		renamed.close()
+		DB.remove('dd.dbdb')
+
+	def test_string_keys(self):
+		# Files written before numeric keys were supported have numbers as string keys
+		for engine in ('binary', 'bplus'):
+			db = DB.connect('dd.dbdb', engine=engine)
+			db.bulk_load(sorted((str(i / 4), b'%d' % i) for i in range(40)))
+			db.close()
+			db = DB.connect('dd.dbdb')
+			for call in (lambda: db.get(0.5), lambda: db.set(0.5, b'x'), lambda: list(db.range(hi=0.5)),
+				lambda: db._tree.chop(0.5)):
+				with self.assertRaisesRegex(TypeError, 'convert_keys'):
+					call()
+			db.close()
+			self.assertEqual(DB.convert_keys('dd.dbdb'), 40)
+			self.assertFalse(DB.exists('dd.dbdb.converted'))
+			db = DB.connect('dd.dbdb')
+			self.assertEqual(db._storage.engine, engine)
+			self.assertEqual(bytes(db.get(0.5)), b'2')
+			self.assertEqual([key for key, value in db.range(hi=1)], [0, 0.25, 0.5, 0.75, 1])
+			db.close()
+			DB.remove('dd.dbdb')
+
 	def test_balanced_one_node(self):
 		rbtree = BinaryTree(self.storage)
 		rbtree.set(9, "99")
@@ -243,3 +283,300 @@ class DBTest(unittest.TestCase):
 
 	def test_if_node_is_black(self):
 		self.assertTrue(self.root.is_black() == 1)		
+
+	def test_node_cache_hits_on_repeated_get(self):
+		dbdb = DB.connect('dd.dbdb')
+		for i in range(20):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		dbdb.get(7)
+		misses = dbdb.cache_stats()['misses']
+		dbdb.get(7)
+		stats = dbdb.cache_stats()
+		self.assertEqual(stats['misses'], misses)
+		self.assertTrue(stats['hits'] > 0)
+		DB.remove('dd.dbdb')
+
+	def test_node_cache_respects_budget(self):
+		dbdb = DB.connect('dd.dbdb', cache_bytes=200)
+		for i in range(50):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		for i in range(50):
+			self.assertEqual(dbdb.get(i), str(i))
+		stats = dbdb.cache_stats()
+		self.assertTrue(stats['bytes'] <= 200)
+		self.assertTrue(stats['evictions'] > 0)
+		DB.remove('dd.dbdb')
+
+	def test_node_cache_disabled(self):
+		dbdb = DB.connect('dd.dbdb', cache_bytes=0)
+		dbdb.set(1, '1')
+		dbdb.commit()
+		self.assertEqual(dbdb.get(1), '1')
+		self.assertEqual(dbdb.cache_stats()['entries'], 0)
+		DB.remove('dd.dbdb')
+
+	def test_mmap_get(self):
+		dbdb = DB.connect('dd.dbdb', use_mmap=True)
+		for i in range(20):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		self.assertEqual(dbdb.get(13), '13')
+		dbdb.close()
+		DB.remove('dd.dbdb')
+
+	def test_mmap_remaps_after_commit(self):
+		dbdb = DB.connect('dd.dbdb', use_mmap=True)
+		dbdb.set(1, '1')
+		dbdb.commit()
+		self.assertEqual(dbdb.get(1), '1')
+		mapped = dbdb._storage._reader.mapped_length
+		for i in range(2, 50):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		self.assertEqual(dbdb.get(49), '49')
+		self.assertTrue(dbdb._storage._reader.mapped_length > mapped)
+		dbdb.close()
+		DB.remove('dd.dbdb')
+
+	def test_mmap_read_returns_memoryview(self):
+		dbdb = DB.connect('dd.dbdb', use_mmap=True)
+		address = dbdb._storage.write(b'abc')
+		data = dbdb._storage.read(address)
+		self.assertTrue(isinstance(data, memoryview))
+		self.assertEqual(bytes(data), b'abc')
+		del data
+		dbdb.close()
+		DB.remove('dd.dbdb')
+
+	def test_new_file_uses_struct_format(self):
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(dbdb._storage.node_format, NODE_FORMAT_STRUCT)
+		DB.remove('dd.dbdb')
+
+	def test_struct_format_keeps_colors(self):
+		dbdb = DB.connect('dd.dbdb')
+		for i in range(10):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		root = dbdb._tree._follow(dbdb._tree._tree_ref)
+		self.assertTrue(root.is_black())
+		self.assertEqual(dbdb.get(3), '3')
+		DB.remove('dd.dbdb')
+
+	def test_read_pickle_format_file(self):
+		# Files written before the struct encoding have an all-zero superblock
+		dbdb = DB.connect('dd.dbdb')
+		dbdb._storage._f.seek(Storage.NODE_FORMAT_ADDRESS)
+		dbdb._storage._f.write(b'\x00')
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(dbdb._storage.node_format, NODE_FORMAT_PICKLE)
+		dbdb.set('a', '1')
+		dbdb.set('b', '2')
+		dbdb.commit()
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(dbdb.get('b'), '2')
+		DB.remove('dd.dbdb')
+
+	def test_float_keys_order_numerically(self):
+		dbdb = DB.connect('dd.dbdb')
+		for distance, tid in [(10.0, 'a'), (2.0, 'b'), (0.5, 'c'), (3.25, 'd')]:
+			dbdb.set(distance, tid)
+		dbdb.commit()
+		chopped = sorted(dbdb._tree.chop(3.0))
+		self.assertEqual(chopped, [(0.5, 'c'), (2.0, 'b')])
+		DB.remove('dd.dbdb')
+
+	def test_numeric_keys_survive_reopen(self):
+		dbdb = DB.connect('dd.dbdb')
+		dbdb.set(0.25, 'a')
+		dbdb.set(-7, 'b')
+		dbdb.commit()
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(dbdb.get(0.25), 'a')
+		self.assertEqual(dbdb.get(-7), 'b')
+		self.assertEqual(dbdb.get(-7.0), 'b')
+		DB.remove('dd.dbdb')
+
+	def test_numpy_keys(self):
+		import numpy as np
+		dbdb = DB.connect('dd.dbdb')
+		dbdb.set(np.float64(1.5), 'a')
+		dbdb.commit()
+		self.assertEqual(dbdb.get(1.5), 'a')
+		self.assertEqual(type(dbdb._tree._follow(dbdb._tree._tree_ref).key), float)
+		DB.remove('dd.dbdb')
+
+	def test_nan_key(self):
+		dbdb = DB.connect('dd.dbdb')
+		with self.assertRaises(ValueError):
+			dbdb.set(float('nan'), 'a')
+		DB.remove('dd.dbdb')
+
+	def _blackHeights(self, rbtree, node):
+		"""
+		Private helper function that returns the set of black node counts on all paths from node down to a leaf
+		"""
+		if node is None:
+			return {0}
+		own = 1 if node.is_black() else 0
+		heights = self._blackHeights(rbtree, rbtree._follow(node.left_ref)) | self._blackHeights(rbtree, rbtree._follow(node.right_ref))
+		return {h + own for h in heights}
+
+	def test_bulk_load(self):
+		dbdb = DB.connect('dd.dbdb')
+		dbdb.bulk_load((float(i), str(i)) for i in range(100))
+		for i in range(100):
+			self.assertEqual(dbdb.get(float(i)), str(i))
+		DB.remove('dd.dbdb')
+
+	def test_bulk_load_is_valid_red_black_tree(self):
+		for n in [1, 2, 3, 7, 8, 100]:
+			dbdb = DB.connect('dd.dbdb')
+			dbdb.bulk_load((i, str(i)) for i in range(n))
+			root = dbdb._tree._follow(dbdb._tree._tree_ref)
+			self.assertTrue(root.is_black())
+			self.assertEqual(len(self._blackHeights(dbdb._tree, root)), 1)
+			DB.remove('dd.dbdb')
+
+	def test_bulk_load_then_set(self):
+		dbdb = DB.connect('dd.dbdb')
+		dbdb.bulk_load([(1, 'a'), (3, 'c')])
+		dbdb.set(2, 'b')
+		dbdb.commit()
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual([dbdb.get(k) for k in [1, 2, 3]], ['a', 'b', 'c'])
+		DB.remove('dd.dbdb')
+
+	def test_bulk_load_unsorted(self):
+		dbdb = DB.connect('dd.dbdb')
+		with self.assertRaises(ValueError):
+			dbdb.bulk_load([(1, 'a'), (1, 'b')])
+		DB.remove('dd.dbdb')
+
+	def test_range(self):
+		self.assertEqual([k for k, _ in self.rbtree.range(2, 5)], [2, 3, 4, 5])
+
+	def test_range_unbounded(self):
+		self.assertEqual([k for k, _ in self.rbtree.range()], [1, 2, 3, 4, 5, 6, 7, 8, 4444])
+
+	def test_range_reverse_limit(self):
+		self.assertEqual(list(self.rbtree.range(lo=3, reverse=True, limit=3)), [(4444, '101'), (8, '105'), (7, '104')])
+
+	def test_range_empty(self):
+		self.assertEqual(list(self.rbtree.range(9, 100)), [])
+		self.assertEqual(list(self.rbtree.range(limit=0)), [])
+
+	def test_range_is_lazy(self):
+		dbdb = DB.connect('dd.dbdb')
+		dbdb.bulk_load((i, str(i)) for i in range(1000))
+		self.assertEqual(next(dbdb.range(lo=500)), (500, '500'))
+		# Only the path down to the first key should have been read
+		self.assertTrue(dbdb.cache_stats()['misses'] < 30)
+		DB.remove('dd.dbdb')
+
+	def test_chop(self):
+		self.assertEqual(self.rbtree.chop(4), [(1, '98'), (2, '99'), (3, '100'), (4, '101')])
+
+	def test_bplus_set_get_many(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		keys = list(range(1000))
+		random.Random(0).shuffle(keys)
+		for key in keys:
+			dbdb.set(key, str(key))
+		dbdb.commit()
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(type(dbdb._tree), BPlusTree)
+		self.assertEqual([dbdb.get(key) for key in range(1000)], [str(key) for key in range(1000)])
+		with self.assertRaises(KeyError):
+			dbdb.get(1000)
+		DB.remove('dd.dbdb')
+
+	def test_bplus_overwrite(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.set('a', '1')
+		dbdb.set('a', '2')
+		dbdb.commit()
+		self.assertEqual(dbdb.get('a'), '2')
+		self.assertEqual(list(dbdb.range()), [('a', '2')])
+		DB.remove('dd.dbdb')
+
+	def test_bplus_uncommitted_changes_are_lost(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.set(1, 'a')
+		dbdb.commit()
+		dbdb.set(2, 'b')
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb')
+		self.assertEqual(list(dbdb.range()), [(1, 'a')])
+		DB.remove('dd.dbdb')
+
+	def test_bplus_range(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.bulk_load((i * 0.5, str(i)) for i in range(1000))
+		self.assertEqual([k for k, _ in dbdb.range(10.2, 12.0)], [10.5, 11.0, 11.5, 12.0])
+		self.assertEqual(len(list(dbdb.range())), 1000)
+		self.assertEqual([k for k, _ in dbdb.range(reverse=True)], [i * 0.5 for i in range(999, -1, -1)])
+		self.assertEqual([k for k, _ in dbdb.range(lo=63, hi=65, reverse=True)], [65.0, 64.5, 64.0, 63.5, 63.0])
+		self.assertEqual([k for k, _ in dbdb.range(lo=60, limit=3)], [60.0, 60.5, 61.0])
+		self.assertEqual(list(dbdb.range(1000, 2000)), [])
+		self.assertEqual(dbdb._tree.chop(1), [(0.0, '0'), (0.5, '1'), (1.0, '2')])
+		DB.remove('dd.dbdb')
+
+	def test_bplus_bulk_load_then_set(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.bulk_load((i, str(i)) for i in range(0, 1000, 2))
+		for i in range(1, 1000, 2):
+			dbdb.set(i, str(i))
+		dbdb.commit()
+		self.assertEqual([k for k, _ in dbdb.range()], list(range(1000)))
+		DB.remove('dd.dbdb')
+
+	def test_bplus_is_shallow(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.bulk_load((i, str(i)) for i in range(20000))
+		dbdb.close()
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.get(5000)
+		# 20000 keys take 157 leaves, under two levels of internal nodes
+		self.assertEqual(dbdb.cache_stats()['misses'], 3)
+		DB.remove('dd.dbdb')
+
+	def test_engine_mismatch(self):
+		dbdb = DB.connect('dd.dbdb', engine='bplus')
+		dbdb.close()
+		with self.assertRaises(ValueError):
+			DB.connect('dd.dbdb', engine='binary')
+		DB.remove('dd.dbdb')
+		with self.assertRaises(ValueError):
+			DB.connect('dd.dbdb', engine='btree')
+
+	def test_bytes_values(self):
+		for use_mmap in [False, True]:
+			dbdb = DB.connect('dd.dbdb', use_mmap=use_mmap)
+			dbdb.set('bytes', b'\xff\x00abc')
+			dbdb.set('str', 'abc')
+			dbdb.commit()
+			dbdb.close()
+			dbdb = DB.connect('dd.dbdb', use_mmap=use_mmap)
+			self.assertEqual(dbdb.get('bytes').tobytes(), b'\xff\x00abc')
+			self.assertEqual(dbdb.get('str'), 'abc')
+			dbdb.close()
+			DB.remove('dd.dbdb')
+
+	def test_get_many(self):
+		for engine in ['binary', 'bplus']:
+			dbdb = DB.connect('dd.dbdb', engine=engine)
+			for i in range(100):
+				dbdb.set(i, str(i))
+			dbdb.commit()
+			self.assertEqual(dbdb.get_many([50, 3, 200, 3]), {50: '50', 3: '3'})
+			DB.remove('dd.dbdb')
@@ -94,3 +94,76 @@ class FileStorageManagerTest(unittest.TestCase):
 	def test_getNonExistentSize(self):
 		key = 1919
 		self.assertEqual(self.fsm1.size(key), -1)
+
+	def test_singleFileBackend(self):
+		fsm = FileStorageManager(backend='single', shards=2)
+		fsm.store(timeSeries=self.ts, key="1")
+		fsm.store(timeSeries=self.ats, key="2")
+		self.assertEqual(fsm.size("1"), 5)
+		self.assertEqual(fsm.get("2").values(), [1, 2, 3])
+		self.assertEqual(fsm.get("3"), None)
+		fsm.close()
+		for fileName in fsm.db.fileNames():
+			try:
+				DB.remove(fileName)
+			except OSError:
+				pass
+
+	def test_unknownBackend(self):
+		with self.assertRaises(ValueError):
+			FileStorageManager(backend='memory')
+
+	def test_storeAndGetMany(self):
+		for backend in ['files', 'single']:
+			fsm = FileStorageManager(backend=backend, shards=3)
+			series = [TimeSeries(values=[i, i + 1, i + 2], times=[0, 1, 2]) for i in range(20)]
+			keys = fsm.store_many(series)
+			self.assertEqual(len(set(keys)), 20)
+			retrieved = fsm.get_many(keys[::-1] + ["missing"])
+			self.assertEqual([ts.values() for ts in retrieved[:-1]], [ts.values() for ts in series[::-1]])
+			self.assertEqual(retrieved[-1], None)
+			times, values = fsm.get_many(keys, as_matrix=True)
+			self.assertEqual(values.shape, (20, 3))
+			self.assertEqual(values[:, 0].tolist(), list(range(20)))
+			self.assertEqual(times[5].tolist(), [0, 1, 2])
+			with self.assertRaises(KeyError):
+				fsm.get_many(keys + ["missing"], as_matrix=True)
+			fsm.close()
+			for key in keys:
+				try:
+					DB.remove("ts_" + key + ".dbdb")
+				except OSError:
+					pass
+			for fileName in ["tsstore_0.dbdb", "tsstore_1.dbdb", "tsstore_2.dbdb"]:
+				try:
+					DB.remove(fileName)
+				except OSError:
+					pass
+
+	def test_storeManyExistingKey(self):
+		fsm = FileStorageManager(backend='single')
+		fsm.store(timeSeries=self.ts, key="1")
+		with self.assertRaises(ValueError):
+			fsm.store_many({"2": self.ts, "1": self.ts_single})
+		self.assertEqual(fsm.size("2"), -1)
+		fsm.close()
+		DB.remove("tsstore_0.dbdb")
+
+	def test_getManyDifferentLengths(self):
+		keys = self.fsm1.store_many({"1": self.ts, "2": self.ts_single})
+		with self.assertRaises(ValueError):
+			self.fsm1.get_many(keys, as_matrix=True)
+		DB.remove("ts_1.dbdb")
+		DB.remove("ts_2.dbdb")
+
+	def test_getManyFeatures(self):
+		fsm = FileStorageManager(features=lambda ts: {'values': np.asarray(ts.values(), dtype=float), 'size': len(ts)})
+		keys = fsm.store_many({"1": self.ts_notime, "2": self.ats})
+		features = fsm.get_many_features(["2", "1"], as_matrix=True)
+		self.assertEqual(features['values'].tolist(), [[1, 2, 3], [2, 3, 4]])
+		self.assertEqual(features['size'].tolist(), [3, 3])
+		self.assertEqual(fsm.get_features("1")['values'].tolist(), [2, 3, 4])
+		with self.assertRaises(KeyError):
+			fsm.get_many_features(["1", "3"], as_matrix=True)
+		DB.remove("ts_1.dbdb")
+		DB.remove("ts_2.dbdb")
@@ -1,6 +1,8 @@
 import unittest
 import os
-from WrappedDB import WrappedDB
+import numpy as np
+from WrappedDB import WrappedDB, SingleFileDB
+from DB import DB
 import sys
 sys.path.append('../')
 from TimeSeries import TimeSeries
@@ -80,23 +82,25 @@ class WrappedDBTest(unittest.TestCase):
 		key = 1
 		self.wdb.storeKeyAndTimeSeries(key=key, timeSeries=self.ts)
 		# Not get yet, should not cache
-		self.assertEquals(self.wdb.cache, {})
+		self.assertEquals(self.wdb.cache.keys(), [])
 		# Get once, should cache it
 		self.wdb.getTimeSeries(key)
-		self.assertEquals(self.wdb.cache, {'1': self.ts})
-		self.assertEquals(self.wdb.keyToCount, {'1': 1})
+		self.assertEquals(self.wdb.cache.keys(), ['1'])
+		self.assertEquals(self.wdb.cache.get('1'), self.ts)
+		self.assertEquals(self.wdb.cacheStats()['misses'], 1)
 		DB.remove("ts_" + str(key) + ".dbdb")
 
 	def test_cacheNotFull_getMultiple(self):
 		self.wdb.storeKeyAndTimeSeries(key=1, timeSeries=self.ts)
 		self.wdb.storeKeyAndTimeSeries(key=2, timeSeries=self.ts_single)
 		# Not get yet, should not cache
-		self.assertEquals(self.wdb.cache, {})
+		self.assertEquals(self.wdb.cache.keys(), [])
 		self.wdb.getTimeSeries(1)
 		self.wdb.getTimeSeries(1)
 		self.wdb.getTimeSeries(2)
-		self.assertEquals(self.wdb.cache, {'1': self.ts, '2': self.ts_single})
-		self.assertEquals(self.wdb.keyToCount, {'1': 2, '2': 1})
+		# Ordered from least to most frequently used
+		self.assertEquals(self.wdb.cache.keys(), ['2', '1'])
+		self.assertEquals((self.wdb.cacheStats()['hits'], self.wdb.cacheStats()['misses']), (1, 2))
 		DB.remove("ts_" + str(1) + ".dbdb")
 		DB.remove("ts_" + str(2) + ".dbdb")
 
@@ -110,8 +114,8 @@ class WrappedDBTest(unittest.TestCase):
 		self.wdb.getTimeSeries(2)
 		self.wdb.getTimeSeries(2)
 		# key 3 should be replaced by 2
-		self.assertEquals(self.wdb.cache, {'1': self.ts, '2': self.ts_single})
-		self.assertEquals(self.wdb.keyToCount, {'1': 2, '2': 2, '3': 1})
+		self.assertEquals(sorted(self.wdb.cache.keys()), ['1', '2'])
+		self.assertEquals(self.wdb.cacheStats()['evictions'], 1)
 		DB.remove("ts_" + str(1) + ".dbdb")
 		DB.remove("ts_" + str(2) + ".dbdb")
 		DB.remove("ts_" + str(3) + ".dbdb")
@@ -129,7 +133,7 @@ class WrappedDBTest(unittest.TestCase):
 		self.wdb.getTimeSeries(3)
 		self.wdb.getTimeSeries(2)
 		self.assertEquals(sorted(list(self.wdb.cache.keys())), ['2', '3'])
-		self.assertEquals(self.wdb.keyToCount, {'1': 2, '2': 3, '3': 3})
+		self.assertEquals(self.wdb.cacheStats()['evictions'], 2)
 		DB.remove("ts_" + str(1) + ".dbdb")
 		DB.remove("ts_" + str(2) + ".dbdb")
 		DB.remove("ts_" + str(3) + ".dbdb")
@@ -143,16 +147,76 @@ class WrappedDBTest(unittest.TestCase):
 		self.wdb.getTimeSeries(1)
 		self.wdb.getTimeSeries(2)
 		self.wdb.getTimeSeries(2)
-		self.assertEquals(self.wdb_noCache.cache, {})
+		self.assertEquals(len(self.wdb_noCache.cache), 0)
 		DB.remove("ts_" + str(1) + ".dbdb")
 		DB.remove("ts_" + str(2) + ".dbdb")
 		DB.remove("ts_" + str(3) + ".dbdb")
 
+	def test_lruCache(self):
+		wdb = WrappedDB(cacheSize=2, cachePolicy='lru')
+		for key, ts in [(1, self.ts), (2, self.ts_single), (3, self.ts_notime)]:
+			wdb.storeKeyAndTimeSeries(key=key, timeSeries=ts)
+		wdb.getTimeSeries(1)
+		wdb.getTimeSeries(1)
+		wdb.getTimeSeries(2)
+		wdb.getTimeSeries(3)
+		# 1 was used the most, but 2 and 3 were used last
+		self.assertEquals(wdb.cache.keys(), ['2', '3'])
+		for key in [1, 2, 3]:
+			DB.remove("ts_" + str(key) + ".dbdb")
+
+	def test_cacheBytes(self):
+		wdb = WrappedDB(cacheBytes=100)
+		wdb.storeKeyAndTimeSeries(key=1, timeSeries=self.ts)
+		wdb.storeKeyAndTimeSeries(key=2, timeSeries=self.ts_notime)
+		wdb.getTimeSeries(1)
+		wdb.getTimeSeries(2)
+		# 5 and 3 points take 80 and 48 bytes, which do not both fit
+		self.assertEquals(wdb.cache.keys(), ['2'])
+		self.assertEquals(wdb.cache.bytes, 48)
+		DB.remove("ts_1.dbdb")
+		DB.remove("ts_2.dbdb")
+
+	def test_unknownCachePolicy(self):
+		with self.assertRaises(ValueError):
+			WrappedDB(cachePolicy='random')
+
 	# Test encode and decode
 
 	def test_encode(self):
-		timeSeriesString = self.wdb._encode(timeSeries=self.ts)
-		self.assertEqual(timeSeriesString, '(1.5,1);(2,3);(2.5,0);(3,1.5);(10.5,1)')
+		encoded = self.wdb._encode(timeSeries=self.ts)
+		self.assertEqual(len(encoded), 16 + 5 * 16)
+		self.assertEqual(self.wdb._decode(encoded), self.ts)
+
+	def test_encode_exact(self):
+		# Values whose short repr does not survive a round trip through a string
+		ts = TimeSeries(values=[0.1 + 0.2, 1 / 3.0, 1e-300], times=[0.1, 0.7, 2 ** 0.5])
+		times, values = self.wdb._decodeArrays(self.wdb._encode(ts))
+		self.assertEqual(values.tolist(), ts.values())
+		self.assertEqual(times.tolist(), ts.times())
+
+	def test_decode_is_zero_copy(self):
+		encoded = self.wdb._encode(timeSeries=self.ts)
+		times, values = self.wdb._decodeArrays(encoded)
+		self.assertFalse(values.flags.owndata)
+		self.assertFalse(values.flags.writeable)
+
+	def test_decode_malformed_bytes(self):
+		encoded = self.wdb._encode(timeSeries=self.ts)
+		with self.assertRaises(ValueError):
+			self.wdb._decode(encoded[:-1])
+		with self.assertRaises(ValueError):
+			self.wdb._decode(b'XXXX' + encoded[4:])
+
+	def test_readsStringEncodedFile(self):
+		# Files written before the binary encoding hold "(t,v);" strings
+		oldDB = DB.connect("ts_old.dbdb")
+		oldDB.set("timeseries", '(1.5,1);(2,3);(2.5,0);(3,1.5);(10.5,1)')
+		oldDB.set("size", "5")
+		oldDB.commit()
+		oldDB.close()
+		self.assertEqual(self.wdb.getTimeSeries("old"), self.ts)
+		DB.remove("ts_old.dbdb")
 
 	def test_decode(self):
 		timeSeriesString = '(1.5,1);(2,3);(2.5,0);(3,1.5);(10.5,1)'
@@ -168,3 +232,85 @@ class WrappedDBTest(unittest.TestCase):
 		timeSeriesString = '(1.5,1;(2,3);(2.5,0);(3,1.5);(10.5,1)'
 		with self.assertRaises(ValueError):
 			timeSeries = self.wdb._decode(encodedTimeSeries=timeSeriesString)
+
+	# Test features
+
+	def _features(self, timeSeries):
+		values = np.asarray(timeSeries.values(), dtype=float)
+		return {'spectrum': np.fft.rfft(values), 'norm': np.sum(values ** 2)}
+
+	def test_featuresStoredWithTimeSeries(self):
+		calls = []
+		def featureFunc(timeSeries):
+			calls.append(timeSeries)
+			return self._features(timeSeries)
+		wdb = WrappedDB(featureFunc=featureFunc)
+		wdb.storeManyTimeSeries({"1": self.ts, "2": self.ts_notime})
+		self.assertEqual(len(calls), 2)
+		features = WrappedDB(featureFunc=featureFunc).getManyFeatures(["2", "1", "3"])
+		# Read back from disk, not computed again
+		self.assertEqual(len(calls), 2)
+		np.testing.assert_allclose(features[1]['spectrum'], np.fft.rfft([1, 3, 0, 1.5, 1]))
+		self.assertEqual(float(features[0]['norm']), 29)
+		self.assertEqual(features[2], None)
+		self.assertFalse(DB.exists("ts_3.dbdb"))
+		DB.remove("ts_1.dbdb"); DB.remove("ts_2.dbdb")
+
+	def test_featuresFilledInLater(self):
+		self.wdb.storeKeyAndTimeSeries(key="1", timeSeries=self.ts)
+		self.assertEqual(self.wdb.getFeatures("1"), None)
+		wdb = WrappedDB(featureFunc=self._features)
+		self.assertEqual(float(wdb.getFeatures("1")['norm']), 13.25)
+		# The filled in features were stored next to the time series
+		self.assertEqual(float(WrappedDB().getFeatures("1")['norm']), 13.25)
+		self.assertEqual(self.wdb.getTimeSeries("1").values(), [1, 3, 0, 1.5, 1])
+		DB.remove("ts_1.dbdb")
+
+class SingleFileDBTest(unittest.TestCase):
+
+	def setUp(self):
+		self.sdb = SingleFileDB(cacheSize=2, shards=3, prefix="test_tsstore")
+		self.ts = TimeSeries(values=[1, 3, 0, 1.5, 1], times=[1.5, 2, 2.5, 3, 10.5])
+
+	def tearDown(self):
+		self.sdb.close()
+		for fileName in self.sdb.fileNames():
+			try:
+				DB.remove(fileName)
+			except OSError:
+				pass
+
+	def test_storeAndGetMany(self):
+		for i in range(50):
+			self.sdb.storeKeyAndTimeSeries(key=i, timeSeries=TimeSeries(values=[i, i + 1], times=[0, 1]))
+		for i in range(50):
+			self.assertEqual(self.sdb.getTimeSeriesSize(i), 2)
+			self.assertEqual(self.sdb.getTimeSeries(i).values(), [i, i + 1])
+		# All time series live in the shard files, which are the only files kept open
+		self.assertEqual(len(self.sdb._shardDBs), 3)
+
+	def test_getNonExistent(self):
+		self.assertEqual(self.sdb.getTimeSeries("missing"), None)
+		self.assertEqual(self.sdb.getTimeSeriesSize("missing"), -1)
+
+	def test_duplicateKey(self):
+		self.sdb.storeKeyAndTimeSeries(key="1", timeSeries=self.ts)
+		with self.assertRaises(ValueError):
+			self.sdb.storeKeyAndTimeSeries(key="1", timeSeries=self.ts)
+
+	def test_survivesReopen(self):
+		key = self.sdb.storeKeyAndTimeSeries(timeSeries=self.ts)
+		self.sdb.close()
+		other = SingleFileDB(shards=3, prefix="test_tsstore")
+		self.assertEqual(other.getTimeSeries(key).values(), [1, 3, 0, 1.5, 1])
+		other.close()
+
+	def test_features(self):
+		sdb = SingleFileDB(shards=3, prefix="test_tsstore", featureFunc=lambda ts: {'total': np.sum(ts.values())})
+		keys = sdb.storeManyTimeSeries([TimeSeries(values=[i, i + 1]) for i in range(10)])
+		sdb.storeKeyAndTimeSeries(key="single", timeSeries=self.ts)
+		sdb.close()
+		features = self.sdb.getManyFeatures(keys + ["single", "missing"])
+		self.assertEqual([float(f['total']) for f in features[:10]], [2 * i + 1 for i in range(10)])
+		self.assertEqual(float(features[10]['total']), 6.5)
+		self.assertEqual(features[11], None)
@@ -0,0 +1,265 @@
+import logging
+import numpy as np
+import random
+import sys
+import threading
+from _corr import kernel_dist_many, kernel_features
+sys.path.append('../../MS2/')
+from FileStorageManager import FileStorageManager
+from DB import DB
+
+# Upkeep of the vantage point index of the socket server (see Distance_from_known_ts) as time series are added:
+# every time series is added to the vantage point trees and the pivot table, and a vantage point is replaced
+# every so often. This does not depend on flask, so it can be tested on its own.
+# The VP-tree of the socket server does not depend on the vantage points, and is kept up to date by the socket
+# server itself, so nothing here touches it.
+
+log = logging.getLogger(__name__)
+
+timeseries_index_file_name = "db_timeseriesindex.dbdb"
+vantage_index_file_name = "db_vantageindex.dbdb"
+# Distances from every time series to the vantage points, keyed by time series id, as float32 bytes in the order
+# of the vantage labels (see PivotTable in the socket server)
+pivot_table_file_name = "db_pivottable.dbdb" # the vantage point index names the current one if it was replaced
+# Held while the time series index, the vantage point trees or the pivot table are written
+index_lock = threading.Lock()
+# Background thread replacing a vantage point
+_replacement = None
+
+def pivot_table_name(vantageIndexDB):
+	"""
+	Returns the name of the pivot table that goes with a vantage point index
+	"""
+	try:
+		return vantageIndexDB.get("pivot_table")
+	except KeyError:
+		return pivot_table_file_name
+
+def _vantageIDs(vantageIndexDB):
+	"""
+	Private helper function that returns the ids of the vantage points of an index, in the order of their labels
+	"""
+	entries = dict(vantageIndexDB.range())
+	return [entries[label] for label in sorted((label for label in entries if label.isdigit()), key=int)]
+
+def add_timeseries(fsm, timeSeriesObject, key):
+	"""
+	Adds a time series that is already stored in fsm to the time series index, to the tree of every vantage point
+	and to the pivot table.
+
+	Parameters
+	----------
+	fsm: FileStorageManager holding the time series, created with kernel_features as its features
+	timeSeriesObject: The time series
+	key: Its key in fsm
+
+	Returns
+	-------
+	Number of time series, including this one
+	"""
+	with index_lock:
+		# Update time series index
+		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+
+		num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
+		timeseriesIndexDB.set("number_of_timeseries", str(num_timeseries + 1))
+
+		timeseries_ids = timeseriesIndexDB.get("timeseries_ids")
+		timeseriesIndexDB.set("timeseries_ids", timeseries_ids + "," + key)
+		timeseriesIndexDB.commit()
+		timeseriesIndexDB.close()
+
+		# Also update vantage points
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		vantageIDs = _vantageIDs(vantageIndexDB)
+		pivotTableName = pivot_table_name(vantageIndexDB)
+		vantageIndexDB.close()
+
+		# Calculate kernel dist from this new time series to each vantage, and update all 20 RBTs
+		vantageFeatures = fsm.get_many_features(vantageIDs, as_matrix=True)
+		distancesFromInputTS = kernel_dist_many(timeSeriesObject, None,
+			spectra=(vantageFeatures['spectrum'], vantageFeatures['norm']))
+		for vantageID, distanceFromInputTS in zip(vantageIDs, distancesFromInputTS.tolist()):
+			# Store this distance and the time series key inside the respective RBT
+			vantage_file_name = 'db_vantagepoint_'+ vantageID + '.dbdb'
+			vantageDB = DB.connect(vantage_file_name)
+			vantageDB.set(distanceFromInputTS, key)
+			vantageDB.commit()
+			vantageDB.close()
+
+		# And add its row to the pivot table
+		pivotTableDB = DB.connect(pivotTableName)
+		pivotTableDB.set(key, distancesFromInputTS.astype('<f4').tobytes())
+		pivotTableDB.commit()
+		pivotTableDB.close()
+	return num_timeseries + 1
+
+def start_vantage_point_replacement():
+	"""
+	Starts replacing a vantage point in a background thread, unless a replacement is already running
+	"""
+	global _replacement
+	if _replacement is not None and _replacement.is_alive():
+		return
+	_replacement = threading.Thread(target=_replaceInBackground, daemon=True)
+	_replacement.start()
+
+def _replaceInBackground():
+	"""
+	Private helper function run by the background thread, which has nobody to raise to
+	"""
+	try:
+		replace_vantage_point()
+	except Exception:
+		log.exception("Replacing a vantage point failed")
+
+def replace_vantage_point(label=None, fsm=None):
+	"""
+	Replaces the vantage point with the given label (a random one if None) by a random time series.
+	Only the distances to the new vantage point are calculated, while searches and inserts go on using the old
+	vantage points. The new vantage point index, pointing to a new pivot table, then replaces the old one in one
+	atomic rename, so readers see either the old or the new vantage points, never a mix of them.
+	If anything fails before the rename, the files written for the new vantage point are removed and the old
+	vantage points stay in use.
+
+	Parameters
+	----------
+	label: Label of the vantage point to replace
+	fsm: FileStorageManager holding the time series, created with kernel_features as its features
+		if not given
+
+	Returns
+	-------
+	Id of the new vantage point
+	"""
+	fsm = fsm if fsm is not None else FileStorageManager(features=kernel_features)
+	replacement = _buildReplacement(label, fsm)
+	try:
+		_swapReplacement(replacement, fsm)
+	except BaseException:
+		_removeReplacement(replacement)
+		raise
+	return replacement['newVantageID']
+
+def _buildReplacement(label, fsm):
+	"""
+	Private helper function that takes a snapshot of the time series and vantage points, picks the new vantage
+	point, and builds its tree, which nobody reads yet. Returns the state _swapReplacement goes on from.
+	"""
+	# Take a snapshot of the time series and vantage points
+	with index_lock:
+		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+		num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
+		timeseries_ids = timeseriesIndexDB.get("timeseries_ids").split(',')[:num_timeseries]
+		timeseriesIndexDB.close()
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		vantageIDs = _vantageIDs(vantageIndexDB)
+		try:
+			generation = int(vantageIndexDB.get("generation"))
+		except KeyError:
+			generation = 0
+		vantageIndexDB.close()
+	if label is None:
+		label = random.randrange(len(vantageIDs))
+
+	vantageSet = set(vantageIDs)
+	newVantageID = random.choice([tid for tid in timeseries_ids if tid not in vantageSet])
+	replacement = {'label': label, 'vantageIDs': vantageIDs, 'generation': generation, 'newVantageID': newVantageID,
+		'timeseries_ids': timeseries_ids, 'vantage_file_name': 'db_vantagepoint_' + newVantageID + '.dbdb',
+		'pivot_table_file_name': 'db_pivottable_%d.dbdb' % (generation + 1), 'swapped': False}
+	try:
+		replacement['newVantageStand'] = fsm.get_features(newVantageID)['stand']
+		distances = _distancesToNewVantage(replacement, fsm, timeseries_ids)
+		vantage_file_name = replacement['vantage_file_name']
+		if DB.exists(vantage_file_name):
+			DB.remove(vantage_file_name)
+		vantageDB = DB.connect(vantage_file_name, engine='bplus')
+		vantageDB.bulk_load(sorted(dict(zip(distances.tolist(), timeseries_ids)).items()))
+		vantageDB.close()
+	except BaseException:
+		_removeReplacement(replacement)
+		raise
+	replacement['newColumn'] = dict(zip(timeseries_ids, distances.tolist()))
+	return replacement
+
+def _distancesToNewVantage(replacement, fsm, tids):
+	"""
+	Private helper function that returns the distances from time series to the new vantage point.
+	The spectra stored with the time series are read in one batch, so this is one numpy call.
+	"""
+	features = fsm.get_many_features(tids, as_matrix=True)
+	return kernel_dist_many(replacement['newVantageStand'], None, spectra=(features['spectrum'], features['norm']))
+
+def _swapReplacement(replacement, fsm):
+	"""
+	Private helper function that adds the time series inserted since _buildReplacement to the new tree, writes
+	the new pivot table and swaps the new vantage point index in, all under the lock so no insert is missed.
+	"""
+	label = replacement['label']
+	vantageIDs = list(replacement['vantageIDs'])
+	generation = replacement['generation']
+	vantage_file_name = replacement['vantage_file_name']
+	newColumn = replacement['newColumn']
+	with index_lock:
+		# Catch up with the time series inserted in the meantime
+		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+		num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
+		added_ids = timeseriesIndexDB.get("timeseries_ids").split(',')[len(replacement['timeseries_ids']):num_timeseries]
+		timeseriesIndexDB.close()
+		if added_ids:
+			added = _distancesToNewVantage(replacement, fsm, added_ids)
+			vantageDB = DB.connect(vantage_file_name)
+			for tid, distance in zip(added_ids, added.tolist()):
+				vantageDB.set(distance, tid)
+			vantageDB.commit()
+			vantageDB.close()
+			newColumn.update(zip(added_ids, added.tolist()))
+
+		# Write the new pivot table, which is the old one with the column of the label replaced
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		oldPivotTableName = pivot_table_name(vantageIndexDB)
+		vantageIndexDB.close()
+		oldPivotTableDB = DB.connect(oldPivotTableName)
+		rows = []
+		for tid, row in oldPivotTableDB.range():
+			row = np.frombuffer(bytes(row), dtype='<f4').copy()
+			row[label] = newColumn[tid]
+			rows.append((tid, row.tobytes()))
+		oldPivotTableDB.close()
+		newPivotTableName = replacement['pivot_table_file_name']
+		if DB.exists(newPivotTableName):
+			DB.remove(newPivotTableName)
+		pivotTableDB = DB.connect(newPivotTableName, engine='bplus')
+		pivotTableDB.bulk_load(rows)
+		pivotTableDB.close()
+
+		# Write the new vantage point index aside, and swap it in
+		oldVantageID = vantageIDs[label]
+		vantageIDs[label] = replacement['newVantageID']
+		new_index_file_name = vantage_index_file_name + '.new'
+		if DB.exists(new_index_file_name):
+			DB.remove(new_index_file_name)
+		vantageIndexDB = DB.connect(new_index_file_name)
+		for vantageLabel, vantageID in enumerate(vantageIDs):
+			vantageIndexDB.set(str(vantageLabel), vantageID)
+		vantageIndexDB.set("generation", str(generation + 1))
+		vantageIndexDB.set("pivot_table", newPivotTableName)
+		vantageIndexDB.commit()
+		vantageIndexDB.close()
+		DB.rename(new_index_file_name, vantage_index_file_name)
+		replacement['swapped'] = True
+
+		# Readers that still have the old files open keep reading them until they load the new index
+		DB.remove(oldPivotTableName)
+		DB.remove('db_vantagepoint_' + oldVantageID + '.dbdb')
+
+def _removeReplacement(replacement):
+	"""
+	Private helper function that removes the files written for a replacement that was not swapped in.
+	"""
+	if replacement['swapped']:
+		return
+	for fileName in (replacement['vantage_file_name'], replacement['pivot_table_file_name'],
+		vantage_index_file_name + '.new'):
+		if DB.exists(fileName):
+			DB.remove(fileName)
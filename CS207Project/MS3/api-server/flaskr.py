@@ -13,6 +13,7 @@ sys.path.append('../../MS2/');
 from FileStorageManager import FileStorageManager
 from DB import DB
 sys.path.append('../../MS1/'); from TimeSeries import TimeSeries
+from VantageIndex import add_timeseries, start_vantage_point_replacement
 
 log = logging.getLogger(__name__)
 
@@ -37,7 +38,6 @@ url = 'postgresql://{}:{}@{}:{}/{}'
 url = url.format(user, password, host, port, db)
 app.config['SQLALCHEMY_DATABASE_URI'] = url # 'sqlite:////tmp/tasks.db'
 db = SQLAlchemy(app)
-num_vantage_points = 20
 
 
 class TimeSeriesModel(db.Model):
@@ -203,102 +203,15 @@ def _storeTimeSeriesInFSM(timeSeriesObject, key):
 	"""
 	Stores the time series object in FSM. This is being called by /timeseries POST on creation of a new time series.
 	"""
-	fsm = FileStorageManager()
+	# The spectra used by kernel_dist_many are computed once, when a time series is stored
+	fsm = FileStorageManager(features=kernel_features)
 	genKey = fsm.store(timeSeries=timeSeriesObject, key=key)
-	
-	# Update time series index
-	timeseries_index_file_name = "db_timeseriesindex.dbdb"
-	timeseriesIndexDB = DB.connect(timeseries_index_file_name)		
-	
-	num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
-	timeseriesIndexDB.set("number_of_timeseries", str(num_timeseries + 1))
+	num_timeseries = add_timeseries(fsm, timeSeriesObject, genKey)
 
-	timeseries_ids = timeseriesIndexDB.get("timeseries_ids")
-	timeseriesIndexDB.set("timeseries_ids", timeseries_ids + "," + genKey)
-	timeseriesIndexDB.commit()
-	
-	# Also update vantage points
-	vantage_index_file_name = "db_vantageindex.dbdb"
-	vantageIndexDB = DB.connect(vantage_index_file_name)
-
-	# Calculate kernel dist from this new time series to each vantage, and update all 20 RBTs
-	for i in range(num_vantage_points): # 20 vantage points
-		vantageID = vantageIndexDB.get(str(i))
-		vantageTS = fsm.get(vantageID)
-		distanceFromInputTS = kernel_dist(timeSeriesObject, vantageTS)
-		# Store this distance and the time series key inside the respective RBT
-		vantage_file_name = 'db_vantagepoint_'+ vantageID + '.dbdb'
-		vantageDB = DB.connect(vantage_file_name)
-		vantageDB.set(str(distanceFromInputTS), genKey)
-		vantageDB.commit()
-
-	# Check if there are more than 50 new time series being added. If so, regenerate vantage points.
-	if num_timeseries + 1 % 50 == 0:
-		log.info("Regenerating vantage points")
-		_regenerateVantagePoints()
-
-def _regenerateVantagePoints():
-	"""
-	Vantage points are regenerated for every 50 time series added
-	"""
-	# Taking all points in timeseries index, sample 20 new ones as vantage points, and rebuild red black trees
-	
-	fsm = FileStorageManager()
-
-	timeseries_index_file_name = "db_timeseriesindex.dbdb"
-	timeseriesIndexDB = DB.connect(timeseries_index_file_name)		
-
-	num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
-
-	# Sample new vantage point indexes
-	vantage_point_indexes = random.sample(range(num_timeseries), num_vantage_points)
-
-	# Get actual vantage point ids
-	timeseries_ids = timeseriesIndexDB.get("timeseries_ids").split(',')
-
-	# Remove vantages
-	vantage_index_file_name = "db_vantageindex.dbdb"
-	
-	vantageIndexDB = DB.connect(vantage_index_file_name)
-	# Remove vantage indexes
-	for i in range(num_vantage_points):
-		vantageID = vantageIndexDB.get(str(i))
-		DB.remove("db_vantagepoint_" + vantageID + ".dbdb")
-	# Remove vantage files
-	DB.remove(vantage_index_file_name)
-
-	# Recreate vantages
-	
-	# Recreate vantage indexes
-	vantageIndexDB = DB.connect(vantage_index_file_name)
-	vantageLabel = 0
-	for i in vantage_point_indexes:
-		vantageID = timeseries_ids[i]
-		vantageIndexDB.set(str(vantageLabel), vantageID)
-		vantageLabel += 1
-	vantageIndexDB.commit()
-
-	# Recreate vantage files, and also red black trees along with it
-	for i in vantage_point_indexes:
-		# For each vantage point do the following:
-
-		vantageID = timeseries_ids[i]
-		print('Working on vantage point with id: ', vantageID)
-
-		vantage_file_name = 'db_vantagepoint_'+ vantageID + '.dbdb'
-		vantageDB = DB.connect(vantage_file_name)
-		vantageTS = fsm.get(vantageID)
-
-		for j in range(num_timeseries):
-			# For each timeseries, calculate the distance to this vantage point and append it to RBT: 
-
-			otherID = timeseries_ids[j]
-			otherTS = fsm.get(otherID)
-			distance_bw = kernel_dist(otherTS, vantageTS)
-			vantageDB.set(str(distance_bw), otherID)
-
-		# Note: We commit after setting all 1000 distances so we make it more efficient
-		vantageDB.commit()
+	# Every 50 time series added, replace one of the vantage points (see VantageIndex)
+	if num_timeseries % 50 == 0:
+		log.info("Replacing a vantage point")
+		start_vantage_point_replacement()
 
 @app.route('/timeseries', methods=['POST'])
 def create_timeseries():
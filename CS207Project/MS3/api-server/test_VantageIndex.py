@@ -0,0 +1,156 @@
+import unittest
+import os
+import tempfile
+import shutil
+import threading
+import random
+import numpy as np
+import VantageIndex
+from VantageIndex import *
+from _corr import tsmaker, kernel_dist_many, kernel_features
+from FileStorageManager import FileStorageManager
+from DB import DB
+
+# py.test test_VantageIndex.py
+
+# Test cases for the upkeep of the vantage point index, on a small index in a scratch directory
+class VantageIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basePath = DB.BASE_PATH
+		DB.BASE_PATH = tempfile.mkdtemp() + '/'
+		self.fsm = FileStorageManager(features=kernel_features)
+		self.series = {}
+		series = self.randomSeries(60)
+		ids = self.fsm.store_many(series)
+		self.series.update(series)
+		vantageIDs = random.sample(ids, 4)
+		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+		timeseriesIndexDB.set("number_of_timeseries", str(len(ids)))
+		timeseriesIndexDB.set("timeseries_ids", ','.join(ids))
+		timeseriesIndexDB.commit()
+		timeseriesIndexDB.close()
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		for label, vantageID in enumerate(vantageIDs):
+			vantageIndexDB.set(str(label), vantageID)
+		vantageIndexDB.commit()
+		vantageIndexDB.close()
+		distances = np.column_stack([self.distances(vantageID, ids) for vantageID in vantageIDs])
+		for column, vantageID in enumerate(vantageIDs):
+			vantageDB = DB.connect('db_vantagepoint_' + vantageID + '.dbdb', engine='bplus')
+			vantageDB.bulk_load(sorted(zip(distances[:, column].tolist(), ids)))
+			vantageDB.close()
+		pivotTableDB = DB.connect(pivot_table_file_name, engine='bplus')
+		pivotTableDB.bulk_load(sorted((ID, row.astype('<f4').tobytes()) for ID, row in zip(ids, distances)))
+		pivotTableDB.close()
+
+	def tearDown(self):
+		shutil.rmtree(DB.BASE_PATH)
+		DB.BASE_PATH = self.basePath
+
+	def randomSeries(self, n):
+		return {'ts%d' % (len(self.series) + i): tsmaker(random.uniform(0,1), random.uniform(0.05,0.5), random.uniform(0,1))
+			for i in range(n)}
+
+	def distances(self, vantageID, ids):
+		return kernel_dist_many(self.series[vantageID], np.array([self.series[ID].valuesseq for ID in ids]))
+
+	def insert(self, n):
+		for key, ts in self.randomSeries(n).items():
+			self.series[key] = ts
+			self.fsm.store(timeSeries=ts, key=key)
+			add_timeseries(self.fsm, ts, key)
+
+	def assertConsistent(self):
+		# Every file has every time series, with its distance to the vantage points of the current index
+		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+		ids = timeseriesIndexDB.get("timeseries_ids").split(',')
+		self.assertEqual(int(timeseriesIndexDB.get("number_of_timeseries")), len(ids))
+		timeseriesIndexDB.close()
+		self.assertEqual(sorted(ids), sorted(self.series))
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		entries = dict(vantageIndexDB.range())
+		vantageIndexDB.close()
+		vantageIDs = [entries[str(label)] for label in range(4)]
+		pivotTableName = entries.get("pivot_table", pivot_table_file_name)
+		pivotTableDB = DB.connect(pivotTableName)
+		rows = {ID: np.frombuffer(bytes(row), dtype='<f4') for ID, row in pivotTableDB.range()}
+		pivotTableDB.close()
+		self.assertEqual(sorted(rows), sorted(ids))
+		for label, vantageID in enumerate(vantageIDs):
+			expected = dict(zip(ids, self.distances(vantageID, ids).tolist()))
+			self.assertTrue(np.allclose([rows[ID][label] for ID in ids], [expected[ID] for ID in ids], atol=1e-5))
+			vantageDB = DB.connect('db_vantagepoint_' + vantageID + '.dbdb')
+			stored = list(vantageDB.range())
+			vantageDB.close()
+			# Equal distances share a key, so a tree may hold fewer pairs
+			self.assertTrue(all(np.isclose(distance, expected[ID]) for distance, ID in stored))
+			self.assertEqual(len(stored), len(set(expected.values())))
+		# And there is no file left over from a replacement
+		expectedFiles = set(['db_vantagepoint_' + vantageID + '.dbdb' for vantageID in vantageIDs] +
+			[vantage_index_file_name, timeseries_index_file_name, pivotTableName])
+		indexFiles = set(name for name in os.listdir(DB.BASE_PATH) if not name.startswith('ts_'))
+		self.assertEqual(indexFiles, expectedFiles)
+		return entries
+
+	def test_add_timeseries(self):
+		self.insert(3)
+		self.assertConsistent()
+
+	def test_replace(self):
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		oldVantageID = vantageIndexDB.get("2")
+		vantageIndexDB.close()
+		newVantageID = replace_vantage_point(2, self.fsm)
+		entries = self.assertConsistent()
+		self.assertEqual(entries["2"], newVantageID)
+		self.assertNotEqual(newVantageID, oldVantageID)
+		self.assertEqual(entries["generation"], "1")
+		self.assertEqual(entries["pivot_table"], "db_pivottable_1.dbdb")
+		replace_vantage_point(None, self.fsm)
+		self.assertEqual(self.assertConsistent()["pivot_table"], "db_pivottable_2.dbdb")
+
+	def test_replace_catches_up(self):
+		# Time series inserted while the new tree is built are added to it before the swap
+		replacement = VantageIndex._buildReplacement(1, self.fsm)
+		self.insert(5)
+		VantageIndex._swapReplacement(replacement, self.fsm)
+		self.assertEqual(self.assertConsistent()["1"], replacement['newVantageID'])
+
+	def test_replace_concurrent_inserts(self):
+		errors = []
+		def replace():
+			try:
+				for i in range(3):
+					replace_vantage_point(None, FileStorageManager(features=kernel_features))
+			except Exception as e:
+				errors.append(e)
+		thread = threading.Thread(target=replace)
+		thread.start()
+		self.insert(20)
+		thread.join()
+		self.assertEqual(errors, [])
+		self.assertEqual(self.assertConsistent()["generation"], "3")
+
+	def test_failed_replacement(self):
+		# The swap fails, so the files written for the new vantage point are removed, and the failure is logged
+		rename = DB.rename
+		def failingRename(dbname, newname):
+			raise OSError('disk full')
+		DB.rename = failingRename
+		try:
+			with self.assertLogs(VantageIndex.log, 'ERROR') as logs:
+				VantageIndex._replaceInBackground()
+		finally:
+			DB.rename = rename
+		self.assertIn('Replacing a vantage point failed', logs.output[0])
+		self.assertIn('disk full', logs.output[0])
+		self.assertNotIn("generation", self.assertConsistent())
+
+	def test_start_replacement(self):
+		start_vantage_point_replacement()
+		VantageIndex._replacement.join()
+		self.assertEqual(self.assertConsistent()["generation"], "1")
+
+if __name__ == '__main__':
+	unittest.main()
@@ -142,7 +142,8 @@ def _getClosestTimeSeries_from_socket_server(k_closest, ts_or_id, timeseriesID=N
 		log.info('Cannot connect to the server. IP address provided or port number might be wrong or host is not up.\n')
 		raise ValueError('Issue with socket server')
 
-	ts_to_json_LengthBinary = _binaryLength32(len(ts_json))
+	# The server reads the value by its length in bytes, which is more than its length in characters for non-ASCII json
+	ts_to_json_LengthBinary = _binaryLength32(len(Serialize().jsonstring_to_bytes(ts_json)))
 	k_closest_LengthBinary = _binaryLength32(int(k_closest))
 
     # Format sent to server is:
@@ -157,7 +158,7 @@ def _getClosestTimeSeries_from_socket_server(k_closest, ts_or_id, timeseriesID=N
 	else:
 		print("Sending TimeSeries to server")
 
-	s.send(Serialize().jsonstring_to_bytes(sendTsOrIdToServer))
+	s.sendall(Serialize().jsonstring_to_bytes(sendTsOrIdToServer))
 	print("Data is encoded as: %s\n" % (bytes(sendTsOrIdToServer, encoding='utf-8')))
 
 	while True:
@@ -169,8 +170,13 @@ def _getClosestTimeSeries_from_socket_server(k_closest, ts_or_id, timeseriesID=N
 		for incomingSocket in sockets:
 			if incomingSocket == s:
 				log.info("Got a response from server.\n")
-				closestTimeseriesBuffer = incomingSocket.recv(BUFFERSIZE)
-				closestTimeseriesBuffer = closestTimeseriesBuffer.decode()
+				# The server closes the connection once the whole reply is sent
+				chunks = []
+				chunk = incomingSocket.recv(BUFFERSIZE)
+				while chunk:
+					chunks.append(chunk)
+					chunk = incomingSocket.recv(BUFFERSIZE)
+				closestTimeseriesBuffer = b''.join(chunks).decode()
 				# Converts buffer to JSON string
 				closestTimeseriesString = str(closestTimeseriesBuffer).replace("'", '"')
 				s.shutdown(socket.SHUT_RDWR)
@@ -3,7 +3,13 @@ import random
 import os
 import numpy as np
 import sys
-from _corr import kernel_dist
+import tempfile
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from _corr import kernel_dist_many, kernel_spectra, kernel_dist_spectra, kernel_features
+from VPTree import VPTree
+from PivotTable import PivotTable
 import requests
 import pprint
 sys.path.append('../../MS1')
@@ -23,10 +29,86 @@ def FindTimeSeriesByKey(key):
 	return ts
 
 # py.test --doctest-modules  --cov --cov-report term-missing Distance_from_known_ts.py
-def Simsearch(inputTS, k, id_or_ts):
-	num_vantage_points = 20 # NOTE: Remember to change this number in flaskr.py too!
+num_vantage_points = 20 # the API server reads the vantage points from the index, whatever their number
+vantage_index_file_name = "db_vantageindex.dbdb"
+timeseries_index_file_name = "db_timeseriesindex.dbdb"
+vptree_file_name = "db_vptree.dbdb"
+pivot_table_file_name = "db_pivottable.dbdb" # NOTE: the API server (VantageIndex.py) adds rows to it
+recall_curve_file_name = "db_recallcurve.dbdb"
+default_max_candidates = 100 # budget of approximate_search for a target_recall, until its k is calibrated
+
+log = logging.getLogger(__name__)
+
+def _distancesToVantages(block, vantageSpectra):
+	"""
+	Private helper function that returns the distances from the rows of block to the vantage points, one column
+	per vantage point.
+	"""
+	return _spectraDistancesToVantages(kernel_spectra(block), block.shape[1], vantageSpectra)
+
+def _spectraDistancesToVantages(spectra, length, vantageSpectra):
+	"""
+	Private helper function that returns the distances from time series of the given length, from their spectra,
+	to the vantage points, one column per vantage point.
+	"""
+	return np.column_stack([kernel_dist_spectra((vantageSpectra[0][[j]], vantageSpectra[1][[j]]), spectra, length)
+		for j in range(len(vantageSpectra[1]))]).reshape(len(spectra[1]), len(vantageSpectra[1]))
+
+def _vantageDistancesBlock(path, shape, vantageSpectra, start, stop):
+	"""
+	Private helper function run by the workers of vantage_distance_matrix, on the rows start to stop of the
+	matrix mapped from path.
+	"""
+	matrix = np.memmap(path, dtype=np.float64, mode='r', shape=shape)
+	return _distancesToVantages(np.array(matrix[start:stop]), vantageSpectra)
+
+def vantage_distance_matrix(values, vantageIndexes, workers=None, blockRows=None):
+	"""
+	Calculates the distance from every time series to every vantage point. Blocks of rows are spread over a pool
+	of processes, which map the matrix of values from a file in shared memory rather than receiving a copy of it.
+
+	Parameters
+	----------
+	values: Values of the time series, one row per time series, all of the same length
+	vantageIndexes: Rows of the vantage points
+	workers: Number of processes, the number of cores if None. With 1, everything runs in this process.
+	blockRows: Number of rows per task, about a quarter of the rows of a worker if None
+
+	Returns
+	-------
+	Array with a row per time series and a column per vantage point
+	"""
+	values = np.ascontiguousarray(values, dtype=np.float64)
+	vantageSpectra = kernel_spectra(values[list(vantageIndexes)])
+	n = len(values)
+	if workers is None:
+		workers = os.cpu_count() or 1
+	if blockRows is None:
+		blockRows = max(1, -(-n // (workers * 4)))
+	blocks = [(start, min(start + blockRows, n)) for start in range(0, n, blockRows)]
+	if not blocks:
+		return np.zeros((0, len(vantageIndexes)))
+	if workers <= 1 or len(blocks) == 1:
+		return np.vstack([_distancesToVantages(values[start:stop], vantageSpectra) for (start, stop) in blocks])
+
+	# /dev/shm is memory, so the workers read the rows the parent wrote without going to disk
+	directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+	with tempfile.NamedTemporaryFile(dir=directory, suffix='.dat') as sharedFile:
+		shared = np.memmap(sharedFile.name, dtype=np.float64, mode='w+', shape=values.shape)
+		shared[:] = values
+		shared.flush()
+		del shared
+		with ProcessPoolExecutor(max_workers=min(workers, len(blocks))) as pool:
+			futures = [pool.submit(_vantageDistancesBlock, sharedFile.name, values.shape, vantageSpectra, start, stop)
+				for (start, stop) in blocks]
+			return np.vstack([future.result() for future in futures])
+
+def BuildDatabases(fsm):
+	"""
+	Fills the databases with 1000 random time series and builds the vantage point trees, the pivot table
+	and the VP-tree over them, unless the vantage point index is already on disk.
+	"""
 	num_of_timeseries = 1000
-	num_top = k
 	def tsmaker(m, s, j):
 		'''
 		Creates a random time series of 100 elements
@@ -48,31 +130,25 @@ def Simsearch(inputTS, k, id_or_ts):
 		v = norm.pdf(t, m, s) + j*np.random.randn(100)
 		return TimeSeries(values=v,times=t)
 
-	# Check if we have cached by verifying the existence of this file
-	vantage_index_file_name = "db_vantageindex.dbdb"
-	fsm = FileStorageManager()
-
 	# Initialization code to generate 1000 TimeSeries, sample 20 vantage points, and store all of them in the right places
 	try:
 		vantageDB = DB.connect(vantage_index_file_name)
 		vantageDB.get("0")
 		#print("Vantage points already initialized")
-		
+		_convertStringKeyTrees(vantageDB)
+		vantageDB.close()
+
 	except KeyError:
 		# Have to delete file that is created in the try block above or this will cause the connect in Step 2 to crash
 		DB.remove(vantage_index_file_name)
 		
 		print('Not stored in disk, calculate distances')
 
-		# 1000 TimeSeries IDs in memory that will be populated by Step 1
-		all1000IDs = []
-		# Step 1: Generation of 1000 time series
-		for i in range(num_of_timeseries):
-			ts=tsmaker(4,2,8)
-
-			# Store this time series in FSM
-			tsID = fsm.store(timeSeries = ts)
+		# Step 1: Generation of 1000 time series, all stored in FSM in one batch
+		all1000TS = [tsmaker(4,2,8) for i in range(num_of_timeseries)]
+		all1000IDs = fsm.store_many(all1000TS)
 
+		for ts, tsID in zip(all1000TS, all1000IDs):
 			# Send the time series over to API Server to update metadata
 			# First convert time series object to time series JSON
 			timeseriesJSON = {}
@@ -84,99 +160,743 @@ def Simsearch(inputTS, k, id_or_ts):
 			if response.status_code not in [200, 201]:
 				raise ValueError('Failed to store one out of 1000 time series metadata in PostgreSQL')
 
-			# Append the ID to the list and keep going
-			all1000IDs.append(str(tsID))
-
-		# Step 2: Generate 20 random indices as vantage point id's, and store them in a .txt file as an Index
+		# Step 2: Generate 20 random indices as vantage point id's, and write all the indexes over them
+		all1000Values = np.array([ts.valuesseq for ts in all1000TS])
 		vantage_point_indexes = random.sample(range(num_of_timeseries), num_vantage_points)
-		vantageIndexDB = DB.connect(vantage_index_file_name)
-		vantageLabel = 0
-		for i in vantage_point_indexes:
-			vantageID = all1000IDs[i]
-			vantageIndexDB.set(str(vantageLabel), vantageID)
-			vantageLabel += 1
-		vantageIndexDB.commit()
-
-		# Step 3: Generate 20 red black trees, each containing 1000 nodes of distances to vantage point
-		# Filename will be db_vantagepoint_<vantageid>
-		for i in vantage_point_indexes:
-			# For each vantage point do the following:
-
-			vantageID = all1000IDs[i]
-			print('Working on vantage point with id: ', vantageID)
-
-			vantage_file_name='db_vantagepoint_'+ vantageID + '.dbdb'
-			vantageDB=DB.connect(vantage_file_name)
-			vantageTS = fsm.get(vantageID)
-
-			for j in range(num_of_timeseries):
-				# For each timeseries, calculate the distance to this vantage point and append it to RBT: 
-
-				otherID = all1000IDs[j]
-				otherTS = fsm.get(otherID)
-				distance_bw = kernel_dist(otherTS, vantageTS)
-				vantageDB.set(str(distance_bw), otherID)
-
-			# Note: We commit after setting all 1000 distances so we make it more efficient
-			vantageDB.commit()	
-
-		# Step 4: Store indexes of the 1000 Time series generated so we can reference them later
-		timeseries_index_file_name = "db_timeseriesindex.dbdb"
+		write_indexes(all1000IDs, all1000Values, vantage_point_indexes)
+
+def write_indexes(ids, values, vantage_point_indexes):
+	"""
+	Writes the vantage point index, the vantage point trees, the time series index, the pivot table and the
+	VP-tree over time series that are already stored.
+
+	Parameters
+	----------
+	ids: Ids of the stored time series
+	values: Values of the time series, one row per id
+	vantage_point_indexes: Rows of the time series to take as vantage points
+
+	Returns
+	-------
+	None
+	"""
+	vantageIndexDB = DB.connect(vantage_index_file_name)
+	vantageLabel = 0
+	for i in vantage_point_indexes:
+		vantageID = ids[i]
+		vantageIndexDB.set(str(vantageLabel), vantageID)
+		vantageLabel += 1
+	vantageIndexDB.commit()
+	vantageIndexDB.close()
+
+	# Step 3: Generate 20 red black trees, each containing 1000 nodes of distances to vantage point
+	# Filename will be db_vantagepoint_<vantageid>
+	# All the distances are calculated first, spread over the cores, and the trees are then written one by one
+	pivotDistances = vantage_distance_matrix(values, vantage_point_indexes)
+	for column, i in enumerate(vantage_point_indexes):
+		# For each vantage point do the following:
+
+		vantageID = ids[i]
+		print('Working on vantage point with id: ', vantageID)
+
+		vantage_file_name='db_vantagepoint_'+ vantageID + '.dbdb'
+		# The tree is rebuilt from scratch, so start from a new file in case an old one is lying around
+		try:
+			DB.remove(vantage_file_name)
+		except OSError:
+			pass
+		vantageDB=DB.connect(vantage_file_name, engine='bplus')
+
+		# The distance from every timeseries to this vantage point
+		distances = pivotDistances[:, column]
+		distance_to_ID = dict(zip(distances.tolist(), ids))
+
+		# Note: We build the B+tree in one go from the sorted distances, which is much faster than 1000 sets
+		vantageDB.bulk_load(sorted(distance_to_ID.items()))
+		vantageDB.close()
+
+	# Step 4: Store indexes of the 1000 Time series generated so we can reference them later
+	timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+	# Store number of time series stored
+	timeseriesIndexDB.set("number_of_timeseries", str(len(ids)))
+	# Store all the ids in one long list to minimize I/O - it's more efficient that way
+	timeseriesIndexDB.set("timeseries_ids", ','.join(ids)) # Encode time series IDs into a comma-separated String
+	timeseriesIndexDB.commit()
+	timeseriesIndexDB.close()
+
+	# Step 5: Keep all the distances to the vantage points in one table, for exact searches (see PivotTable)
+	PivotTable(ids, pivotDistances).save(pivot_table_file_name)
+
+	# Step 6: Build a VP-tree over all the time series, for exact searches (see VPTree)
+	VPTree.build(ids, values).save(vptree_file_name)
+
+def _convertStringKeyTrees(vantageIndexDB):
+	"""
+	Private helper that rewrites the vantage point trees written before numeric keys were supported, whose
+	distances are string keys that can not be compared with the float distances of queries and inserts.
+	"""
+	vantageIDs = [vantageID for (label, vantageID) in vantageIndexDB.range() if label.isdigit()]
+	for vantageID in vantageIDs:
+		vantage_file_name = 'db_vantagepoint_' + vantageID + '.dbdb'
+		if not DB.exists(vantage_file_name):
+			continue
+		vantageDB = DB.connect(vantage_file_name)
+		first = next(iter(vantageDB.range(limit=1)), None)
+		vantageDB.close()
+		if first is not None and isinstance(first[0], str):
+			log.info('Converting the keys of %s to numbers', vantage_file_name)
+			DB.convert_keys(vantage_file_name)
+
+def _nearestInTree(vantageDB, distance):
+	"""
+	Private helper generator that yields the ids of a vantage tree by increasing difference between their
+	distance to the vantage point, which is their key, and distance. It reads the tree outwards from distance.
+	"""
+	above = iter(vantageDB.range(lo=distance))
+	below = iter(vantageDB.range(hi=distance, reverse=True))
+	nextAbove = next(above, None)
+	nextBelow = next(below, None)
+	if nextAbove is not None and nextBelow is not None and nextAbove[0] == nextBelow[0]:
+		# A key equal to distance is in both directions
+		nextBelow = next(below, None)
+	while nextAbove is not None or nextBelow is not None:
+		if nextBelow is None or (nextAbove is not None and nextAbove[0] - distance <= distance - nextBelow[0]):
+			yield nextAbove[1]
+			nextAbove = next(above, None)
+		else:
+			yield nextBelow[1]
+			nextBelow = next(below, None)
+
+class SimilarityIndex:
+	"""
+	Long-lived index over the vantage point databases, meant to be built once per server process.
+	It keeps the vantage point ids, their spectra (see kernel_features) and open handles on their trees in
+	memory, so a search only transforms the input time series and walks one tree.
+	The trees pick up time series added by other processes on their own, as their root is read again on
+	every search. If the vantage points are regenerated, which replaces the index and tree files, the index
+	is loaded again on the next search.
+	The features of all the stored time series are kept in memory too, and only the ones of time series added
+	to the time series index since the last search are read.
+	If a VP-tree is on disk, searches use it instead and return the exact k closest time series. It is loaded
+	from the features in memory, and the time series added since it was built are inserted into it, on load
+	and as they are added.
+	Otherwise the pivot table gives the exact k closest time series, computing the distances of only the time
+	series that the distances to the vantage points do not rule out. It is kept in memory along with the
+	spectra, and the rows of added time series are computed from their features.
+	approximate_search trades recall for a fixed number of distance computations instead.
+	"""
+
+	def __init__(self, fsm=None, build=False):
+		"""
+		Initializes the index and loads the vantage points.
+
+		Parameters
+		----------
+		fsm: FileStorageManager holding the time series, created with kernel_features as its features
+			if not given
+		build: If True, build the databases first if they are not on disk yet (see BuildDatabases).
+			Otherwise they must already exist.
+		"""
+		# The spectra used by kernel_dist_many are computed once, when a time series is stored
+		self.fsm = fsm if fsm is not None else FileStorageManager(features=kernel_features)
+		if build:
+			BuildDatabases(self.fsm)
+		self.ids = [] # ids of the stored time series, in the order of the time series index
+		self.features = None # their kernel_features, stacked in the order of ids
+		self.vantageIDs = []
+		self.vantageSpectra = None
+		self.vantageDBs = []
+		self.tree = None
+		self.pivotTable = None
+		self.pivotTableFileName = pivot_table_file_name
+		self.recallCurves = {} # k: [(max_candidates, recall), ...], measured by calibrate and read from disk
+		self.evaluations = 0 # distances computed by the last approximate_search
+		self._rows = {} # row of every id in features
+		self._signature = None
+		self._seriesSignature = None
+		self._treeSignature = None
+		self._curveSignature = None
+		self._calibrations = {} # k: thread calibrating it in the background
+		self.refresh()
+
+	def _indexFileNames(self):
+		"""
+		Private helper function that returns the names of the files that are written again when they change, as
+		opposed to the pivot table and the vantage tree files, which only get new rows until they are replaced.
+		"""
+		return [vantage_index_file_name, vptree_file_name]
+
+	def _treeFileNames(self, vantageIDs):
+		"""
+		Private helper function that returns the names of the vantage tree files.
+		"""
+		return ['db_vantagepoint_' + vantageID + '.dbdb' for vantageID in vantageIDs]
+
+	def _fileNames(self, vantageIDs):
+		"""
+		Private helper function that returns the names of the index files, followed by the pivot table and the
+		vantage tree files.
+		"""
+		return self._indexFileNames() + [self.pivotTableFileName] + self._treeFileNames(vantageIDs)
+
+	def _fileSignature(self, fileName, inPlace=True):
+		"""
+		Private helper function that identifies a file on disk, or returns None if it is missing: a file that is
+		replaced gets a new inode, and a file that is written in place also changes size and time.
+		"""
+		try:
+			stat = os.stat(DB.path(fileName))
+		except OSError:
+			return None
+		return (stat.st_dev, stat.st_ino) + ((stat.st_size, stat.st_mtime_ns) if inPlace else ())
+
+	def _currentSignature(self, vantageIDs):
+		"""
+		Private helper function that identifies the index files and the vantage tree files on disk.
+		"""
+		fileNames = self._fileNames(vantageIDs)
+		numIndexFiles = len(self._indexFileNames())
+		return tuple(self._fileSignature(fileName, i < numIndexFiles) for i, fileName in enumerate(fileNames))
+
+	def _storedIDs(self):
+		"""
+		Private helper function that returns the ids of the time series index, in order.
+		"""
+		if not DB.exists(timeseries_index_file_name):
+			return []
 		timeseriesIndexDB = DB.connect(timeseries_index_file_name)
-		# Store number of time series stored
-		timeseriesIndexDB.set("number_of_timeseries", "1000")
-		# Store all the ids in one long list to minimize I/O - it's more efficient that way
-		timeseriesIndexDB.set("timeseries_ids", ','.join(all1000IDs)) # Encode time series IDs into a comma-separated String
-		timeseriesIndexDB.commit()
-
-	# At this stage, we have all databases, we can work out the top k similar timeseries to return
-
-	# Step 1: Find closest vantage point
-
-	# First get all 20 vantage time series from the index DB
-	vantageIndexDB = DB.connect(vantage_index_file_name) 
-	vantageTS_all = []
-	vantageID_all = []
-	for i in range(num_vantage_points):
-		vantageID = vantageIndexDB.get(str(i))
-		vantageTS = fsm.get(vantageID)
-		vantageTS_all.append(vantageTS)
-		vantageID_all.append(vantageID)
-
-	# Find the closest vantage ID from the 20
-	vantageID_closest = ""
-	minDistance = sys.maxsize
-	for i in range(len(vantageTS_all)):
-		vantageTS = vantageTS_all[i]
-		vantageID = vantageID_all[i]
-		distanceFromInputTS = kernel_dist(inputTS, vantageTS)
-		if distanceFromInputTS < minDistance:
-			minDistance = distanceFromInputTS
-			vantageID_closest = vantageID
-
-	# Step 2: Calculate 2r distance, and grab all the TimeSeries within 2r distance from RBT
-
-	# Grab the time series IDs and distances that are within 2 * minDistance from closest vantage point
-	radius = 2 * minDistance
-	vantage_file_name = 'db_vantagepoint_' + vantageID_closest + ".dbdb"
-	vantageDB = DB.connect(vantage_file_name)
-	distance_ID_tuples = vantageDB._tree.chop(str(radius))
-
-	# Convert distance id list of tuples to dictionary of ID to distance
-	ID_distance_dict = {}
-	for (distance, ID) in distance_ID_tuples:
-		ID_distance_dict[ID] = distance
-
-	# Sort dictionary of ID to distance based on ascending order of distance
-	top_ID_distance_dict = sorted(ID_distance_dict, key=ID_distance_dict.get, reverse=False)[:num_top]
-	top_TS = []
+		try:
+			num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
+			return timeseriesIndexDB.get("timeseries_ids").split(',')[:num_timeseries]
+		except KeyError:
+			return []
+		finally:
+			timeseriesIndexDB.close()
+
+	def _refreshSeries(self):
+		"""
+		Private helper function that brings the features in memory up to date with the time series index.
+		Time series are only ever added at the end of the index, so only the new ones are read, unless the
+		index was written again from scratch. Returns the ids that were added, or None if all were read again.
+		"""
+		signature = self._fileSignature(timeseries_index_file_name)
+		if self.features is not None and signature == self._seriesSignature:
+			return []
+		ids = self._storedIDs()
+		reload = self.features is None or ids[:len(self.ids)] != self.ids
+		added = ids if reload else ids[len(self.ids):]
+		try:
+			features = self.fsm.get_many_features(added, as_matrix=True) if added else {}
+		except KeyError:
+			# A time series is in the index before its file is written, try again on the next search
+			return []
+		if reload or not self.features:
+			self.features = features
+		elif features:
+			self.features = {name: np.concatenate([values, features[name]]) for name, values in self.features.items()}
+		self.ids = ids
+		self._rows = {ID: row for row, ID in enumerate(ids)}
+		self._seriesSignature = signature
+		return None if reload else added
+
+	def get_many_features(self, ids, as_matrix=False):
+		"""
+		Returns the features of stored time series from memory, as FileStorageManager.get_many_features reads
+		them from their files.
 
-	# Return top ids:
-	if int(id_or_ts) == 0:
-		return top_ID_distance_dict
-	
-	for top_IDs in top_ID_distance_dict:
-		top_TS.append(fsm.get(top_IDs))
+		Parameters
+		----------
+		ids: List of ids
+		as_matrix: If True, stack every feature of all ids into one array, with one row per id.
+			The time series must all be stored.
+
+		Returns
+		-------
+		List of feature dictionaries in the order of ids, with None for ids that are not stored, or a dictionary
+		from feature name to the stacked array if as_matrix is True
+		"""
+		if as_matrix:
+			# The arrays are replaced rather than changed when time series are added, so they can be shared
+			if ids == self.ids:
+				return dict(self.features or {})
+			rows = [self._rows[ID] for ID in ids]
+			return {name: values[rows] for name, values in (self.features or {}).items()}
+		return [None if ID not in self._rows else {name: values[self._rows[ID]] for name, values in self.features.items()}
+			for ID in ids]
+
+	def _loadTree(self):
+		"""
+		Private helper function that loads the VP-tree if it is on disk and is over stored time series, and
+		inserts the time series that were added since it was built.
+		"""
+		if not DB.exists(vptree_file_name):
+			return None
+		# Only the ids are read first, so a tree over other time series is not loaded at all
+		treeIDs = VPTree.stored_ids(vptree_file_name)
+		if any(ID not in self._rows for ID in treeIDs):
+			return None
+		tree = VPTree.load(vptree_file_name, self)
+		inTree = set(treeIDs)
+		added = [ID for ID in self.ids if ID not in inTree]
+		tree.insert_many(added, self.get_many_features(added, as_matrix=True))
+		return tree
+
+	def _vantageDistances(self, ids):
+		"""
+		Private helper function that returns the distances from stored time series to the vantage points, from
+		the features in memory, one row per id.
+		"""
+		features = self.get_many_features(ids, as_matrix=True)
+		return _spectraDistancesToVantages((features['spectrum'], features['norm']), features['stand'].shape[1],
+			self.vantageSpectra)
+
+	def _loadPivotTable(self, vantageIDs):
+		"""
+		Private helper function that loads the pivot table if it is on disk and has the distances to the current
+		vantage points, with its rows in the order of ids and the spectra in memory. The rows of time series whose
+		row was not written yet are computed.
+		"""
+		if not self.ids or not DB.exists(self.pivotTableFileName):
+			return None
+		stored = PivotTable.load(self.pivotTableFileName)
+		if len(stored) and stored.distances.shape[1] != len(vantageIDs):
+			return None
+		rows = dict(zip(stored.ids, stored.distances))
+		missing = [ID for ID in self.ids if ID not in rows]
+		if missing:
+			rows.update(zip(missing, self._vantageDistances(missing)))
+		distances = np.array([rows[ID] for ID in self.ids], dtype=PivotTable.DTYPE)
+		return PivotTable(self.ids, distances, (self.features['spectrum'], self.features['norm']))
+
+	def _appendPivotRows(self, added):
+		"""
+		Private helper function that adds the rows of time series added since the pivot table was loaded,
+		computing them from the features in memory rather than waiting for the API server to write them.
+		"""
+		features = self.get_many_features(added, as_matrix=True)
+		self.pivotTable.append(added, self._vantageDistances(added), (features['spectrum'], features['norm']))
+
+	def refresh(self, force=False):
+		"""
+		Reads the time series added since the last call, and inserts them into the VP-tree. Loads the vantage
+		points again if their files on disk changed since they were loaded.
+
+		Parameters
+		----------
+		force: If True, load the vantage points again anyway
+
+		Returns
+		-------
+		True if the vantage points were loaded again
+		"""
+		self._refreshRecallCurves()
+		added = self._refreshSeries()
+		if added is None:
+			# Time series were replaced rather than added, so the tree has to be loaded again
+			force = True
+			self._treeSignature = None
+		if not force and self._signature == self._currentSignature(self.vantageIDs):
+			if added and self.tree is not None:
+				self.tree.insert_many(added, self.get_many_features(added, as_matrix=True))
+			if added and self.pivotTable is not None:
+				self._appendPivotRows(added)
+			return False
+		tree = self.tree
+		self.close()
+
+		vantageIndexDB = DB.connect(vantage_index_file_name)
+		try:
+			entries = dict(vantageIndexDB.range())
+		finally:
+			vantageIndexDB.close()
+		# Vantage points are stored by label, next to the name of the pivot table once a vantage point was
+		# replaced by the API server
+		labels = sorted((label for label in entries if label.isdigit()), key=int)
+		vantageIDs = [entries[label] for label in labels]
+		self.pivotTableFileName = entries.get("pivot_table", pivot_table_file_name)
+		if not vantageIDs:
+			raise ValueError('There are no vantage points, build the databases first')
+
+		features = self.fsm.get_many_features(vantageIDs, as_matrix=True)
+		self.vantageSpectra = (features['spectrum'], features['norm'])
+		# Trees that are not there yet are being rebuilt by another process, they are opened on a later search
+		self.vantageDBs = [DB.connect(fileName, use_mmap=True) if DB.exists(fileName) else None
+			for fileName in self._treeFileNames(vantageIDs)]
+		# The tree does not depend on the vantage points, so it is only loaded again when its file changed
+		treeSignature = self._fileSignature(vptree_file_name)
+		if tree is not None and treeSignature == self._treeSignature:
+			self.tree = tree
+			if added:
+				self.tree.insert_many(added, self.get_many_features(added, as_matrix=True))
+		else:
+			self.tree = self._loadTree()
+		self._treeSignature = treeSignature
+		self.pivotTable = self._loadPivotTable(vantageIDs)
+		self.vantageIDs = vantageIDs
+		self._signature = self._currentSignature(vantageIDs)
+		if None in self.vantageDBs:
+			self._signature = None
+		return True
+
+	def search(self, inputTS, k, with_series=True):
+		"""
+		Finds the k time series closest to inputTS, closest first. With a VP-tree or a pivot table they are the
+		exact k closest. Otherwise the closest vantage point is found, and its tree gives the time series within
+		twice that distance.
+
+		Parameters
+		----------
+		inputTS: TimeSeries to search for
+		k: Number of time series to return
+		with_series: If False, only look up the ids
+
+		Returns
+		-------
+		Tuple of the list of ids and the list of their time series (None if with_series is False)
+		"""
+		self.refresh()
+
+		if self.tree is not None:
+			topIDs = [ID for (distance, ID) in self.tree.knn(inputTS, k)]
+			return topIDs, (self.fsm.get_many(topIDs) if with_series else None)
+
+		# Find the closest vantage point, with the distances to all of them calculated at once
+		# from their stored spectra, so only the input time series is transformed
+		distancesFromInputTS = kernel_dist_many(inputTS, None, spectra=self.vantageSpectra)
+		if self.pivotTable is not None:
+			topIDs = [ID for (distance, ID) in self.pivotTable.knn(inputTS, distancesFromInputTS, k)]
+			return topIDs, (self.fsm.get_many(topIDs) if with_series else None)
+		closest = int(np.argmin(distancesFromInputTS))
+		radius = 2 * float(distancesFromInputTS[closest])
+
+		# The tree is ordered by distance, so the first k pairs within the radius are the closest ones
+		vantageDB = self.vantageDBs[closest]
+		if vantageDB is None:
+			topIDs = []
+		else:
+			topIDs = [ID for (distance, ID) in vantageDB.range(hi=radius, limit=k)]
+		if not with_series:
+			return topIDs, None
+		return topIDs, self.fsm.get_many(topIDs)
+
+	def approximate_search(self, inputTS, k, max_candidates=None, target_recall=None, probes=3, with_series=True):
+		"""
+		Finds time series close to inputTS, computing at most max_candidates distances besides the ones to the
+		vantage points, so its latency does not depend on the query. The trees of the probes closest vantage
+		points are read in turn, each from the time series whose distance to its vantage point is closest to
+		the input's, as those are the ones the triangle inequality rules out last. The k closest of these
+		candidates and of the vantage points are returned, closest first.
+		The number of distances computed is left in evaluations.
+
+		Parameters
+		----------
+		inputTS: TimeSeries to search for
+		k: Number of time series to return
+		max_candidates: Number of candidates whose distance is computed
+		target_recall: Instead of max_candidates, the fraction of the exact k closest time series to find on
+			average. The smallest max_candidates that reached it is taken from the curve calibrate measured for
+			this k. Until there is one, default_max_candidates is used, and the curve is measured in a background
+			thread, so a search never waits for it.
+		probes: Number of vantage trees to read candidates from
+		with_series: If False, only look up the ids
 
-	return(top_TS)
+		Returns
+		-------
+		Tuple of the list of ids and the list of their time series (None if with_series is False)
+		"""
+		if (max_candidates is None) == (target_recall is None):
+			raise ValueError('Give either max_candidates or target_recall')
+		self.refresh()
+		if target_recall is not None:
+			max_candidates = self._candidatesForRecall(k, target_recall)
+
+		values = inputTS.valuesseq if isinstance(inputTS, TimeSeries) else inputTS
+		querySpectra = kernel_spectra([values])
+		distancesFromInputTS = kernel_dist_spectra(querySpectra, self.vantageSpectra, len(values))
+		self.evaluations = len(self.vantageIDs)
+		results = list(zip(distancesFromInputTS.tolist(), self.vantageIDs))
+
+		# Take candidates from each tree in turn, so that every probed vantage point contributes its best ones
+		closest = np.argsort(distancesFromInputTS, kind='mergesort')[:probes]
+		streams = [_nearestInTree(self.vantageDBs[i], float(distancesFromInputTS[i]))
+			for i in closest if self.vantageDBs[i] is not None]
+		seen = set(self.vantageIDs)
+		candidates = []
+		while streams and len(candidates) < max_candidates:
+			for stream in list(streams):
+				for ID in stream:
+					if ID not in seen:
+						seen.add(ID)
+						candidates.append(ID)
+						break
+				else:
+					streams.remove(stream)
+				if len(candidates) >= max_candidates:
+					break
+
+		if candidates:
+			features = self.get_many_features(candidates, as_matrix=True)
+			distances = kernel_dist_spectra(querySpectra, (features['spectrum'], features['norm']), len(values))
+			self.evaluations += len(candidates)
+			results.extend(zip(distances.tolist(), candidates))
+		topIDs = [ID for (distance, ID) in sorted(results)[:max(k, 0)]]
+		if not with_series:
+			return topIDs, None
+		return topIDs, self.fsm.get_many(topIDs)
+
+	def calibrate(self, k, num_queries=20, budgets=None, probes=3, seed=None):
+		"""
+		Measures the recall of approximate_search against BruteForceSearch, for several max_candidates, and
+		writes the curve to disk, where approximate_search with target_recall reads it in every process.
+		Stored time series are used as queries, each left out of its own results. This runs num_queries
+		searches per budget, so it is meant to be run offline or in the background (see calibrate_recall).
+
+		Parameters
+		----------
+		k: Number of time series searched for
+		num_queries: Number of queries to average the recall over
+		budgets: Values of max_candidates to measure. By default, k times powers of 2 up to the number of
+			time series, which finds every time series.
+		probes: Number of vantage trees to read candidates from
+		seed: Seed of the random pick of queries
+
+		Returns
+		-------
+		List of (max_candidates, recall) tuples, by increasing max_candidates
+		"""
+		self.refresh()
+		# The exact results are computed from the features in memory too
+		exact = BruteForceSearch(self, ids=self.ids)
+		n = len(exact.ids)
+		if budgets is None:
+			budgets = [k * 2 ** i for i in range(n.bit_length()) if k * 2 ** i < n] + [n]
+		queries = np.random.RandomState(seed).choice(n, min(num_queries, n), replace=False)
+		expected = {}
+		for i in queries:
+			queryID = exact.ids[i]
+			expected[i] = [ID for (distance, ID) in exact.knn(exact.matrix[i], k + 1) if ID != queryID][:k]
+		curve = []
+		for budget in sorted(budgets):
+			found = 0
+			for i in queries:
+				queryID = exact.ids[i]
+				topIDs, _ = self.approximate_search(exact.matrix[i], k + 1, max_candidates=budget, probes=probes,
+					with_series=False)
+				found += len(set(expected[i]) & set(ID for ID in topIDs if ID != queryID))
+			curve.append((budget, found / max(k * len(queries), 1)))
+		self._saveRecallCurve(k, curve)
+		self.recallCurves[k] = curve
+		return curve
+
+	def _saveRecallCurve(self, k, curve):
+		"""
+		Private helper function that writes the recall curve of k to disk, as max_candidates:recall pairs.
+		"""
+		curveDB = DB.connect(recall_curve_file_name)
+		try:
+			curveDB.set(str(k), ','.join('%d:%r' % (budget, recall) for budget, recall in curve))
+			curveDB.commit()
+		finally:
+			curveDB.close()
+
+	def _refreshRecallCurves(self):
+		"""
+		Private helper function that reads the recall curves again if their file changed. Curves are kept
+		until then, whatever else changes on disk.
+		"""
+		signature = self._fileSignature(recall_curve_file_name)
+		if signature == self._curveSignature:
+			return
+		curves = {}
+		if signature is not None:
+			curveDB = DB.connect(recall_curve_file_name)
+			try:
+				for k, pairs in curveDB.range():
+					curves[int(k)] = [(int(budget), float(recall)) for budget, recall in
+						(pair.split(':') for pair in pairs.split(','))]
+			finally:
+				curveDB.close()
+		self.recallCurves = curves
+		self._curveSignature = signature
+
+	def _candidatesForRecall(self, k, target_recall):
+		"""
+		Private helper function that returns the smallest max_candidates that reached target_recall in calibrate,
+		or default_max_candidates while k is being calibrated in the background.
+		"""
+		curve = self.recallCurves.get(k)
+		if curve is None:
+			calibration = self._calibrations.get(k)
+			if calibration is None or not calibration.is_alive():
+				# The calibration reads the features from memory, so it measures the time series searched here
+				self._calibrations[k] = threading.Thread(target=_calibrateInBackground, args=(k, self), daemon=True)
+				self._calibrations[k].start()
+			return default_max_candidates
+		for budget, recall in curve:
+			if recall >= target_recall:
+				return budget
+		return curve[-1][0]
+
+	def close(self):
+		"""
+		Closes the open vantage trees.
+		"""
+		for vantageDB in self.vantageDBs:
+			if vantageDB is not None:
+				vantageDB.close()
+		self.vantageDBs = []
+		self.tree = None
+		self.pivotTable = None
+		self._signature = None
+
+class BruteForceSearch:
+	"""
+	Exact search that compares the input time series to every stored time series. It keeps the standardized
+	time series stacked in one matrix, along with their spectra, so a search is one batched inverse transform.
+	It is the reference the other searches are measured against, and is fast enough for a few thousand time series.
+	The time series are loaded again on the next search when the time series index changes.
+	"""
+
+	def __init__(self, fsm=None, ids=None):
+		"""
+		Initializes the search and loads the time series.
+
+		Parameters
+		----------
+		fsm: FileStorageManager holding the time series, created with kernel_features as its features
+			if not given
+		ids: Ids of the time series to search. If not given, all the time series of the time series index,
+			which is then watched for changes.
+		"""
+		self.fsm = fsm if fsm is not None else FileStorageManager(features=kernel_features)
+		self._fixedIDs = ids
+		self.ids = []
+		self.matrix = None
+		self.spectra = None
+		self._signature = None
+		self.refresh()
+
+	def _currentSignature(self):
+		"""
+		Private helper function that identifies the time series index file on disk, or None if it is missing.
+		"""
+		try:
+			stat = os.stat(DB.path(timeseries_index_file_name))
+		except OSError:
+			return None
+		return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+	def refresh(self, force=False):
+		"""
+		Loads the time series again if the time series index changed since they were loaded.
+
+		Parameters
+		----------
+		force: If True, load them again anyway
+
+		Returns
+		-------
+		True if the time series were loaded again
+		"""
+		if self._fixedIDs is not None:
+			if self.matrix is not None and not force:
+				return False
+			ids = list(self._fixedIDs)
+		else:
+			signature = self._currentSignature()
+			if not force and self.matrix is not None and signature == self._signature:
+				return False
+			timeseriesIndexDB = DB.connect(timeseries_index_file_name)
+			try:
+				num_timeseries = int(timeseriesIndexDB.get("number_of_timeseries"))
+				ids = timeseriesIndexDB.get("timeseries_ids").split(',')[:num_timeseries]
+			finally:
+				timeseriesIndexDB.close()
+			self._signature = signature
+		self.matrix = np.ascontiguousarray(self.fsm.get_many_features(ids, as_matrix=True)['stand'], dtype=np.float64)
+		self.spectra = kernel_spectra(self.matrix)
+		self.ids = ids
+		return True
+
+	def knn(self, inputTS, k):
+		"""
+		Returns the k time series closest to inputTS.
 
+		Parameters
+		----------
+		inputTS: TimeSeries or array of values, of the length of the stored time series
+		k: Number of time series to return
+
+		Returns
+		-------
+		List of (distance, id) tuples, closest first
+		"""
+		self.refresh()
+		k = min(k, len(self.ids))
+		if k <= 0:
+			return []
+		values = inputTS.valuesseq if isinstance(inputTS, TimeSeries) else inputTS
+		distances = kernel_dist_spectra(kernel_spectra([values]), self.spectra, self.matrix.shape[1])
+		# Only the k closest need sorting
+		top = np.argpartition(distances, k - 1)[:k]
+		top = top[np.argsort(distances[top], kind='mergesort')]
+		return [(float(distances[i]), self.ids[i]) for i in top]
+
+	def search(self, inputTS, k, with_series=True):
+		"""
+		Finds the exact k time series closest to inputTS, closest first.
+
+		Parameters
+		----------
+		inputTS: TimeSeries to search for
+		k: Number of time series to return
+		with_series: If False, only look up the ids
+
+		Returns
+		-------
+		Tuple of the list of ids and the list of their time series (None if with_series is False)
+		"""
+		topIDs = [ID for (distance, ID) in self.knn(inputTS, k)]
+		if not with_series:
+			return topIDs, None
+		return topIDs, self.fsm.get_many(topIDs)
+
+def calibrate_recall(k, num_queries=20, budgets=None, probes=3, seed=None, fsm=None):
+	"""
+	Measures the recall curve of approximate_search for k (see SimilarityIndex.calibrate) with an index of its
+	own, and writes it to disk for every SimilarityIndex to read. Run it offline, for the k that clients use,
+	so that approximate_search with target_recall has a curve from its first search.
+	fsm is the FileStorageManager of that index (see SimilarityIndex). It can also be a SimilarityIndex, whose
+	features in memory are then shared instead of read again.
+	"""
+	index = SimilarityIndex(fsm)
+	try:
+		return index.calibrate(k, num_queries, budgets, probes, seed)
+	finally:
+		index.close()
+
+def _calibrateInBackground(k, fsm):
+	"""
+	Private helper function run by the background thread that calibrates k for approximate_search.
+	"""
+	try:
+		calibrate_recall(k, fsm=fsm)
+	except Exception:
+		log.exception('Calibrating approximate_search for k=%d failed', k)
+
+def Simsearch(inputTS, k, id_or_ts):
+	"""
+	One-off search for the k time series closest to inputTS, building the databases first if needed.
+	Returns their ids if id_or_ts is 0, and their time series otherwise.
+	Servers should keep a SimilarityIndex instead, which loads the vantage points once.
+	"""
+	index = SimilarityIndex(build=True)
+	try:
+		topIDs, topTS = index.search(inputTS, k, with_series=int(id_or_ts) != 0)
+	finally:
+		index.close()
+
+	# Return top ids:
+	if int(id_or_ts) == 0:
+		return topIDs
+	return topTS
@@ -0,0 +1,187 @@
+import sys
+import numpy as np
+from _corr import kernel_spectra, kernel_dist_spectra
+sys.path.append('../../MS1')
+from TimeSeries import TimeSeries
+sys.path.append('../../MS2')
+from DB import DB
+
+class PivotTable:
+	"""
+	Table of the distances from every time series to every vantage point (pivot), for exact k nearest
+	neighbour searches that compute few distances.
+
+	By the triangle inequality, a time series x is at least |d(q, v) - d(x, v)| away from a query q, for
+	every vantage point v. Once the query's distances to the vantage points are known, the table gives that
+	lower bound for every time series in one numpy call. Time series are then compared to the query in the
+	order of their bound, and the search stops as soon as the next bound is past the k-th closest distance.
+	The spectra of the time series (see kernel_spectra) are kept in memory with the table, so that search only
+	indexes them in the order of the bounds.
+
+	On disk, the table is a DB file keyed by time series id, whose values are the distances to the vantage
+	points, in the order of their labels, as little-endian float32 bytes. Adding a time series is a single set.
+	The API server adds rows with the kernel of kernel_features, so only tables with mult=1 are saved.
+	"""
+
+	DTYPE = np.dtype('<f4')
+
+	# Distances are stored as float32, so bounds are lowered by this much to stay below the true distances
+	TOLERANCE = 1e-5
+
+	def __init__(self, ids, distances, spectra=None, mult=1):
+		"""
+		Initializes a table.
+
+		Parameters
+		----------
+		ids: List of the ids of the time series
+		distances: Array with a row per id, and a column per vantage point
+		spectra: kernel_spectra of the time series, in the order of ids, which knn needs
+		mult: Multiplicative constant of the kernel the distances and the spectra were computed with
+		"""
+		self.ids = list(ids)
+		self.distances = np.asarray(distances, dtype=self.DTYPE)
+		if self.ids:
+			self.distances = self.distances.reshape(len(self.ids), -1)
+		self.spectra = spectra
+		self.mult = mult
+		self.evaluations = 0 # distances computed by the last query
+
+	def __len__(self):
+		return len(self.ids)
+
+	def lower_bounds(self, queryDistances):
+		"""
+		Returns a lower bound of the distance from the query to every time series.
+
+		Parameters
+		----------
+		queryDistances: Distances from the query to the vantage points, in the order of the columns
+
+		Returns
+		-------
+		1-D array, in the order of ids
+
+		>>> table = PivotTable(['a', 'b'], [[0, 1], [2, 0.5]])
+		>>> table.lower_bounds([1, 1]).round(3).tolist()
+		[1.0, 1.0]
+		"""
+		if len(self.ids) == 0:
+			return np.zeros(0)
+		bounds = np.abs(self.distances - np.asarray(queryDistances, dtype=float)).max(axis=1)
+		return bounds - self.TOLERANCE
+
+	def append(self, ids, distances, spectra):
+		"""
+		Adds rows to the table, for time series added after it was loaded.
+
+		Parameters
+		----------
+		ids: List of the ids of the time series
+		distances: Array with a row per id, and a column per vantage point
+		spectra: kernel_spectra of the time series, in the order of ids, computed with the mult of the table
+
+		Returns
+		-------
+		None
+
+		>>> table = PivotTable(['a'], [[0, 1]], (np.zeros((1, 3)), np.ones(1)))
+		>>> table.append(['b', 'c'], [[2, 0.5], [1, 1]], (np.zeros((2, 3)), np.ones(2)))
+		>>> table.ids, table.distances.shape, table.spectra[0].shape
+		(['a', 'b', 'c'], (3, 2), (3, 3))
+		"""
+		if len(ids) == 0:
+			return
+		distances = np.asarray(distances, dtype=self.DTYPE).reshape(len(ids), -1)
+		if not self.ids:
+			self.distances = distances
+			self.spectra = spectra
+		else:
+			self.distances = np.vstack([self.distances, distances])
+			self.spectra = (np.concatenate([self.spectra[0], spectra[0]]), np.concatenate([self.spectra[1], spectra[1]]))
+		self.ids.extend(ids)
+
+	def knn(self, query, queryDistances, k, batchSize=32):
+		"""
+		Returns the k time series closest to query, computing the distances of only the time series whose bound
+		does not rule them out.
+
+		Parameters
+		----------
+		query: TimeSeries or array of values
+		queryDistances: Distances from the query to the vantage points, in the order of the columns
+		k: Number of neighbours
+		batchSize: Number of time series compared to the query at once
+
+		Returns
+		-------
+		List of (distance, id) tuples, closest first
+		"""
+		self.evaluations = 0
+		if k <= 0 or len(self.ids) == 0:
+			return []
+		if self.spectra is None:
+			raise ValueError('The table has no spectra to compute distances with')
+		if isinstance(query, TimeSeries):
+			query = query.valuesseq
+		querySpectra = kernel_spectra([query], self.mult)
+		bounds = self.lower_bounds(queryDistances)
+		order = np.argsort(bounds, kind='mergesort')
+		best = []
+		for start in range(0, len(order), batchSize):
+			kth = best[k - 1][0] if len(best) >= k else float('inf')
+			batch = order[start:start + batchSize]
+			batch = batch[bounds[batch] <= kth]
+			if len(batch) == 0:
+				break
+			batchIDs = [self.ids[i] for i in batch]
+			distances = kernel_dist_spectra(querySpectra, (self.spectra[0][batch], self.spectra[1][batch]), len(query),
+				self.mult)
+			self.evaluations += len(batch)
+			best = sorted(best + list(zip(distances.tolist(), batchIDs)))[:k]
+		return best
+
+	def save(self, dbname):
+		"""
+		Writes the table into a new DB file, replacing any file named dbname.
+		Raises ValueError if the table was not computed with mult=1, which the file does not record.
+
+		Parameters
+		----------
+		dbname: Name of the DB file
+
+		Returns
+		-------
+		None
+		"""
+		if self.mult != 1:
+			raise ValueError('Only tables computed with mult=1 can be saved')
+		if DB.exists(dbname):
+			DB.remove(dbname)
+		tableDB = DB.connect(dbname, engine='bplus')
+		try:
+			tableDB.bulk_load(sorted((ID, row.tobytes()) for ID, row in zip(self.ids, self.distances)))
+		finally:
+			tableDB.close()
+
+	@classmethod
+	def load(cls, dbname):
+		"""
+		Reads a table written by save, or to which rows were added with set. It has no spectra, and mult=1.
+
+		Parameters
+		----------
+		dbname: Name of the DB file
+
+		Returns
+		-------
+		PivotTable, with its rows in the order of their ids
+		"""
+		tableDB = DB.connect(dbname)
+		try:
+			rows = list(tableDB.range())
+			ids = [ID for (ID, row) in rows]
+			distances = np.frombuffer(b''.join(bytes(row) for (ID, row) in rows), dtype=cls.DTYPE)
+		finally:
+			tableDB.close()
+		return cls(ids, distances)
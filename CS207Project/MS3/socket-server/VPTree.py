@@ -0,0 +1,404 @@
+import heapq
+import sys
+import numpy as np
+from _corr import kernel_spectra, kernel_dist_spectra, kernel_features
+sys.path.append('../../MS1')
+from TimeSeries import TimeSeries
+sys.path.append('../../MS2')
+from DB import DB
+
+class VPTree:
+	"""
+	Vantage point tree over time series, for exact k nearest neighbour and range queries under kernel_dist.
+
+	Every inner node has a vantage point, which is one of the time series, and the median distance mu from
+	it to the other time series of the node. The ones closer than mu go to the inside subtree, and the others
+	to the outside subtree. By the triangle inequality, a query at distance d from the vantage point can only
+	have neighbours within tau in the inside subtree if d - tau <= mu, and in the outside subtree if
+	d + tau >= mu, so subtrees are skipped without computing any distance to them.
+	Small subtrees are kept as leaf buckets, whose distances are computed with a single numpy call.
+	Time series can be inserted after the tree is built: they go down to a leaf bucket, which is split once
+	it grows past twice the bucket size.
+
+	How much is skipped depends on the data. Time series with few degrees of freedom, such as the same shape
+	at different places and widths with little noise, have distances spread out enough that a query computes
+	a few percent of them. Time series that are mostly noise, such as the ones BuildDatabases generates, are all
+	at about the same distance from each other: no vantage point separates them, and a query computes the
+	distance to every one of them, as BruteForceSearch does in a single batch, only slower.
+
+	The tree only holds the spectra of the time series (see kernel_spectra), not the time series themselves,
+	and only the ids and the shape of the tree are persisted: the spectra are read back from the features
+	stored with the time series (see kernel_features).
+	"""
+
+	# One row per node. Inner nodes have a vantage item, and inside and outside children. Leaves have a
+	# vantage of -1, and their items are leafItems[start:start + count].
+	NODE_DTYPE = np.dtype([('vantage', '<i4'), ('mu', '<f8'), ('inside', '<i4'), ('outside', '<i4'),
+		('start', '<i4'), ('count', '<i4')])
+
+	def __init__(self, ids, spectra, length, nodes, leafItems, mult=1, leafSize=8, seed=None):
+		"""
+		Initializes a tree from its parts. Use build to build one, or load to read one back.
+
+		Parameters
+		----------
+		ids: List of the ids of the time series
+		spectra: kernel_spectra of the time series, in the order of ids
+		length: Length of the time series
+		nodes: Array of NODE_DTYPE, the root first
+		leafItems: Array of the items of the leaves
+		mult: Multiplicative constant of the kernel the spectra were computed with
+		leafSize: Subtrees of at most this many time series are kept as leaf buckets
+		seed: Seed of the random picks of vantage points when leaves are split
+		"""
+		self.ids = list(ids)
+		self.spectra = spectra
+		self.length = length
+		self.mult = mult
+		self.leafSize = leafSize
+		self.evaluations = 0 # distances computed by the last query
+		self._random = np.random.RandomState(seed)
+		# Nodes are kept as tuples, which are much faster than numpy rows to walk in python, and the items of every
+		# leaf as an array of its own, so that an insert only touches one leaf. The start and count of the leaves
+		# are only set in the nodes property.
+		nodes = np.asarray(nodes, dtype=self.NODE_DTYPE)
+		leafItems = np.asarray(leafItems, dtype='<i4')
+		self._nodeList = nodes.tolist()
+		self._leaves = {node: leafItems[start:start + count].copy()
+			for node, (vantage, mu, inside, outside, start, count) in enumerate(self._nodeList) if vantage < 0}
+
+	def __len__(self):
+		return len(self.ids)
+
+	@property
+	def nodes(self):
+		"""
+		Array of NODE_DTYPE, the root first, with the leaves pointing into leafItems.
+		"""
+		return self._flatten()[0]
+
+	@property
+	def leafItems(self):
+		"""
+		Array of the items of all the leaves, in the order of the nodes.
+		"""
+		return self._flatten()[1]
+
+	def _flatten(self):
+		"""
+		Private helper function that returns the nodes and the leaf items as arrays.
+		"""
+		nodes = []
+		leafItems = []
+		for node, (vantage, mu, inside, outside, start, count) in enumerate(self._nodeList):
+			if vantage < 0:
+				items = self._leaves[node]
+				nodes.append((-1, 0.0, -1, -1, len(leafItems), len(items)))
+				leafItems.extend(items.tolist())
+			else:
+				nodes.append((vantage, mu, inside, outside, -1, 0))
+		return np.array(nodes, dtype=self.NODE_DTYPE), np.array(leafItems, dtype='<i4')
+
+	@classmethod
+	def build(cls, ids, matrix, mult=1, leafSize=8, seed=None):
+		"""
+		Builds a tree over time series. Vantage points are picked at random.
+
+		Parameters
+		----------
+		ids: List of the ids of the time series
+		matrix: Values of the time series, one row per id, all of the same length
+		mult: Multiplicative constant in kernel function
+		leafSize: Subtrees of at most this many time series are kept as leaf buckets
+		seed: Seed of the random picks of vantage points
+
+		Returns
+		-------
+		VPTree
+
+		>>> values = np.random.RandomState(0).randn(50, 16)
+		>>> tree = VPTree.build([str(i) for i in range(50)], values, seed=0)
+		>>> len(tree)
+		50
+		>>> tree.knn(values[7], 1)[0][1]
+		'7'
+		"""
+		matrix = np.asarray(matrix, dtype=float)
+		tree = cls(ids, kernel_spectra(matrix, mult), matrix.shape[1], [], [], mult, leafSize, seed)
+		if len(matrix):
+			tree._buildNode(np.arange(len(matrix)))
+		return tree
+
+	def _buildNode(self, items, node=None):
+		"""
+		Private helper function that builds a subtree over items, in place of node or as a new node, and returns
+		its node.
+		"""
+		if node is None:
+			node = len(self._nodeList)
+			self._nodeList.append(None)
+		if len(items) <= self.leafSize:
+			self._nodeList[node] = (-1, 0.0, -1, -1, -1, 0)
+			self._leaves[node] = np.asarray(items, dtype='<i4')
+			return node
+		self._leaves.pop(node, None)
+		pick = self._random.randint(len(items))
+		vantage = items[pick]
+		others = np.delete(items, pick)
+		d = self._itemDistances(vantage, others)
+		# Split at the median: the inside half is no farther than mu, the outside half no closer
+		order = np.argsort(d, kind='mergesort')
+		half = len(order) // 2
+		mu = float(d[order[half]])
+		inside = self._buildNode(others[order[:half]])
+		outside = self._buildNode(others[order[half:]])
+		self._nodeList[node] = (int(vantage), mu, inside, outside, -1, 0)
+		return node
+
+	def _itemDistances(self, vantage, items):
+		"""
+		Private helper function that returns the distances from the item vantage to some items.
+		"""
+		return kernel_dist_spectra((self.spectra[0][[vantage]], self.spectra[1][[vantage]]),
+			(self.spectra[0][items], self.spectra[1][items]), self.length, self.mult)
+
+	def insert_many(self, ids, features):
+		"""
+		Adds time series to the tree. Each one goes down to a leaf, on the side of every vantage point that its
+		distance to the vantage point puts it on, so a search finds it exactly as if the tree had been built with it.
+		A leaf that grows past twice leafSize is split into a subtree.
+
+		Parameters
+		----------
+		ids: List of the ids of the time series
+		features: Dictionary of their kernel_features, stacked in the order of ids, as returned by
+			get_many_features with as_matrix
+
+		Returns
+		-------
+		None
+
+		>>> values = np.random.RandomState(0).randn(50, 16)
+		>>> tree = VPTree.build([str(i) for i in range(40)], values[:40], seed=0)
+		>>> features = [kernel_features(row) for row in values[40:]]
+		>>> tree.insert_many([str(i) for i in range(40, 50)], {name: np.stack([f[name] for f in features]) for name in features[0]})
+		>>> len(tree), tree.knn(values[45], 1)[0][1]
+		(50, '45')
+		"""
+		if len(ids) == 0:
+			return
+		if features['stand'].shape[1] != self.length:
+			raise ValueError('Time series have length %d, the tree holds time series of length %d' %
+				(features['stand'].shape[1], self.length))
+		if self.mult == 1:
+			spectra = (features['spectrum'], features['norm'])
+		else:
+			spectra = kernel_spectra(features['stand'], self.mult)
+		first = len(self.ids)
+		self.ids.extend(ids)
+		self.spectra = (np.concatenate([self.spectra[0], spectra[0]]), np.concatenate([self.spectra[1], spectra[1]]))
+		for item in range(first, len(self.ids)):
+			self._insert(item)
+
+	def _insert(self, item):
+		"""
+		Private helper function that adds item, whose spectrum is already in spectra, to its leaf.
+		"""
+		if not self._nodeList:
+			self._buildNode(np.array([item]))
+			return
+		node = 0
+		while True:
+			vantage, mu, inside, outside, start, count = self._nodeList[node]
+			if vantage < 0:
+				break
+			# Items closer than mu are inside, as the search expects, and the others outside
+			node = inside if float(self._itemDistances(vantage, [item])[0]) < mu else outside
+		items = np.append(self._leaves[node], np.int32(item))
+		if len(items) > 2 * self.leafSize:
+			self._buildNode(items, node)
+		else:
+			self._leaves[node] = items
+
+	def _querySpectra(self, query):
+		"""
+		Private helper function that returns the kernel_spectra of a query time series or array of values.
+		"""
+		if isinstance(query, TimeSeries):
+			query = query.valuesseq
+		if len(query) != self.length:
+			raise ValueError('Query has length %d, the tree holds time series of length %d' % (len(query), self.length))
+		return kernel_spectra([query], self.mult)
+
+	def _distances(self, querySpectra, items):
+		"""
+		Private helper function that returns the distances from the query to some items.
+		"""
+		self.evaluations += len(items)
+		return kernel_dist_spectra(querySpectra, (self.spectra[0][items], self.spectra[1][items]), self.length, self.mult)
+
+	def _search(self, query, k, radius):
+		"""
+		Private helper function that returns the (distance, item) pairs of the at most k items within radius
+		of the query, closest first. k or radius may be None for no bound.
+		"""
+		self.evaluations = 0
+		querySpectra = self._querySpectra(query)
+		best = [] # max heap of (-distance, item) of the best items found so far
+		if k is not None and k <= 0:
+			return []
+
+		def tau():
+			# Distance within which an item must be to make the results
+			if k is not None and len(best) == k:
+				bound = -best[0][0]
+				return bound if radius is None else min(bound, radius)
+			return float('inf') if radius is None else radius
+
+		def consider(distance, item):
+			if radius is not None and distance > radius:
+				return
+			if k is None or len(best) < k:
+				heapq.heappush(best, (-distance, item))
+			elif distance < -best[0][0]:
+				heapq.heapreplace(best, (-distance, item))
+
+		# Stack of (node, gap), where gap is a lower bound of the distance from the query to the node's items
+		stack = [(0, 0.0)] if self._nodeList else []
+		while stack:
+			node, gap = stack.pop()
+			if gap > tau():
+				continue
+			vantage, mu, inside, outside, start, count = self._nodeList[node]
+			if vantage < 0:
+				items = self._leaves[node]
+				if len(items):
+					for distance, item in zip(self._distances(querySpectra, items).tolist(), items.tolist()):
+						consider(distance, item)
+				continue
+			d = float(self._distances(querySpectra, [vantage])[0])
+			consider(d, vantage)
+			# The nearer side is pushed last so it is searched first, which shrinks tau before the other side is popped
+			if d < mu:
+				stack.append((outside, mu - d))
+				stack.append((inside, 0.0))
+			else:
+				stack.append((inside, d - mu))
+				stack.append((outside, 0.0))
+		return sorted((-negDistance, item) for negDistance, item in best)
+
+	def knn(self, query, k):
+		"""
+		Returns the k time series closest to query.
+
+		Parameters
+		----------
+		query: TimeSeries or array of values, of the length of the tree's time series
+		k: Number of neighbours
+
+		Returns
+		-------
+		List of (distance, id) tuples, closest first
+		"""
+		return [(distance, self.ids[item]) for distance, item in self._search(query, k, None)]
+
+	def range(self, query, radius):
+		"""
+		Returns all the time series within radius of query.
+
+		Parameters
+		----------
+		query: TimeSeries or array of values, of the length of the tree's time series
+		radius: Largest distance to return
+
+		Returns
+		-------
+		List of (distance, id) tuples, closest first
+		"""
+		return [(distance, self.ids[item]) for distance, item in self._search(query, None, radius)]
+
+	def save(self, dbname):
+		"""
+		Writes the ids and the shape of the tree into a new DB file, replacing any file named dbname.
+
+		Parameters
+		----------
+		dbname: Name of the DB file
+
+		Returns
+		-------
+		None
+		"""
+		if DB.exists(dbname):
+			DB.remove(dbname)
+		treeDB = DB.connect(dbname)
+		try:
+			treeDB.set("ids", ','.join(self.ids))
+			treeDB.set("length", str(self.length))
+			treeDB.set("mult", repr(self.mult))
+			treeDB.set("leaf_size", str(self.leafSize))
+			nodes, leafItems = self._flatten()
+			treeDB.set("nodes", nodes.tobytes())
+			treeDB.set("leaf_items", leafItems.tobytes())
+			treeDB.commit()
+		finally:
+			treeDB.close()
+
+	@staticmethod
+	def stored_ids(dbname):
+		"""
+		Reads the ids of a tree written by save, without loading it.
+
+		Parameters
+		----------
+		dbname: Name of the DB file
+
+		Returns
+		-------
+		List of the ids
+		"""
+		treeDB = DB.connect(dbname)
+		try:
+			ids = treeDB.get("ids")
+		finally:
+			treeDB.close()
+		return ids.split(',') if ids else []
+
+	@classmethod
+	def load(cls, dbname, fsm):
+		"""
+		Reads a tree written by save. The spectra are read from the features of the time series in fsm.
+
+		Parameters
+		----------
+		dbname: Name of the DB file
+		fsm: FileStorageManager holding the time series, with kernel_features as its features, or anything
+			with its get_many_features, such as a SimilarityIndex, which keeps them in memory
+
+		Returns
+		-------
+		VPTree
+		"""
+		treeDB = DB.connect(dbname)
+		try:
+			ids = treeDB.get("ids")
+			ids = ids.split(',') if ids else []
+			length = int(treeDB.get("length"))
+			mult = float(treeDB.get("mult"))
+			try:
+				leafSize = int(treeDB.get("leaf_size"))
+			except KeyError:
+				# Trees written before inserts were supported
+				leafSize = 8
+			nodes = np.frombuffer(bytes(treeDB.get("nodes")), dtype=cls.NODE_DTYPE)
+			leafItems = np.frombuffer(bytes(treeDB.get("leaf_items")), dtype='<i4')
+		finally:
+			treeDB.close()
+		if not ids:
+			return cls([], kernel_spectra(np.zeros((0, length)), mult), length, nodes, leafItems, mult, leafSize)
+		features = fsm.get_many_features(ids, as_matrix=True)
+		if mult == 1:
+			spectra = (features['spectrum'], features['norm'])
+		else:
+			spectra = kernel_spectra(features['stand'], mult)
+		return cls(ids, spectra, length, nodes, leafItems, mult, leafSize)
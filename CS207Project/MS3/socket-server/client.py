@@ -54,7 +54,8 @@ def Client():
         print( 'Cannot connect to the server. IP address provided or port number might be wrong or host is not up.\n')
         return 3
 
-    ts_to_json_LengthBinary = binaryLength32(len(ts_json))
+    # The length is the one of the encoded value, which is what the server reads
+    ts_to_json_LengthBinary = binaryLength32(len(Serialize().jsonstring_to_bytes(ts_json)))
     k_closest_LengthBinary = binaryLength32(k_closest)
     # Format sent to server is:
     # 0/1: id is 0, ts is 1        [Starts at byte number 1]
@@ -80,8 +81,13 @@ def Client():
 
         for incomingSocket in sockets:
             if incomingSocket == s:
-                buffer = incomingSocket.recv(BUFFERSIZE)
-                buffer = buffer.decode()
+                # The server closes the connection once the whole reply is sent
+                chunks = []
+                chunk = incomingSocket.recv(BUFFERSIZE)
+                while chunk:
+                    chunks.append(chunk)
+                    chunk = incomingSocket.recv(BUFFERSIZE)
+                buffer = b''.join(chunks).decode()
                 sys.stdout.write(str(buffer))
                 s.shutdown(socket.SHUT_RDWR)
                 s.close()
@@ -0,0 +1,81 @@
+import sys
+import random
+import numpy as np
+import pytest
+from _corr import tsmaker, kernel_dist_many, kernel_features
+sys.path.append('../../MS2')
+sys.path.append('../api-server')
+from DB import DB
+from FileStorageManager import FileStorageManager
+
+# Fixtures shared by the tests of the search structures
+
+class FeatureStore:
+	# Stands in for a FileStorageManager created with kernel_features
+	def __init__(self, ids, matrix):
+		self.features = dict(zip(ids, [kernel_features(values) for values in matrix]))
+	def get_many_features(self, ids, as_matrix=False):
+		return {name: np.stack([self.features[ID][name] for ID in ids]) for name in ('stand', 'spectrum', 'norm')}
+
+def randomSeries(n, jitter=None):
+	"""
+	Returns ids '0' to 'n-1', the matrix of the values, and the TimeSeries of n random time series.
+	Their noise is random unless jitter is given.
+	"""
+	series = [tsmaker(random.uniform(0,1), random.uniform(0.05,0.5), random.uniform(0,1) if jitter is None else jitter)
+		for i in range(n)]
+	matrix = np.array([ts.valuesseq for ts in series])
+	ids = [str(i) for i in range(n)]
+	return ids, matrix, series
+
+def bruteForce(query, ids, matrix):
+	"""
+	Returns the (distance, id) tuples of all the time series, closest to query first
+	"""
+	distances = kernel_dist_many(query, matrix)
+	return sorted(zip(distances.tolist(), ids))
+
+@pytest.fixture
+def make_series():
+	return randomSeries
+
+@pytest.fixture
+def feature_store():
+	return FeatureStore
+
+@pytest.fixture
+def brute_force():
+	return bruteForce
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+	# Every DB file, including those of a FileStorageManager, goes to a fresh directory
+	monkeypatch.setattr(DB, 'BASE_PATH', str(tmp_path) + '/')
+	return tmp_path
+
+@pytest.fixture
+def small_index(scratch_db):
+	"""
+	Returns a function that stores n random time series in the scratch directory and writes all the indexes
+	over them, as BuildDatabases does, returning the FileStorageManager, the ids and the matrix of the values
+	"""
+	from Distance_from_known_ts import write_indexes
+	def build(n=200, num_vantage_points=5):
+		ids, matrix, series = randomSeries(n)
+		fsm = FileStorageManager(features=kernel_features)
+		ids = fsm.store_many(dict(zip(ids, series)))
+		write_indexes(ids, matrix, random.sample(range(n), num_vantage_points))
+		return fsm, ids, matrix
+	return build
+
+def insertSeries(fsm, key, ts):
+	"""
+	Stores a time series and adds it to the indexes with the code of the API server, as it does on a POST
+	"""
+	from VantageIndex import add_timeseries
+	fsm.store(timeSeries=ts, key=key)
+	add_timeseries(fsm, ts, key)
+
+@pytest.fixture
+def insert_series(scratch_db):
+	return insertSeries
@@ -1,13 +1,12 @@
 import sys
+import os
 import logging
 import json
-import threading
-import socket
-import select
-import binascii
-import time
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from Distance_from_known_ts import Simsearch
+from Distance_from_known_ts import SimilarityIndex
 from Distance_from_known_ts import FindTimeSeriesByKey
 sys.path.append('../'); 
 from TSDBSerialize import Serialize
@@ -18,19 +17,21 @@ from SizedContainerTimeSeriesInterface import SizedContainerTimeSeriesInterface
 log = logging.getLogger(__name__)
 
 TIMEOUT = 30
-SOCKETS = []
-BUFFERSIZE = 65536  # TODO: Increase??
+HEADER_LENGTH = 65 # ts_or_id, then the length of the value and k_closest in 32 bits each
+TEST_LIFETIME = 5 # seconds a server started in test mode runs for
 ARGUMENTS = 3
 LINE = "============================================================================================"
+INDEX = None # SimilarityIndex of the server process, loaded once
+# Every worker process holds a whole SimilarityIndex in memory (the features of all the time series, the VP-tree
+# and the pivot table), so the number of workers is capped rather than one per core
+MAX_WORKERS = min(4, os.cpu_count() or 1)
 
 def Server():
 	
 	if(len(sys.argv) < ARGUMENTS):
 		print ('You typed in too few arguments.\n Please use the format: python server.py IP_ADDRESS PORT_NUMBER\n')
 		e(2)
-   
-	num_of_client_requests = 0
- 
+
 	# Get port number from input:
 	HOST = sys.argv[1]
 	PORT = int(sys.argv[2])
@@ -38,100 +39,133 @@ def Server():
 	TEST = 0
 	if sys.argv[3]:
 		TEST = int(sys.argv[3])
-	# Set up host socket:
-	hostSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-	hostSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-	
-	# Bind host socket and listen to other sockets:
-	hostSocket.bind((HOST, PORT))
-	hostSocket.listen(True)
-	
-	# Add host server to SOCKETS:
-	SOCKETS.append(hostSocket)
-	
+
+	# First time server is started: Fill the database with dummy data.
+	# The index is closed again, as every worker process loads its own (open files must not be shared across processes)
+	SimilarityIndex(build=True).close()
+
+	# Searches run in worker processes, so that clients are served in parallel and the event loop never blocks.
+	# The workers load their index before the server accepts clients, so no client waits for it
+	executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+	warm_workers(executor, MAX_WORKERS)
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	counter = itertools.count(1)
+
+	def handle_client(reader, writer):
+		return serve_client(reader, writer, loop, executor, counter)
+
+	server = loop.run_until_complete(asyncio.start_server(handle_client, HOST, PORT))
 	print ("A brand new server has fired up using port: " + str(PORT) + "!\n")
 
-	# First time server is started: Fill the database with dummy data:
-	SS = Simsearch(load_ts_file("169975.dat_folded.txt"), 5, 1)
-
-	wait_count = 0
-	# Listen to potential incoming sockets:
-	while True:
-		empty = []
-
-		# Used for testing purposes:
-		if TEST > 0:
-			wait_count += 1        
-		if (TEST > 0 and wait_count == 100000):
-		   e(0)
-
-		# Fetch incoming sockets:
-		incomingSockets,w,err = select.select(SOCKETS,empty,empty,0)
-
-		for incomingSocket in incomingSockets:
-			log.info("Incoming socket")
-			# A new client has initiated a connection:
-			if incomingSocket == hostSocket:
-				d,_ = hostSocket.accept()
-				SOCKETS.append(d)
-
-			# Message from user received:
-			else:
-				try:
-					# Increase number of client requests:
-					num_of_client_requests += 1
-					print("===================================== Client request #%i ==================================" % (num_of_client_requests))
-
-					# Fetch data from the incoming socket:
-					data = incomingSocket.recv(BUFFERSIZE)
-					data = data.decode('utf-8')
-
-					print("Server got an incoming request with data: %s\n" % (data))
-					ts_or_id = data[0]
-					length   = int(data[1:33]) # Length starts at character 1 and ends at 32
-					k_closest   = int(data[33:65], 2) # Length starts at character 33 and ends at 64
-					print(k_closest)
-					ts_bytes    = data[65 : 65 + length]
-					# Store key if id was sent from client:
-					key = ts_bytes
-					ts_bytes = bytes(ts_bytes, encoding='utf-8')
-					
-					# Fetch TS:
-					if int(ts_or_id) == 1:
-						# Convert bytes to json
-						ts_json = Serialize().bytes_to_json(ts_bytes)
-						# Convert json to TimeSeries:
-						ts = Serialize().json_to_ts(ts_json)
-						
-						# Get top 5 ids and timeseries and convert to bytes:
-						top_5_ids_and_ts_bytes = get_top_5_ids_and_ts_as_bytes(ts, k_closest)
-					else:
-						# Fetch from ID:
-						ts_by_id = FindTimeSeriesByKey(key)
-						# If ID is none then we let the client know and close the socket:
-						if ts_by_id is None:
-							id_not_in_database_string = "The id %s is not in the database.\n" % (key)
-							SOCKETS[1].send(bytes(id_not_in_database_string, encoding='utf-8'))
-							SOCKETS.remove(SOCKETS[1])
-							print("Client sent invalid id to server. Connection to client closed.")
-							print(LINE)
-							continue
-
-						# Get top 5 ids and timeseries and convert to bytes:
-						top_5_ids_and_ts_bytes = get_top_5_ids_and_ts_as_bytes(ts_by_id, k_closest)
-
-					print("Sent closest %i timeseries and ids to client" % (k_closest))
-					print(LINE + "\n")
-
-					# If we have a connection then send data to the socket:
-					if SOCKETS[1]:
-						SOCKETS[1].send(top_5_ids_and_ts_bytes)
-
-					# Remove socket from SOCKET list: 
-					SOCKETS.remove(SOCKETS[1])
-
-				except:
-					continue
+	# Used for testing purposes:
+	if TEST > 0:
+		loop.call_later(TEST_LIFETIME, loop.stop)
+
+	try:
+		loop.run_forever()
+	finally:
+		server.close()
+		loop.run_until_complete(server.wait_closed())
+		loop.close()
+		executor.shutdown()
+
+async def serve_client(reader, writer, loop, executor, counter):
+	'''
+	Serves the request of one client connection, with its own reader and writer, and closes the connection.
+
+	Format of a request:
+	0/1: id is 0, ts is 1             [byte 0]
+	length of the id / ts in 32 bits  [bytes 1 to 32, as 0 and 1 characters]
+	k_closest in 32 bits              [bytes 33 to 64, as 0 and 1 characters]
+	value of the id or ts             [the next length bytes]
+	'''
+	try:
+		# Read the whole message, by its declared length, however it is split into packets
+		header = await reader.readexactly(HEADER_LENGTH)
+		ts_or_id = int(header[0:1])
+		length = int(header[1:33], 2)
+		k_closest = int(header[33:65], 2)
+		value = (await reader.readexactly(length)).decode('utf-8')
+
+		num_of_client_request = next(counter)
+		print("===================================== Client request #%i ==================================" % (num_of_client_request))
+		print("Server got an incoming request with data: %s\n" % (header.decode('utf-8') + value))
+
+		reply = await loop.run_in_executor(executor, answer_request, ts_or_id, value, k_closest)
+		writer.write(reply)
+		await writer.drain()
+		print("Sent reply to client request #%i" % (num_of_client_request))
+		print(LINE + "\n")
+	except (asyncio.IncompleteReadError, ValueError, UnicodeDecodeError) as error:
+		log.info("Malformed request: %s", error)
+	except Exception as error:
+		log.exception("Request failed: %s", error)
+	finally:
+		writer.close()
+
+def answer_request(ts_or_id, value, k_closest):
+	'''
+	Answers one request in a worker process, and returns the reply as bytes.
+
+		Parameters
+		----------
+		ts_or_id: 1 if value is a TimeSeries as json, 0 if it is an id
+		value: TimeSeries json or id
+		k_closest: Number of closest TimeSeries to return
+
+		Returns:
+		--------
+		Closest TimeSeries and their Ids as json bytes, or a message if the id is not in the database
+	'''
+	if ts_or_id == 1:
+		# Convert bytes to json, and json to TimeSeries:
+		ts = Serialize().json_to_ts(Serialize().bytes_to_json(bytes(value, encoding='utf-8')))
+	else:
+		# Fetch from ID:
+		ts = FindTimeSeriesByKey(value)
+		# If ID is none then we let the client know:
+		if ts is None:
+			print("Client sent invalid id to server.")
+			return bytes("The id %s is not in the database.\n" % (value), encoding='utf-8')
+
+	# Get top closest ids and timeseries and convert to bytes:
+	return get_top_5_ids_and_ts_as_bytes(ts, k_closest)
+
+def warm_workers(executor, workers):
+	'''
+	Loads the SimilarityIndex in every worker process of executor.
+	A worker that already has its index returns at once, so loading goes on until every worker has answered.
+
+		Parameters
+		----------
+		executor: ProcessPoolExecutor
+		workers: Its number of worker processes
+
+		Returns:
+		--------
+		Set of the process ids of the workers
+	'''
+	pids = set()
+	while len(pids) < workers:
+		pids.update(executor.map(_load_index, range(workers - len(pids))))
+	return pids
+
+def _load_index(i):
+	'''
+	Loads the SimilarityIndex of the worker process running it, and returns the process id.
+	'''
+	similarity_index()
+	return os.getpid()
+
+def similarity_index():
+	'''
+	Returns the SimilarityIndex of the process, building it (and the databases, if needed) on first use.
+	'''
+	global INDEX
+	if INDEX is None:
+		INDEX = SimilarityIndex(build=True)
+	return INDEX
 
 def get_top_5_ids_and_ts_as_bytes(ts, k_closest):
 	'''
@@ -145,9 +179,8 @@ def get_top_5_ids_and_ts_as_bytes(ts, k_closest):
 		--------
 		Closest 5 TimeSeries and their Ids as json bytes
 	'''
-	# Get top 5 closest TimeSeries and ids:
-	top_5_ids = Simsearch(ts, k_closest,0)
-	top_5_ts = Simsearch(ts, k_closest,1)
+	# Get top 5 closest TimeSeries and ids, from a single search:
+	top_5_ids, top_5_ts = similarity_index().search(ts, k_closest)
 
 	# Combine top 5 ids and ts to json:                        
 	top_5_ids_and_ts = Serialize().ids_and_ts_to_json(top_5_ids, top_5_ts)
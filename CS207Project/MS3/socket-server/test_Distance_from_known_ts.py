@@ -0,0 +1,256 @@
+import numpy as np
+from _corr import *
+from Distance_from_known_ts import *
+from Distance_from_known_ts import _nearestInTree, _convertStringKeyTrees
+import Distance_from_known_ts
+import threading
+from DB import DB
+
+def test_brute_force_search(make_series, feature_store):
+	ids, matrix, series = make_series(200)
+	search = BruteForceSearch(feature_store(ids, matrix), ids=ids)
+	assert(search.matrix.shape == (200, 100) and search.matrix.dtype == np.float64)
+	query = tsmaker(0.5, 0.1, 0.5)
+	expected = sorted((kernel_dist(query, ts), ID) for ts, ID in zip(series, ids))[:7]
+	found = search.knn(query, 7)
+	assert([ID for (distance, ID) in found] == [ID for (distance, ID) in expected])
+	assert(np.allclose([distance for (distance, ID) in found], [distance for (distance, ID) in expected]))
+	assert(search.search(query, 7, with_series=False) == ([ID for (distance, ID) in expected], None))
+	assert(search.knn(series[3], 1)[0][1] == '3')
+	assert(len(search.knn(query, 500)) == 200)
+	assert(search.knn(query, 0) == [])
+
+def test_nearest_in_tree():
+	treeDB = DB.connect("test_nearest.dbdb", engine='bplus')
+	try:
+		treeDB.bulk_load([(0.1, 'a'), (0.4, 'b'), (0.5, 'c'), (0.55, 'd'), (0.95, 'e')])
+		assert(list(_nearestInTree(treeDB, 0.5)) == ['c', 'd', 'b', 'a', 'e'])
+		assert(list(_nearestInTree(treeDB, 0.0)) == ['a', 'b', 'c', 'd', 'e'])
+		assert(list(_nearestInTree(treeDB, 2.0)) == ['e', 'd', 'c', 'b', 'a'])
+	finally:
+		treeDB.close()
+		DB.remove("test_nearest.dbdb")
+
+def test_convert_string_key_trees(scratch_db, caplog):
+	# Trees written with string distances get float keys, and the conversion is logged
+	vantageIndexDB = DB.connect(vantage_index_file_name)
+	vantageIndexDB.set("0", "v")
+	vantageIndexDB.commit()
+	treeDB = DB.connect('db_vantagepoint_v.dbdb')
+	for i, ID in enumerate(['a', 'b', 'c']):
+		treeDB.set(str(0.5 * i), ID)
+	treeDB.commit()
+	treeDB.close()
+	with caplog.at_level('INFO', logger=Distance_from_known_ts.log.name):
+		_convertStringKeyTrees(vantageIndexDB)
+	vantageIndexDB.close()
+	treeDB = DB.connect('db_vantagepoint_v.dbdb')
+	assert(list(treeDB.range()) == [(0.0, 'a'), (0.5, 'b'), (1.0, 'c')])
+	treeDB.close()
+	assert([record.getMessage() for record in caplog.records] == ['Converting the keys of db_vantagepoint_v.dbdb to numbers'])
+
+def test_vantage_distance_matrix(make_series):
+	ids, matrix, series = make_series(60)
+	vantages = [3, 10, 42]
+	expected = np.column_stack([kernel_dist_many(matrix[i], matrix) for i in vantages])
+	serial = vantage_distance_matrix(matrix, vantages, workers=1)
+	parallel = vantage_distance_matrix(matrix, vantages, workers=2, blockRows=16)
+	assert(serial.shape == (60, 3))
+	assert(np.allclose(serial, expected))
+	assert(np.allclose(parallel, serial))
+
+def test_similarity_index(small_index, brute_force):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		assert(index.refresh() == False)
+		assert(index.tree is not None and index.pivotTable is not None and None not in index.vantageDBs)
+		query = matrix[11] + 0.05
+		expected = [ID for (distance, ID) in brute_force(query, ids, matrix)[:5]]
+		topIDs, topTS = index.search(query, 5)
+		assert(topIDs == expected)
+		assert([list(ts.valuesseq) for ts in topTS] == [list(matrix[ids.index(ID)]) for ID in topIDs])
+		assert(index.search(query, 5, with_series=False) == (expected, None))
+
+		# A vantage tree replaced by another process is opened again
+		vantage_file_name = 'db_vantagepoint_' + index.vantageIDs[0] + '.dbdb'
+		newDB = DB.connect(vantage_file_name + '.new', engine='bplus')
+		newDB.bulk_load([(0.5, ids[0])])
+		newDB.close()
+		DB.rename(vantage_file_name + '.new', vantage_file_name)
+		assert(index.refresh() == True)
+		assert(list(index.vantageDBs[0].range()) == [(0.5, ids[0])])
+		assert(index.refresh() == False)
+
+		# Without the VP-tree the pivot table gives the same exact results
+		DB.remove(vptree_file_name)
+		assert(index.refresh() == True)
+		assert(index.tree is None)
+		assert(index.search(query, 5, with_series=False) == (expected, None))
+
+		# A missing vantage tree is left as None, and looked for again on every search
+		DB.remove(pivot_table_file_name)
+		DB.remove(vantage_file_name)
+		assert(index.refresh() == True)
+		assert(index.pivotTable is None and index.vantageDBs[0] is None)
+		assert(index.refresh() == True)
+		topIDs, topTS = index.search(query, 5)
+		assert(len(topIDs) == len(topTS) <= 5)
+	finally:
+		index.close()
+
+def test_similarity_index_inserts(small_index, insert_series, brute_force, monkeypatch):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		tree = index.tree
+		assert(len(tree) == 200)
+		query = tsmaker(0.3, 0.2, 0.1).valuesseq
+		newSeries = [tsmaker(0.5, 0.1, 0.05) for i in range(3)] + [TimeSeries(values=query)]
+		for i, ts in enumerate(newSeries):
+			insert_series(fsm, 'new%d' % i, ts)
+		ids = ids + ['new%d' % i for i in range(4)]
+		matrix = np.vstack([matrix] + [ts.valuesseq for ts in newSeries])
+		# Only the new time series are read, and inserted into the tree that is already loaded
+		reads = []
+		getManyFeatures = fsm.get_many_features
+		def countingGetManyFeatures(keys, as_matrix=False):
+			reads.append(list(keys))
+			return getManyFeatures(keys, as_matrix)
+		monkeypatch.setattr(fsm, 'get_many_features', countingGetManyFeatures)
+		topIDs, topTS = index.search(query, 5, with_series=False)
+		assert(reads[0] == ['new0', 'new1', 'new2', 'new3'])
+		assert(index.tree is tree and len(tree) == 204 and index.ids == ids)
+		assert(topIDs[0] == 'new3')
+		assert(topIDs == [ID for (distance, ID) in brute_force(query, ids, matrix)[:5]])
+		# Another process loads the tree from disk and inserts what was added since it was built
+		other = SimilarityIndex(fsm)
+		assert(sorted(other.tree.ids) == sorted(ids))
+		assert(other.search(query, 5, with_series=False) == (topIDs, None))
+		other.close()
+		# A tree over other time series is not loaded
+		VPTree.build(['other'], matrix[:1]).save(vptree_file_name)
+		assert(index.refresh() == True and index.tree is None)
+	finally:
+		index.close()
+
+def test_similarity_index_pivot_table(small_index, insert_series, brute_force, monkeypatch):
+	fsm, ids, matrix = small_index(200, 5)
+	DB.remove(vptree_file_name)
+	# Rows the API server did not write yet are computed
+	stored = PivotTable.load(pivot_table_file_name)
+	rows = dict(zip(stored.ids, stored.distances))
+	del rows[ids[7]]
+	PivotTable(list(rows), list(rows.values())).save(pivot_table_file_name)
+	index = SimilarityIndex(fsm)
+	try:
+		assert(index.tree is None and index.pivotTable.ids == ids)
+		assert(np.allclose(index.pivotTable.distances, [stored.distances[stored.ids.index(ID)] for ID in ids], atol=1e-5))
+		query = tsmaker(0.3, 0.2, 0.1).valuesseq
+		insert_series(fsm, 'new', TimeSeries(values=query))
+		ids = ids + ['new']
+		matrix = np.vstack([matrix, query])
+		# The new row is computed from the features of the new time series, the only ones read from disk
+		reads = []
+		getManyFeatures = fsm.get_many_features
+		def countingGetManyFeatures(keys, as_matrix=False):
+			reads.append(list(keys))
+			return getManyFeatures(keys, as_matrix)
+		monkeypatch.setattr(fsm, 'get_many_features', countingGetManyFeatures)
+		monkeypatch.setattr(PivotTable, 'load', None)
+		topIDs, topTS = index.search(query, 5, with_series=False)
+		assert(reads == [['new']])
+		assert(index.refresh() == False)
+		assert(len(index.pivotTable) == 201 and index.pivotTable.ids[-1] == 'new')
+		assert(topIDs[0] == 'new')
+		assert(topIDs == [ID for (distance, ID) in brute_force(query, ids, matrix)[:5]])
+	finally:
+		index.close()
+
+def test_approximate_search(small_index, brute_force):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		query = tsmaker(0.3, 0.2, 0.1).valuesseq
+		for budget in (1, 20, 60):
+			topIDs, topTS = index.approximate_search(query, 5, max_candidates=budget)
+			# The distances to the 5 vantage points are computed besides the candidates
+			assert(index.evaluations == 5 + budget)
+			assert(len(topIDs) == 5 and [list(ts.valuesseq) for ts in topTS] ==
+				[matrix[ids.index(ID)].tolist() for ID in topIDs])
+			distances = dict((ID, distance) for (distance, ID) in brute_force(query, ids, matrix))
+			assert([distances[ID] for ID in topIDs] == sorted(distances[ID] for ID in topIDs))
+		# With a budget of every time series, the results are exact
+		topIDs, topTS = index.approximate_search(query, 5, max_candidates=1000, with_series=False)
+		assert(index.evaluations == 200 and topTS is None)
+		assert(topIDs == [ID for (distance, ID) in brute_force(query, ids, matrix)[:5]])
+		for arguments in ({}, {'max_candidates': 10, 'target_recall': 0.5}):
+			try:
+				index.approximate_search(query, 5, **arguments)
+				assert(False)
+			except ValueError:
+				pass
+	finally:
+		index.close()
+
+def test_calibrate(small_index):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		curve = index.calibrate(3, num_queries=10, seed=0)
+		assert([budget for (budget, recall) in curve] == [3, 6, 12, 24, 48, 96, 192, 200])
+		assert(all(0 <= recall <= 1 for (budget, recall) in curve) and curve[-1][1] == 1.0)
+		assert(index.recallCurves == {3: curve})
+		query = matrix[0]
+		budget = min(budget for (budget, recall) in curve if recall >= 1.0)
+		index.approximate_search(query, 3, target_recall=1.0)
+		assert(index.evaluations == 5 + min(budget, 195))
+		# The curve is on disk, and kept across reloads
+		assert(index.refresh(force=True) == True and index.recallCurves[3] == curve)
+		other = SimilarityIndex(fsm)
+		assert(other.recallCurves == {3: curve})
+		other.close()
+	finally:
+		index.close()
+
+def test_calibrate_recall_shares_features(small_index, monkeypatch):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		calibrated = []
+		calibrate = SimilarityIndex.calibrate
+		def calibrateOther(other, *arguments):
+			# The index of the calibration holds the very arrays of the index that searches
+			assert(all(other.features[name] is index.features[name] for name in index.features))
+			calibrated.append(other)
+			return calibrate(other, *arguments)
+		monkeypatch.setattr(SimilarityIndex, 'calibrate', calibrateOther)
+		curve = calibrate_recall(3, num_queries=5, seed=0, fsm=index)
+		assert(len(calibrated) == 1 and calibrated[0].fsm is index)
+		assert(calibrate(index, 3, num_queries=5, seed=0) == curve)
+	finally:
+		index.close()
+
+def test_target_recall_without_curve(small_index, monkeypatch):
+	fsm, ids, matrix = small_index(200, 5)
+	index = SimilarityIndex(fsm)
+	try:
+		calibrating = threading.Event()
+		finished = threading.Event()
+		def calibrateRecall(k, fsm=None):
+			# The calibration reads the features of the index that searches
+			assert(fsm is index)
+			calibrating.wait(10)
+			index.calibrate(k, num_queries=5, budgets=[10, 200], seed=0)
+			finished.set()
+		monkeypatch.setattr(Distance_from_known_ts, 'calibrate_recall', calibrateRecall)
+		# The search does not wait for the calibration, which runs in the background
+		index.approximate_search(matrix[0], 5, target_recall=0.9, with_series=False)
+		assert(index.evaluations == 5 + default_max_candidates)
+		assert(index.recallCurves == {} and index._calibrations[5].is_alive())
+		calibrating.set()
+		assert(finished.wait(30))
+		index._calibrations[5].join()
+		assert([budget for (budget, recall) in index.recallCurves[5]] == [10, 200])
+	finally:
+		index.close()
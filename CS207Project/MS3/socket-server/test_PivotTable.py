@@ -0,0 +1,83 @@
+import numpy as np
+import random
+from _corr import *
+from PivotTable import PivotTable
+from DB import DB
+
+def makeTable(make_series, n=300, num_vantage_points=20, mult=1):
+	ids, matrix, series = make_series(n)
+	vantages = random.sample(range(n), num_vantage_points)
+	spectra = kernel_spectra(matrix, mult)
+	distances = np.column_stack([kernel_dist_many(matrix[i], None, mult, spectra=spectra) for i in vantages])
+	return PivotTable(ids, distances, spectra, mult), ids, matrix, matrix[vantages]
+
+def test_lower_bounds(make_series):
+	table, ids, matrix, vantages = makeTable(make_series)
+	query = tsmaker(0.5, 0.1, 0.5)
+	bounds = table.lower_bounds(kernel_dist_many(query, vantages))
+	assert(np.all(bounds <= kernel_dist_many(query, matrix)))
+
+def test_knn(make_series, brute_force):
+	table, ids, matrix, vantages = makeTable(make_series)
+	for j in range(5):
+		query = matrix[j] + 0.05 * np.random.randn(matrix.shape[1])
+		found = table.knn(query, kernel_dist_many(query, vantages), 5)
+		expected = brute_force(query, ids, matrix)[:5]
+		assert([ID for (distance, ID) in found] == [ID for (distance, ID) in expected])
+		assert(np.allclose([distance for (distance, ID) in found], [distance for (distance, ID) in expected]))
+		assert(table.evaluations < len(ids))
+
+def test_knn_mult(make_series):
+	# The query is compared with the kernel the table was computed with
+	table, ids, matrix, vantages = makeTable(make_series, 200, 10, mult=2)
+	query = matrix[3] + 0.05 * np.random.randn(matrix.shape[1])
+	found = table.knn(query, kernel_dist_many(query, vantages, 2), 5)
+	expected = sorted(zip(kernel_dist_many(query, matrix, 2).tolist(), ids))[:5]
+	assert([ID for (distance, ID) in found] == [ID for (distance, ID) in expected])
+	assert(np.allclose([distance for (distance, ID) in found], [distance for (distance, ID) in expected]))
+	try:
+		table.save("test_pivottable.dbdb")
+		assert(False)
+	except ValueError:
+		pass
+	assert(not DB.exists("test_pivottable.dbdb"))
+
+def test_knn_edges(make_series):
+	table, ids, matrix, vantages = makeTable(make_series, 10, 3)
+	query = matrix[0]
+	assert(len(table.knn(query, kernel_dist_many(query, vantages), 20)) == 10)
+	assert(table.knn(query, kernel_dist_many(query, vantages), 0) == [])
+	assert(PivotTable([], []).knn(query, kernel_dist_many(query, vantages), 3) == [])
+	try:
+		PivotTable(ids, table.distances).knn(query, kernel_dist_many(query, vantages), 3)
+		assert(False)
+	except ValueError:
+		pass
+
+def test_append(make_series, brute_force):
+	table, ids, matrix, vantages = makeTable(make_series, 150)
+	appended = PivotTable([], [])
+	for start in range(0, 150, 50):
+		rows = slice(start, start + 50)
+		appended.append(ids[rows], table.distances[rows], (table.spectra[0][rows], table.spectra[1][rows]))
+	assert(appended.ids == ids and np.array_equal(appended.distances, table.distances))
+	query = matrix[140] + 0.05 * np.random.randn(matrix.shape[1])
+	found = appended.knn(query, kernel_dist_many(query, vantages), 5)
+	assert([ID for (distance, ID) in found] == [ID for (distance, ID) in brute_force(query, ids, matrix)[:5]])
+
+def test_save_load(make_series):
+	table, ids, matrix, vantages = makeTable(make_series, 50)
+	table.save("test_pivottable.dbdb")
+	try:
+		# Rows added later, as the API server does on inserts, are read back too
+		tableDB = DB.connect("test_pivottable.dbdb")
+		tableDB.set("new", np.arange(20, dtype='<f4').tobytes())
+		tableDB.commit()
+		tableDB.close()
+		loaded = PivotTable.load("test_pivottable.dbdb")
+	finally:
+		DB.remove("test_pivottable.dbdb")
+	assert(len(loaded) == 51)
+	rows = dict(zip(loaded.ids, loaded.distances.tolist()))
+	assert(rows["new"] == list(range(20)))
+	assert(np.array_equal([rows[ID] for ID in ids], table.distances))
@@ -2,6 +2,9 @@ import unittest
 import sys
 import os
 import subprocess
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from multiprocessing import Process
 
 # py.test --doctest-modules  --cov --cov-report term-missing Server.py test_Server.py
@@ -31,3 +34,89 @@ class serverTest(unittest.TestCase):
 		p1 = subprocess.Popen(["python", "Server.py"] + args)
 		returnValue = 2
 		self.assertTrue(p == returnValue)
+
+# Test cases for serve_client, with an event loop in the test and the search replaced by an echo
+class serveClientTest(unittest.TestCase):
+
+	def setUp(self):
+		import server
+		self.server = server
+		self.answer_request = server.answer_request
+		server.answer_request = lambda ts_or_id, value, k_closest: bytes("%d %s %d" % (ts_or_id, value, k_closest), encoding='utf-8')
+		self.finished = [] # replies, in the order the clients got them
+
+	def tearDown(self):
+		self.server.answer_request = self.answer_request
+
+	def request(self, ts_or_id, value, k_closest):
+		value = bytes(value, encoding='utf-8')
+		return bytes(str(ts_or_id) + '{0:032b}'.format(len(value)) + '{0:032b}'.format(k_closest), encoding='utf-8') + value
+
+	def serve(self, clients):
+		# Runs the clients against a server on a free port, and returns their replies
+		# The loop is driven as in server.py, which runs on Python 3.5
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		counter = itertools.count(1)
+		def handle_client(reader, writer):
+			return self.server.serve_client(reader, writer, loop, None, counter)
+		listener = loop.run_until_complete(asyncio.start_server(handle_client, '127.0.0.1', 0))
+		port = listener.sockets[0].getsockname()[1]
+		try:
+			return loop.run_until_complete(asyncio.wait_for(asyncio.gather(*[client(port) for client in clients]), 10))
+		finally:
+			listener.close()
+			loop.run_until_complete(listener.wait_closed())
+			loop.close()
+			asyncio.set_event_loop(None)
+
+	def client(self, packets, delay=0):
+		async def send(port):
+			reader, writer = await asyncio.open_connection('127.0.0.1', port)
+			for packet in packets:
+				writer.write(packet)
+				await writer.drain()
+				await asyncio.sleep(delay)
+			# Done sending, so a request cut short reaches the end of the stream
+			writer.write_eof()
+			reply = await reader.read()
+			writer.close()
+			self.finished.append(reply)
+			return reply
+		return send
+
+	def test_warm_workers(self):
+		# Workers are forked with an index already loaded, so every worker answers at once
+		index = self.server.INDEX
+		self.server.INDEX = 'index'
+		executor = ProcessPoolExecutor(max_workers=2)
+		try:
+			self.assertEqual(len(self.server.warm_workers(executor, 2)), 2)
+		finally:
+			executor.shutdown()
+			self.server.INDEX = index
+
+	def test_split_request(self):
+		# The header and the value are read in full, wherever the packets end
+		message = self.request(1, '{"times": [0.5], "values": ["é"]}', 5)
+		packets = [message[:10], message[10:40], message[40:70], message[70:]]
+		reply, = self.serve([self.client(packets, delay=0.05)])
+		self.assertEqual(reply.decode('utf-8'), '1 {"times": [0.5], "values": ["é"]} 5')
+
+	def test_concurrent_clients(self):
+		# The first client is slow to send its value, and the second is answered meanwhile; each gets its own reply
+		first = self.request(0, 'ts_1', 3)
+		second = self.request(0, 'ts_2', 7)
+		replies = self.serve([self.client([first[:50], first[50:]], delay=0.2), self.client([second])])
+		self.assertEqual(replies, [b'0 ts_1 3', b'0 ts_2 7'])
+		self.assertEqual(self.finished, [b'0 ts_2 7', b'0 ts_1 3'])
+
+	def test_malformed_header(self):
+		# A header that is not binary, or a request cut short: the connection is closed without a reply, and the server goes on serving
+		with self.assertLogs(self.server.log, 'INFO') as logs:
+			replies = self.serve([self.client([b'x' + self.request(0, 'ts_1', 3)[1:]]),
+				self.client([self.request(0, 'ts_1', 3)[:40]])])
+		self.assertEqual(replies, [b'', b''])
+		self.assertEqual(len(logs.output), 2)
+		self.assertTrue(all('Malformed request' in line for line in logs.output))
+		self.assertEqual(self.serve([self.client([self.request(0, 'ts_2', 2)])]), [b'0 ts_2 2'])
@@ -0,0 +1,109 @@
+import numpy as np
+import random
+from _corr import *
+from VPTree import VPTree
+from DB import DB
+
+def makeTree(make_series, n=300, leafSize=8):
+	ids, matrix, series = make_series(n)
+	return VPTree.build(ids, matrix, leafSize=leafSize, seed=1), ids, matrix
+
+def test_knn(make_series, brute_force):
+	tree, ids, matrix = makeTree(make_series)
+	for j in range(5):
+		query = tsmaker(random.uniform(0,1), random.uniform(0.05,0.5), random.uniform(0,1))
+		expected = brute_force(query, ids, matrix)[:10]
+		found = tree.knn(query, 10)
+		assert([ID for (distance, ID) in found] == [ID for (distance, ID) in expected])
+		assert(np.allclose([distance for (distance, ID) in found], [distance for (distance, ID) in expected]))
+		assert(tree.evaluations <= len(ids))
+
+def test_knn_prunes(make_series):
+	# Identical series are at distance 0 from each other, so the tree walks down to a single leaf
+	tree, ids, matrix = makeTree(make_series, 500)
+	found = tree.knn(matrix[42], 1)
+	assert(found[0][1] == '42' and np.isclose(found[0][0], 0))
+	assert(tree.evaluations < len(ids))
+	# Time series that differ by little more than their mean and width are spread out enough for the
+	# tree to skip most of them
+	ids, matrix, series = make_series(1000, jitter=0.02)
+	tree = VPTree.build(ids, matrix, seed=1)
+	evaluations = 0
+	for j in range(10):
+		tree.knn(tsmaker(random.uniform(0,1), random.uniform(0.05,0.5), 0.02), 5)
+		evaluations += tree.evaluations
+	assert(evaluations < 0.25 * 10 * len(ids))
+
+def test_insert(make_series, feature_store, brute_force):
+	ids, matrix, series = make_series(300)
+	store = feature_store(ids, matrix)
+	tree = VPTree.build(ids[:100], matrix[:100], leafSize=4, seed=1)
+	# Enough inserts for leaves to be split
+	for start in range(100, 300, 50):
+		tree.insert_many(ids[start:start + 50], store.get_many_features(ids[start:start + 50], as_matrix=True))
+	assert(len(tree) == 300 and sorted(tree.leafItems.tolist() + [node['vantage'] for node in tree.nodes
+		if node['vantage'] >= 0]) == list(range(300)))
+	for j in range(5):
+		query = tsmaker(random.uniform(0,1), random.uniform(0.05,0.5), random.uniform(0,1))
+		expected = brute_force(query, ids, matrix)
+		assert([ID for (distance, ID) in tree.knn(query, 10)] == [ID for (distance, ID) in expected[:10]])
+		# Inserted spectra come from kernel_features, so radius is kept clear of float noise at the boundary
+		radius = (expected[30][0] + expected[31][0]) / 2
+		assert([ID for (distance, ID) in tree.range(query, radius)] ==
+			[ID for (distance, ID) in expected if distance <= radius])
+	empty = VPTree.build([], np.zeros((0, 100)))
+	empty.insert_many(ids[:3], store.get_many_features(ids[:3], as_matrix=True))
+	assert(empty.knn(matrix[1], 1)[0][1] == '1')
+	try:
+		tree.insert_many(['short'], {'stand': matrix[:1, :50]})
+		assert(False)
+	except ValueError:
+		pass
+
+def test_knn_edges(make_series):
+	tree, ids, matrix = makeTree(make_series, 5)
+	assert(len(tree.knn(matrix[0], 10)) == 5)
+	assert(tree.knn(matrix[0], 0) == [])
+	empty = VPTree.build([], np.zeros((0, 100)))
+	assert(empty.knn(matrix[0], 3) == [])
+	try:
+		tree.knn(matrix[0][:50], 1)
+		assert(False)
+	except ValueError:
+		pass
+
+def test_range(make_series, brute_force):
+	tree, ids, matrix = makeTree(make_series)
+	query = matrix[7]
+	expected = brute_force(query, ids, matrix)
+	radius = expected[20][0]
+	found = tree.range(query, radius)
+	assert([ID for (distance, ID) in found] == [ID for (distance, ID) in expected if distance <= radius])
+
+def test_save_load(make_series, feature_store):
+	tree, ids, matrix = makeTree(make_series, 100)
+	tree.save("test_vptree.dbdb")
+	try:
+		loaded = VPTree.load("test_vptree.dbdb", feature_store(ids, matrix))
+	finally:
+		DB.remove("test_vptree.dbdb")
+	assert(loaded.ids == ids)
+	assert(np.array_equal(loaded.nodes, tree.nodes))
+	query = matrix[3] + 0.1
+	assert([ID for (distance, ID) in loaded.knn(query, 5)] == [ID for (distance, ID) in tree.knn(query, 5)])
+
+def test_save_load_inserted(make_series, feature_store):
+	ids, matrix, series = make_series(100)
+	store = feature_store(ids, matrix)
+	tree = VPTree.build(ids[:60], matrix[:60], leafSize=4, seed=1)
+	tree.insert_many(ids[60:], store.get_many_features(ids[60:], as_matrix=True))
+	tree.save("test_vptree.dbdb")
+	try:
+		assert(VPTree.stored_ids("test_vptree.dbdb") == ids)
+		loaded = VPTree.load("test_vptree.dbdb", store)
+	finally:
+		DB.remove("test_vptree.dbdb")
+	assert(loaded.leafSize == 4)
+	assert(np.array_equal(loaded.nodes, tree.nodes) and np.array_equal(loaded.leafItems, tree.leafItems))
+	query = matrix[70] + 0.1
+	assert([ID for (distance, ID) in loaded.knn(query, 5)] == [ID for (distance, ID) in tree.knn(query, 5)])
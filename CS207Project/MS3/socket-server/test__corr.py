@@ -24,12 +24,22 @@ def test_kernel_dist():
 	ts2 = stand(tsmaker(1, 0.5, random.uniform(0,10)))
 	assert(kernel_dist(ts1, ts1) == 0)
 
-
-
-
-
-
-
-
-
-
+def test_kernel_dist_many():
+	query = tsmaker(0.5, 0.1, random.uniform(0,10))
+	others = [tsmaker(1, 0.5, random.uniform(0,10)) for i in range(10)] + [query]
+	matrix = np.array([ts.valuesseq for ts in others])
+	distances = kernel_dist_many(query, matrix, 3)
+	assert(distances.shape == (11,))
+	assert(np.allclose(distances, [kernel_dist(query, ts, 3) for ts in others]))
+	assert(np.isclose(distances[-1], 0))
+	# Precomputed spectra give the same distances
+	assert(np.allclose(kernel_dist_many(query, None, 3, spectra=kernel_spectra(matrix, 3)), distances))
+
+def test_kernel_features():
+	query = tsmaker(0.5, 0.1, random.uniform(0,10))
+	others = [tsmaker(1, 0.5, random.uniform(0,10)) for i in range(5)]
+	features = [kernel_features(ts, 3) for ts in others]
+	spectra = (np.array([f['spectrum'] for f in features]), np.array([f['norm'] for f in features]))
+	distances = kernel_dist_many(query, None, 3, spectra=spectra)
+	assert(np.allclose(distances, [kernel_dist(query, ts, 3) for ts in others]))
+	assert(np.allclose(features[0]['stand'], stand(others[0]).valuesseq))
@@ -138,7 +138,7 @@ except KeyError:
 			otherID = all1000IDs[j]
 			otherTS = fsm.get(otherID)
 			distance_bw = kernel_dist(otherTS, vantageTS)
-			vantageDB.set(str(distance_bw), otherID)
+			vantageDB.set(distance_bw, otherID)
 
 		# Note: We commit after setting all 1000 distances so we make it more efficient
 		vantageDB.commit()	
@@ -174,7 +174,7 @@ for i in range(len(vantageTS_all)):
 radius = 2 * minDistance
 vantage_file_name = 'db_vantagepoint_' + vantageID_closest + ".dbdb"
 vantageDB = DB.connect(vantage_file_name)
-distance_ID_tuples = vantageDB._tree.chop(str(radius))
+distance_ID_tuples = vantageDB._tree.chop(radius)
 
 # Convert distance id list of tuples to dictionary of ID to distance
 ID_distance_dict = {}
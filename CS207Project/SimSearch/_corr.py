@@ -197,3 +197,149 @@ def kernel_dist(ts1, ts2, mult=1):
     # When using normalized kernels, dist = sqrt(2(1-C(ts1,ts2)))
     return np.sqrt(2*(1-kernel_corr_val))
 
+
+def stand_many(matrix):
+    '''
+    Standardizes every row of a matrix of time series values at once, using
+    the mean and the standard deviation of the row.
+
+    >>> np.round(stand_many([[1, 2, 3], [0, 10, 20]]), 2)
+    array([[-1.22,  0.  ,  1.22],
+           [-1.22,  0.  ,  1.22]])
+    '''
+    matrix = np.asarray(matrix, dtype=float)
+    return ((matrix - matrix.mean(axis=-1, keepdims=True)) /
+            matrix.std(axis=-1, keepdims=True))
+
+
+def kernel_spectra(matrix, mult=1):
+    '''
+    Precomputes what kernel_dist_many needs to know about a matrix of time
+    series, so that it is done once rather than for every query.
+    Parameters
+    ----------
+    matrix : 2-D array
+        Values of the time series, one row per time series of the same length
+    mult : int
+        Multiplicative constant in kernel function
+    Returns
+    -------
+    spectra, norms : 2-D array, 1-D array
+        The real fft of every standardized row, and the kernel normalization
+        sum(exp(mult * ccor(row, row))) of every row.
+
+    >>> spectra, norms = kernel_spectra([[0, 2, -1, 0.5, 0], [4, 9.8, 7, 2, -0.5]])
+    >>> spectra.shape
+    (2, 3)
+    >>> ts = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
+    >>> bool(np.isclose(norms[0], np.sum(np.exp(ccor(ts, ts)))))
+    True
+    '''
+    stands = stand_many(matrix)
+    length = stands.shape[-1]
+    spectra = nfft.rfft(stands, axis=-1)
+    self_ccor = nfft.irfft(spectra * np.conjugate(spectra), length, axis=-1) / length
+    return spectra, np.sum(np.exp(mult * self_ccor), axis=-1)
+
+
+def kernel_features(ts, mult=1):
+    '''
+    Computes the features of a time series that kernel_dist_many uses, to be
+    stored with the time series (see the features of FileStorageManager).
+    Parameters
+    ----------
+    ts : TimeSeries or 1-D array
+        The time series
+    mult : int
+        Multiplicative constant in kernel function
+    Returns
+    -------
+    dict
+        'stand': the standardized values, 'spectrum': their real fft and
+        'norm': the kernel normalization sum(exp(mult * ccor(ts, ts))).
+        Stacking 'spectrum' and 'norm' over many time series gives the
+        spectra argument of kernel_dist_many.
+
+    >>> ts = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
+    >>> features = kernel_features(ts)
+    >>> bool(np.isclose(features['norm'], np.sum(np.exp(ccor(ts, ts)))))
+    True
+    '''
+    if isinstance(ts, TimeSeries):
+        ts = ts.valuesseq
+    stands = stand_many([ts])
+    spectra, norms = kernel_spectra(stands, mult)
+    return {'stand': stands[0], 'spectrum': spectra[0], 'norm': norms[0]}
+
+
+def kernel_dist_many(query, matrix, mult=1, spectra=None):
+    '''
+    Calculates the kernel_dist distances between one time series and many
+    others at once. The query is standardized and transformed once, and every
+    cross-correlation is computed in a single numpy call.
+    Parameters
+    ----------
+    query : TimeSeries or 1-D array
+        The time series to calculate the distances from
+    matrix : 2-D array
+        Values of the other time series, one row per time series of the same
+        length as the query
+    mult : int
+        Multiplicative constant in kernel function
+    spectra : tuple
+        kernel_spectra(matrix, mult), when it is already known. The matrix is
+        then not looked at.
+    Returns
+    -------
+    1-D array
+        Distance from the query to every row of the matrix
+
+    >>> ts1 = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
+    >>> ts2 = TimeSeries(values=[4, 9.8, 7, 2, -0.5], times=[1, 1.5, 2, 2.5, 10])
+    >>> distances = kernel_dist_many(ts1, [ts1.valuesseq, ts2.valuesseq], 3)
+    >>> [format(d, '.2f') for d in distances] == ['0.00', format(kernel_dist(ts1, ts2, 3), '.2f')]
+    True
+    '''
+    if isinstance(query, TimeSeries):
+        query = query.valuesseq
+    if spectra is None:
+        spectra = kernel_spectra(matrix, mult)
+    return kernel_dist_spectra(kernel_spectra([query], mult), spectra, len(query), mult)
+
+
+def kernel_dist_spectra(query_spectra, spectra, length, mult=1):
+    '''
+    Calculates kernel_dist distances from spectra that are already known,
+    which saves transforming the query again when it is compared many times.
+    Parameters
+    ----------
+    query_spectra : tuple
+        kernel_spectra of the query, with a single row
+    spectra : tuple
+        kernel_spectra of the time series to compare the query to
+    length : int
+        Length of the time series
+    mult : int
+        Multiplicative constant in kernel function, the one of the spectra
+    Returns
+    -------
+    1-D array
+        Distance from the query to every time series of spectra
+
+    >>> ts1 = TimeSeries(values=[0, 2, -1, 0.5, 0], times=[1, 1.5, 2, 2.5, 10])
+    >>> ts2 = TimeSeries(values=[4, 9.8, 7, 2, -0.5], times=[1, 1.5, 2, 2.5, 10])
+    >>> spectra = kernel_spectra([ts1.valuesseq, ts2.valuesseq])
+    >>> distances = kernel_dist_spectra(kernel_spectra([ts2.valuesseq]), spectra, 5)
+    >>> bool(np.allclose(distances, kernel_dist_many(ts2, [ts1.valuesseq, ts2.valuesseq])))
+    True
+    '''
+    query_spectrum, query_norm = query_spectra
+    matrix_spectra, matrix_norms = spectra
+
+    # Row i is ccor(query, matrix[i])
+    cross_correlations = nfft.irfft(query_spectrum * np.conjugate(matrix_spectra), length, axis=-1) / length
+    kernel_corr_vals = (np.sum(np.exp(mult * cross_correlations), axis=-1) /
+                        np.sqrt(query_norm * matrix_norms))
+
+    # Rounding can push the correlation of a time series with itself just above one
+    return np.sqrt(np.maximum(2 * (1 - kernel_corr_vals), 0))